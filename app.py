@@ -1,18 +1,240 @@
 #!/usr/bin/env python
 
-import editor.clips as c
-
-df_clips = c.read_media_data()
-
-videos = [1]
-
-for video_id in videos:
-    clips = c.get_clips(df_clips, video_id)
-    file_names = []
-    for i, row in clips.iterrows():
-        trimmed_file = c.trim_clip(row)
-        file_names.append(trimmed_file)
-    merged_file = c.merge_clips(file_names, video_id)
-    audio_file = c.add_audio(merged_file, video_id)
-    final_file = c.add_intro_outro(audio_file, video_id)
-pass
+import argparse
+import json
+import os
+import sys
+import time
+
+# heavy modules (pandas, the catalog) are imported by the subcommands that
+# need them, quick commands and short lived workers start fast
+COMMANDS = ['render', 'probe', 'validate', 'trim', 'proxy']
+RENDER_MODES = ['steps', 'fused', 'stream', 'preview']
+
+
+def add_video_args(parser: argparse.ArgumentParser, verb: str):
+    parser.add_argument('videos', nargs='*',
+                        help=f'video IDs or ranges to {verb} (e.g. 1 3-5)')
+    parser.add_argument('--all', action='store_true',
+                        help=f'{verb} every VideoId found in clips.csv')
+
+
+def parse_args(args=None) -> argparse.Namespace:
+    args = sys.argv[1:] if args is None else list(args)
+    if args and args[0] not in COMMANDS + ['-h', '--help']:
+        # `app.py 1 3-5` renders, as before subcommands existed
+        args = ['render'] + args
+    parser = argparse.ArgumentParser(description='Cut and merge videos from '
+                                                 'data/clips.csv')
+    commands = parser.add_subparsers(dest='command', required=True)
+    render = commands.add_parser('render', help='render videos')
+    add_video_args(render, 'render')
+    render.add_argument('-j', '--workers', type=int, default=None,
+                        help='number of videos rendered concurrently '
+                             '(default: number of CPUs)')
+    render.add_argument('--trim-workers', type=int, default=None,
+                        help='number of clips trimmed concurrently per video')
+    render.add_argument('--cores', type=int, default=None,
+                        help='cores shared by all ffmpeg processes '
+                             '(default: number of CPUs)')
+    render.add_argument('--mode', choices=RENDER_MODES, default='steps',
+                        help='steps: trim/merge/audio/intro commands with '
+                             'temp files (default), fused: a single ffmpeg '
+                             'command, stream: stages piped without temp '
+                             'files, preview: steps on low resolution '
+                             'proxies, written to data/videos/preview')
+    render.add_argument('--smart-cut', action='store_true',
+                        help='frame accurate trims that only re-encode the '
+                             'partial GOPs at clip edges')
+    render.add_argument('--incremental', action='store_true',
+                        help='reuse outputs whose inputs did not change')
+    render.add_argument('--skip-validation', action='store_true',
+                        help='do not check clips before rendering')
+    render.add_argument('--scratch', metavar='DIR', default=None,
+                        help='folder for intermediates, ideally on a fast '
+                             'volume like /dev/shm; files go in a '
+                             'video-editor subfolder (default: '
+                             'data/videos/temp)')
+    render.add_argument('--scratch-bytes', metavar='SIZE', default=None,
+                        help='budget of the scratch folder, e.g. 8G '
+                             '(default: half its free space)')
+    render.add_argument('--graph', action='store_true',
+                        help='plan all videos as one dependency graph, '
+                             'clips shared by videos are trimmed once')
+    render.add_argument('--dry-run', action='store_true',
+                        help='print the render plan and its cost without '
+                             'running it')
+    render.add_argument('--metrics', metavar='FILE', default=None,
+                        help='write per-stage timings as JSON lines to FILE '
+                             'and print a summary table')
+    probe = commands.add_parser('probe', help='print media info of files')
+    probe.add_argument('files', nargs='+')
+    validate = commands.add_parser('validate', help='check clips.csv')
+    add_video_args(validate, 'check')
+    validate.add_argument('--skip-sources', action='store_true',
+                          help='do not probe source files')
+    trim = commands.add_parser('trim', help='cut one clip from a file')
+    trim.add_argument('f_in')
+    trim.add_argument('f_out')
+    trim.add_argument('t_start', help='HH:MM:SS')
+    trim.add_argument('t_end', help='HH:MM:SS')
+    trim.add_argument('--smart-cut', action='store_true',
+                      help='frame accurate cut that only re-encodes the '
+                           'partial GOPs at the edges')
+    proxy = commands.add_parser('proxy', help='build preview proxies of the '
+                                              'sources of videos')
+    add_video_args(proxy, 'build proxies for')
+    proxy.add_argument('-j', '--workers', type=int, default=None,
+                       help='number of proxies built concurrently')
+    parsed = parser.parse_args(args)
+    if parsed.command == 'render' and not parsed.all and not parsed.videos:
+        render.error('specify video IDs or use --all')
+    if parsed.command == 'render' and (parsed.graph or parsed.dry_run):
+        # the graph plans the steps mode and runs all nodes in one pool
+        if parsed.mode != 'steps':
+            render.error('--graph and --dry-run only support --mode steps')
+        if parsed.trim_workers is not None:
+            render.error('--graph and --dry-run run trims in the pool of '
+                         '-j, --trim-workers does not apply')
+    return parsed
+
+
+def get_video_ids(parsed: argparse.Namespace, catalog) -> list:
+    import editor.batch as b
+
+    if parsed.all or not parsed.videos:
+        return catalog.get_video_ids()
+    return b.parse_video_ids(parsed.videos)
+
+
+def probe(parsed: argparse.Namespace) -> int:
+    import editor.ffmpeg as ff
+
+    for f_path in parsed.files:
+        print(json.dumps(dict(ff.get_media_info(f_path), file=f_path),
+                         indent=2))
+    return 0
+
+
+def validate(parsed: argparse.Namespace) -> int:
+    import editor.catalog as cat
+    import editor.validate as v
+
+    catalog = cat.get_catalog()
+    df_clips = catalog.clips
+    mask = df_clips['VideoId'].isin(get_video_ids(parsed, catalog))
+    df_problems = v.validate_clips(df_clips.loc[mask, :],
+                                   check_sources=not parsed.skip_sources)
+    if df_problems.empty:
+        print('No problems found')
+        return 0
+    print(df_problems.to_string(index=False))
+    print(f'{len(df_problems.index)} problems found')
+    return 1
+
+
+def trim(parsed: argparse.Namespace) -> int:
+    import editor.ffmpeg as ff
+
+    if parsed.smart_cut:
+        import editor.smartcut as sc
+
+        cmds = sc.smart_trim_cmds(parsed.f_in, parsed.f_out, parsed.t_start,
+                                  parsed.t_end)
+        sc.run_smart_trim(cmds, parsed.f_out)
+    else:
+        ff.run_command(ff.trim_video_cmd(parsed.f_in, parsed.f_out,
+                                         parsed.t_start, parsed.t_end))
+    print(parsed.f_out)
+    return 0
+
+
+def build_proxies(parsed: argparse.Namespace) -> int:
+    import editor.catalog as cat
+    import editor.clips as c
+    import editor.proxy as px
+
+    catalog = cat.get_catalog()
+    sources = [f_in for video_id in get_video_ids(parsed, catalog)
+               for f_in, _, _ in c.get_segments(catalog.clips, video_id)]
+    for f_in, f_proxy in px.get_proxies(sources, parsed.workers).items():
+        print(f'{f_in} -> {f_proxy}')
+    return 0
+
+
+def render(parsed: argparse.Namespace) -> int:
+    import editor.batch as b
+    import editor.build as build
+    import editor.catalog as cat
+    import editor.metrics as m
+    import editor.validate as v
+    import editor.workspace as ws
+
+    catalog = cat.get_catalog()
+    df_clips = catalog.clips
+    video_ids = get_video_ids(parsed, catalog)
+    # set before workers start, they inherit the environment
+    if parsed.scratch:
+        os.environ[ws.SCRATCH_FOLDER_ENV] = parsed.scratch
+    if parsed.scratch_bytes:
+        ws.parse_size(parsed.scratch_bytes)
+        os.environ[ws.SCRATCH_BYTES_ENV] = parsed.scratch_bytes
+    if parsed.metrics:
+        # start from an empty file, every worker appends its own spans
+        open(parsed.metrics, 'w').close()
+        m.enable(parsed.metrics)
+    if not parsed.skip_validation:
+        # fail before any ffmpeg work is launched
+        mask = df_clips['VideoId'].isin(video_ids)
+        df_problems = v.validate_clips(df_clips.loc[mask, :])
+        if not df_problems.empty:
+            print(df_problems.to_string(index=False))
+            print(f'{len(df_problems.index)} problems found, nothing '
+                  f'rendered')
+            return 1
+    if parsed.dry_run:
+        import editor.plan as plan
+
+        nodes = plan.plan_videos(df_clips, video_ids, parsed.smart_cut)
+        print(plan.get_plan_table(nodes).to_string(index=False))
+        print(json.dumps(plan.get_plan_cost(nodes)))
+        return 0
+    t_start = time.perf_counter()
+    t_run = time.time()
+    if parsed.graph:
+        import editor.plan as plan
+
+        df_results = plan.render_videos(df_clips, video_ids, parsed.workers,
+                                        incremental=parsed.incremental,
+                                        smart_cut=parsed.smart_cut,
+                                        cores=parsed.cores)
+    else:
+        df_results = b.render_videos(df_clips, video_ids, parsed.workers,
+                                     cores=parsed.cores,
+                                     trim_workers=parsed.trim_workers,
+                                     mode=parsed.mode,
+                                     incremental=parsed.incremental,
+                                     smart_cut=parsed.smart_cut)
+    summary = b.get_summary(df_results, time.perf_counter() - t_start)
+    print(df_results.to_string(index=False))
+    if parsed.incremental:
+        df_manifest = build.get_manifest(since=t_run)
+        print(df_manifest[['Artifact', 'Status', 'Reason']]
+              .to_string(index=False))
+    if parsed.metrics:
+        records = m.read_records(parsed.metrics)
+        print(m.get_summary(records).to_string(index=False))
+    print(f"{summary['Succeeded']}/{summary['Videos']} videos rendered "
+          f"({summary['Failed']} failed) in {summary['WallTime']} s "
+          f"({summary['VideosPerHour']} videos/hour)")
+    return 0 if summary['Failed'] == 0 else 1
+
+
+def main(args=None) -> int:
+    parsed = parse_args(args)
+    return {'render': render, 'probe': probe, 'validate': validate,
+            'trim': trim, 'proxy': build_proxies}[parsed.command](parsed)
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
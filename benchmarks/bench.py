@@ -0,0 +1,267 @@
+#!/usr/bin/env python
+
+import argparse
+import json
+import os
+import resource
+import subprocess as s
+import sys
+import tempfile
+import time
+from typing import Any, Union
+
+import editor.ffmpeg as ff
+
+SCENARIOS = ['trim', 'merge', 'audio', 'intro_outro', 'render_steps',
+             'render_fused', 'render_stream']
+PREPARED_SCENARIOS = ['merge', 'audio', 'intro_outro']
+RESULT_KEYS = ['scenario', 'resolution', 'duration', 'gop', 'clips']
+RESULT_METRICS = ['wall', 'processes', 'bytes_written', 'peak_rss_kb']
+FPS = 30
+BUMPER_LENGTH = 2
+VIDEO_ID = 1
+
+
+def generate_video_cmd(f_out: str, resolution: str, duration: int,
+                       gop: int) -> str:
+    return f'ffmpeg -y -v error ' \
+           f'-f lavfi -i testsrc=size={resolution}:rate={FPS} ' \
+           f'-f lavfi -i sine=frequency=440:sample_rate=44100 ' \
+           f'-t {duration} -c:v libx264 -preset ultrafast -g {gop} ' \
+           f'-pix_fmt yuv420p -c:a aac -shortest {f_out}'
+
+
+def generate_audio_cmd(f_out: str, duration: int) -> str:
+    return f'ffmpeg -y -v error -f lavfi ' \
+           f'-i sine=frequency=220:sample_rate=44100 -t {duration} ' \
+           f'-c:a libmp3lame {f_out}'
+
+
+def get_workspace(root: str, resolution: str, duration: int,
+                  gop: int) -> str:
+    return os.path.join(root, f'{resolution}_{duration}s_gop{gop}')
+
+
+def setup_workspace(root: str, resolution: str, duration: int,
+                    gop: int) -> str:
+    # synthetic media is generated once and reused by later runs
+    workspace = get_workspace(root, resolution, duration, gop)
+    folder = os.path.join(workspace, 'data', 'videos')
+    for sub_folder in ['raw', 'temp', 'final']:
+        os.makedirs(os.path.join(folder, sub_folder), exist_ok=True)
+    f_raw = os.path.join(folder, 'raw', 'source.mp4')
+    if not os.path.isfile(f_raw):
+        ff.run_command(generate_video_cmd(f_raw, resolution, duration, gop))
+    for f_name in ['intro.mp4', 'action.mp4', 'outro.mp4']:
+        f_bumper = os.path.join(folder, f_name)
+        if not os.path.isfile(f_bumper):
+            ff.run_command(generate_video_cmd(f_bumper, resolution,
+                                              BUMPER_LENGTH, gop))
+    f_audio = os.path.join(folder, 'bensound-smallguitar.mp3')
+    if not os.path.isfile(f_audio):
+        ff.run_command(generate_audio_cmd(f_audio, duration))
+    return workspace
+
+
+def format_time(seconds: int) -> str:
+    return f'{seconds // 3600:02}:{seconds // 60 % 60:02}:{seconds % 60:02}'
+
+
+def write_media_data(workspace: str, n_clips: int, duration: int) -> bool:
+    # one second clips spread over the source, reused when it's too short
+    lines = ['Id,VideoId,FileName,TimeStart,TimeEnd']
+    for i in range(n_clips):
+        start = (i * 7) % (duration - 1)
+        lines.append(f'{i + 1},{VIDEO_ID},source.mp4,{format_time(start)},'
+                     f'{format_time(start + 1)}')
+    with open(os.path.join(workspace, 'data', 'clips.csv'), 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    with open(os.path.join(workspace, 'data', 'videos.csv'), 'w') as f:
+        f.write(f'Id,Name\n{VIDEO_ID},bench.mp4\n')
+    return True
+
+
+def prepare_scenario(scenario: str) -> Union[list, str]:
+    # inputs of the measured step, built in a process of their own so they
+    # don't count towards the scenario's children rusage
+    import editor.catalog as cat
+    import editor.clips as c
+
+    clips = c.get_clips(cat.get_catalog().clips, VIDEO_ID)
+    f_trimmed = c.trim_clips(clips)
+    if scenario == 'merge':
+        return f_trimmed
+    f_merged = c.merge_clips(f_trimmed, VIDEO_ID)
+    if scenario == 'audio':
+        return f_merged
+    return c.add_audio(f_merged, VIDEO_ID)
+
+
+def run_scenario(scenario: str, f_in=None) -> dict:
+    # runs inside the workspace in a fresh process, so children rusage
+    # only covers the measured step
+    import editor.catalog as cat
+    import editor.clips as c
+    import editor.metrics as m
+
+    df_clips = cat.get_catalog().clips
+    clips = c.get_clips(df_clips, VIDEO_ID)
+    m.enable()
+    t_start = time.perf_counter()
+    if scenario == 'trim':
+        c.trim_clips(clips)
+    elif scenario == 'merge':
+        c.merge_clips(f_in, VIDEO_ID)
+    elif scenario == 'audio':
+        c.add_audio(f_in, VIDEO_ID)
+    elif scenario == 'intro_outro':
+        c.add_intro_outro(f_in, VIDEO_ID)
+    else:
+        c.render_video(df_clips, VIDEO_ID, mode=scenario.split('_', 1)[1])
+    wall = time.perf_counter() - t_start
+    records = m.get_records()
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return {
+        'wall': round(wall, 3),
+        'processes': sum(r.get('processes', 1) for r in records
+                         if r['kind'] == 'process'),
+        'bytes_written': sum(r['bytes_out'] for r in records
+                             if r['kind'] == 'stage'),
+        'peak_rss_kb': usage.ru_maxrss,
+    }
+
+
+def run_bench_command(args: list, workspace: str, env: dict,
+                      stdin=None) -> Any:
+    process = s.run([sys.executable, '-m', 'benchmarks.bench'] + args,
+                    cwd=workspace, env=env, input=stdin, stdout=s.PIPE,
+                    stderr=s.PIPE)
+    if process.returncode != 0:
+        raise ValueError(process.stderr.decode('utf-8'))
+    return json.loads(process.stdout.decode('utf-8'))
+
+
+def run_case(root: str, scenario: str, resolution: str, duration: int,
+             gop: int, n_clips: int) -> dict:
+    workspace = setup_workspace(root, resolution, duration, gop)
+    write_media_data(workspace, n_clips, duration)
+    package = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = dict(zip(RESULT_KEYS, [scenario, resolution, duration, gop,
+                                    n_clips]))
+    # every case starts from empty caches, so earlier cases don't warm
+    # its probes or reuse its bumpers
+    with tempfile.TemporaryDirectory() as cache_folder:
+        env = dict(os.environ, PYTHONPATH=package,
+                   EDITOR_CACHE_DIR=cache_folder)
+        env.pop('EDITOR_METRICS', None)
+        f_in = None
+        if scenario in PREPARED_SCENARIOS:
+            f_in = run_bench_command(['prepare', scenario], workspace, env)
+        result.update(run_bench_command(['scenario', scenario], workspace,
+                                        env, json.dumps(f_in).encode()))
+    return result
+
+
+def run_benchmarks(root: str, scenarios: list, resolutions: list,
+                   durations: list, gops: list, clip_counts: list) -> list:
+    results = []
+    for resolution in resolutions:
+        for duration in durations:
+            for gop in gops:
+                for n_clips in clip_counts:
+                    for scenario in scenarios:
+                        result = run_case(root, scenario, resolution,
+                                          duration, gop, n_clips)
+                        print(json.dumps(result), file=sys.stderr)
+                        results.append(result)
+    return results
+
+
+def get_result_key(result: dict) -> tuple:
+    return tuple(result[k] for k in RESULT_KEYS)
+
+
+def compare_results(results: list, baseline: list, threshold=0.1) -> list:
+    baseline_map = {get_result_key(r): r for r in baseline}
+    regressions = []
+    for result in results:
+        base = baseline_map.get(get_result_key(result))
+        if base is None:
+            continue
+        for metric in RESULT_METRICS:
+            value, base_value = result[metric], base[metric]
+            # process count and bytes are deterministic, no tolerance
+            limit = base_value * (1 + threshold) \
+                if metric in ['wall', 'peak_rss_kb'] else base_value
+            if value > limit:
+                change = (value - base_value) / base_value \
+                    if base_value else float('inf')
+                regressions.append(dict(result, metric=metric,
+                                        baseline=base_value, current=value,
+                                        change=round(change, 3)))
+    return regressions
+
+
+def parse_list(value: str, cast=str) -> list:
+    return [cast(v) for v in value.split(',') if v]
+
+
+def parse_args(args=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Benchmark the render '
+                                                 'pipeline on synthetic '
+                                                 'lavfi media')
+    commands = parser.add_subparsers(dest='command', required=True)
+    run = commands.add_parser('run', help='run benchmarks')
+    run.add_argument('-o', '--output', default='bench_results.json')
+    run.add_argument('--root', default='.bench',
+                     help='folder for generated media')
+    run.add_argument('--scenarios', default=','.join(SCENARIOS))
+    run.add_argument('--resolutions', default='640x360,1280x720')
+    run.add_argument('--durations', default='120')
+    run.add_argument('--gops', default='30,250')
+    run.add_argument('--clips', default='1,10,100,1000')
+    compare = commands.add_parser('compare',
+                                  help='flag regressions against baseline')
+    compare.add_argument('results')
+    compare.add_argument('baseline')
+    compare.add_argument('--threshold', type=float, default=0.1,
+                         help='allowed relative slowdown (default: 0.1)')
+    prepare = commands.add_parser('prepare')
+    prepare.add_argument('name', choices=PREPARED_SCENARIOS)
+    scenario = commands.add_parser('scenario')
+    scenario.add_argument('name', choices=SCENARIOS)
+    return parser.parse_args(args)
+
+
+def main(args=None) -> int:
+    parsed = parse_args(args)
+    if parsed.command == 'prepare':
+        print(json.dumps(prepare_scenario(parsed.name)))
+        return 0
+    if parsed.command == 'scenario':
+        # prepared inputs come through stdin
+        print(json.dumps(run_scenario(parsed.name, json.load(sys.stdin))))
+        return 0
+    if parsed.command == 'run':
+        results = run_benchmarks(os.path.abspath(parsed.root),
+                                 parse_list(parsed.scenarios),
+                                 parse_list(parsed.resolutions),
+                                 parse_list(parsed.durations, int),
+                                 parse_list(parsed.gops, int),
+                                 parse_list(parsed.clips, int))
+        with open(parsed.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        return 0
+    with open(parsed.results) as f:
+        results = json.load(f)
+    with open(parsed.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare_results(results, baseline, parsed.threshold)
+    for regression in regressions:
+        print(json.dumps(regression))
+    print(f'{len(regressions)} regressions found')
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+
+import asyncio
+
+import pandas as pd
+
+import editor.build as b
+import editor.clips as c
+import editor.dataframe as d
+import editor.ffmpeg as ff
+import editor.metrics as m
+
+
+async def run_step_async(cmd: str, f_out: str, inputs: list,
+                         incremental=False, params=None, on_progress=None,
+                         timeout=None) -> str:
+    with m.span('step', f_in=inputs, f_out=f_out):
+        return await run_step_cached_async(cmd, f_out, inputs, incremental,
+                                           params, on_progress, timeout)
+
+
+async def run_step_cached_async(cmd: str, f_out: str, inputs: list,
+                                incremental: bool, params, on_progress,
+                                timeout) -> str:
+    if not incremental:
+        await ff.run_command_async(cmd, on_progress, timeout)
+        return f_out
+    key = b.get_build_key(cmd, inputs, params)
+    reason = b.get_rebuild_reason(f_out, key)
+    if reason is None:
+        b.record_build(f_out, key, 'reused', 'key unchanged')
+        return f_out
+    ff.delete_existing_file(f_out)
+    await ff.run_command_async(cmd, on_progress, timeout)
+    b.record_build(f_out, key, 'rebuilt', reason)
+    return f_out
+
+
+async def trim_clip_async(row: pd.Series, incremental=False,
+                          on_progress=None, timeout=None) -> str:
+    cmd, f_out, inputs, params = c.trim_clip_step(row, incremental)
+    return await run_step_async(cmd, f_out, inputs, incremental, params,
+                                on_progress, timeout)
+
+
+async def trim_clips_async(df: pd.DataFrame, max_concurrency=None,
+                           incremental=False, on_progress=None,
+                           timeout=None) -> list:
+    d.has_column(df, 'Id', raise_error=True)
+    rows = [row for i, row in df.sort_values(by=['Id']).iterrows()]
+    semaphore = asyncio.Semaphore(max_concurrency or len(rows) or 1)
+
+    async def trim(row: pd.Series) -> str:
+        async with semaphore:
+            return await trim_clip_async(row, incremental, on_progress,
+                                         timeout)
+
+    tasks = [asyncio.ensure_future(trim(row)) for row in rows]
+    try:
+        # results are returned in clip ID order
+        return list(await asyncio.gather(*tasks))
+    finally:
+        # first failure cancels the other trims and kills their ffmpeg
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def merge_clips_async(f_list: list, video_id: int, suffix='merged',
+                            output_folder='temp', incremental=False,
+                            on_progress=None, timeout=None) -> str:
+    cmd, f_out, inputs, params = c.merge_clips_step(
+        f_list, video_id, suffix=suffix, output_folder=output_folder,
+        incremental=incremental)
+    try:
+        return await run_step_async(cmd, f_out, inputs, incremental, params,
+                                    on_progress, timeout)
+    finally:
+        ff.delete_existing_file(c.get_input_files_path(f_out, video_id))
+
+
+async def add_audio_async(f_in: str, video_id: int, incremental=False,
+                          on_progress=None, timeout=None) -> str:
+    cmd, f_out, inputs, params = c.add_audio_step(f_in, video_id,
+                                                  incremental)
+    return await run_step_async(cmd, f_out, inputs, incremental, params,
+                                on_progress, timeout)
+
+
+async def add_intro_outro_async(f_in: str, video_id: int, incremental=False,
+                                on_progress=None, timeout=None) -> str:
+    # bumper normalization is cached and rarely runs, off the event loop
+    video_list = await asyncio.to_thread(c.get_intro_outro_list, f_in)
+    return await merge_clips_async(video_list, video_id, suffix='',
+                                   output_folder='final',
+                                   incremental=incremental,
+                                   on_progress=on_progress, timeout=timeout)
+
+
+async def render_video_async(df_clips: pd.DataFrame, video_id: int,
+                             max_concurrency=None, incremental=False,
+                             on_progress=None, timeout=None) -> str:
+    clips = c.get_clips(df_clips, video_id)
+    file_names = await trim_clips_async(clips, max_concurrency, incremental,
+                                        on_progress, timeout)
+    merged_file = await merge_clips_async(file_names, video_id,
+                                          incremental=incremental,
+                                          on_progress=on_progress,
+                                          timeout=timeout)
+    audio_file = await add_audio_async(merged_file, video_id, incremental,
+                                       on_progress, timeout)
+    return await add_intro_outro_async(audio_file, video_id, incremental,
+                                       on_progress, timeout)
+
+
+async def render_videos_async(df_clips: pd.DataFrame, video_ids: list,
+                              max_videos=None, **kwargs) -> dict:
+    semaphore = asyncio.Semaphore(max_videos or len(video_ids) or 1)
+
+    async def render(video_id: int) -> str:
+        async with semaphore:
+            return await render_video_async(df_clips, video_id, **kwargs)
+
+    # a failed video is returned as its exception, the others keep going
+    results = await asyncio.gather(*[render(v) for v in video_ids],
+                                   return_exceptions=True)
+    return dict(zip(video_ids, results))
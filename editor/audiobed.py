@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+
+import hashlib
+import json
+import math
+import os
+import threading
+
+from typing import Union
+
+import editor.cache as cache
+import editor.ffmpeg as ff
+import editor.metrics as m
+
+AUDIO_BED_FOLDER = 'audio'
+
+
+def get_bed_length(video_length: float, granularity=1) -> float:
+    # rounded up so the bed always covers the video, -shortest trims the
+    # rest without touching the video
+    steps = math.ceil(round(video_length / granularity, 6))
+    return max(steps, 1) * granularity
+
+
+def get_fade_start(video_length: float, fade_out: float) -> float:
+    # the fade ends with the video, not with the longer bed
+    return round(video_length) - fade_out if fade_out > 0 else 0
+
+
+def get_bed_key(f_audio: Union[os.PathLike, str], bed_length: float,
+                fade_out: float, fade_start=0) -> str:
+    payload = json.dumps({'track': cache.get_file_fingerprint(f_audio),
+                          'length': bed_length, 'fade_out': fade_out,
+                          'fade_start': fade_start}, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def get_bed_path(f_audio: Union[os.PathLike, str], bed_length: float,
+                 fade_out: float, fade_start=0) -> str:
+    f_key = get_bed_key(f_audio, bed_length, fade_out, fade_start)
+    return os.path.join(cache.get_cache_folder(AUDIO_BED_FOLDER),
+                        f_key + '.m4a')
+
+
+def audio_bed_cmd(f_audio: Union[os.PathLike, str], f_out: str,
+                  bed_length: float, fade_out=0, fade_start=None) -> str:
+    # the track is looped when the video is longer than the music
+    a_filter = ''
+    if fade_out > 0:
+        if fade_start is None:
+            fade_start = bed_length - fade_out
+        a_filter = f'-af "afade=t=out:st={fade_start}:d={fade_out}" '
+    return f'ffmpeg -stream_loop -1 -i {f_audio} -t {bed_length} -vn ' \
+           f'{a_filter}-c:a aac {f_out}'
+
+
+def get_audio_bed(f_audio: Union[os.PathLike, str], video_length: float,
+                  fade_out=0, granularity=1) -> str:
+    ff.check_existing_file(f_audio)
+    bed_length = get_bed_length(video_length, granularity)
+    # beds are shared by videos of one quantized length, with a fade only
+    # by videos fading out at the same second
+    fade_start = get_fade_start(video_length, fade_out)
+    f_out = get_bed_path(f_audio, bed_length, fade_out, fade_start)
+    if os.path.isfile(f_out):
+        return f_out
+    # encoded next to the final path and renamed, concurrent renders and
+    # threads never mux a partial bed
+    f_tmp = f'{os.path.splitext(f_out)[0]}.{os.getpid()}.' \
+            f'{threading.get_ident()}.m4a'
+    try:
+        with m.span('audio_bed', f_in=f_audio, f_out=f_tmp):
+            ff.run_command(audio_bed_cmd(f_audio, f_tmp, bed_length,
+                                         fade_out, fade_start))
+        os.replace(f_tmp, f_out)
+    finally:
+        ff.delete_existing_file(f_tmp)
+    return f_out
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+
+import os
+import re
+import time
+
+import pandas as pd
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List
+
+import editor.clips as c
+import editor.dataframe as d
+import editor.scheduler as sched
+
+RESULT_COLUMNS = ['VideoId', 'Success', 'FileName', 'Error', 'Seconds']
+
+
+def parse_video_ids(args: list) -> list:
+    video_ids: List[int] = []
+    for arg in args:
+        match = re.match(r'^(\d+)(?:-(\d+))?$', str(arg).strip())
+        if not match:
+            raise ValueError(f"Invalid video ID: '{arg}' (valid formats: "
+                             f"ID or FROM-TO)")
+        id_from = int(match.group(1))
+        id_to = int(match.group(2)) if match.group(2) else id_from
+        if id_from > id_to:
+            raise ValueError(f"Invalid video ID range: '{arg}'")
+        video_ids.extend(range(id_from, id_to + 1))
+    # keep first occurrence order, drop repeated IDs
+    return list(dict.fromkeys(video_ids))
+
+
+def get_video_ids(df_clips: pd.DataFrame) -> list:
+    d.has_column(df_clips, 'VideoId', raise_error=True)
+    return sorted(int(v) for v in df_clips['VideoId'].unique())
+
+
+def render_video_safe(df_clips: pd.DataFrame, video_id: int,
+                      **kwargs) -> dict:
+    t_start = time.perf_counter()
+    f_out = None
+    error = None
+    try:
+        f_out = c.render_video(df_clips, video_id, **kwargs)
+    except Exception as e:
+        error = f'{type(e).__name__}: {e}'
+    return {
+        'VideoId': video_id,
+        'Success': error is None,
+        'FileName': f_out,
+        'Error': error,
+        'Seconds': round(time.perf_counter() - t_start, 2),
+    }
+
+
+def render_videos(df_clips: pd.DataFrame, video_ids: list,
+                  max_workers=None, cores=None, **kwargs) -> pd.DataFrame:
+    d.has_columns(df_clips, ['VideoId', 'Id'], raise_error=True)
+    max_workers = max_workers or os.cpu_count() or 1
+    # ffmpeg processes of every worker share one machine wide core budget
+    budget = sched.CoreBudget(cores)
+    # send each worker only its own clips instead of the whole table
+    groups = dict(tuple(df_clips.groupby('VideoId')))
+    empty = df_clips.iloc[0:0]
+    results = []
+    with ProcessPoolExecutor(max_workers=max_workers,
+                             initializer=sched.set_budget,
+                             initargs=(budget,)) as executor:
+        futures = {executor.submit(render_video_safe,
+                                   groups.get(video_id, empty),
+                                   video_id, **kwargs): video_id
+                   for video_id in video_ids}
+        for future in as_completed(futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                # worker process died before it could report back
+                results.append({
+                    'VideoId': futures[future],
+                    'Success': False,
+                    'FileName': None,
+                    'Error': f'{type(e).__name__}: {e}',
+                    'Seconds': None,
+                })
+    df = pd.DataFrame(results, columns=RESULT_COLUMNS)
+    return df.sort_values(by=['VideoId']).reset_index(drop=True)
+
+
+def get_summary(df_results: pd.DataFrame, wall_time: float) -> dict:
+    n_videos = len(df_results.index)
+    n_success = int(df_results['Success'].sum())
+    videos_per_hour = n_success / wall_time * 3600 if wall_time > 0 else 0
+    return {
+        'Videos': n_videos,
+        'Succeeded': n_success,
+        'Failed': n_videos - n_success,
+        'WallTime': round(wall_time, 2),
+        'VideosPerHour': round(videos_per_hour, 2),
+    }
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+import pandas as pd
+
+from contextlib import closing
+from typing import Union
+
+import editor.cache as cache
+import editor.ffmpeg as ff
+
+BUILD_CACHE_FILE = 'build.sqlite'
+MANIFEST_COLUMNS = ['Time', 'Artifact', 'Status', 'Reason', 'Key']
+
+
+def get_build_cache_path() -> str:
+    return os.path.join(cache.get_cache_folder(), BUILD_CACHE_FILE)
+
+
+def connect_build_cache() -> sqlite3.Connection:
+    con = sqlite3.connect(get_build_cache_path(), timeout=30)
+    con.execute('CREATE TABLE IF NOT EXISTS artifact (path TEXT PRIMARY KEY, '
+                'key TEXT, size INTEGER, mtime_ns INTEGER)')
+    con.execute('CREATE TABLE IF NOT EXISTS manifest (time REAL, path TEXT, '
+                'status TEXT, reason TEXT, key TEXT)')
+    return con
+
+
+def get_build_key(cmd: str, inputs: list, params=None) -> str:
+    # missing inputs still get a key, ffmpeg reports the actual error
+    fingerprints = [cache.get_file_fingerprint(f) if os.path.isfile(f)
+                    else [os.path.abspath(f), None, None] for f in inputs]
+    payload = json.dumps({'cmd': cmd, 'inputs': fingerprints,
+                          'params': params}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def get_rebuild_reason(f_out: Union[os.PathLike, str], key: str) -> \
+        Union[str, None]:
+    if not os.path.isfile(f_out):
+        return 'missing output'
+    abs_path, size, mtime_ns = cache.get_file_fingerprint(f_out)
+    with closing(connect_build_cache()) as con:
+        row = con.execute('SELECT key, size, mtime_ns FROM artifact WHERE '
+                          'path = ?', (abs_path,)).fetchone()
+    if row is None:
+        return 'no previous build'
+    if row[0] != key:
+        return 'inputs changed'
+    if tuple(row[1:]) != (size, mtime_ns):
+        return 'output modified'
+    return None
+
+
+def record_build(f_out: Union[os.PathLike, str], key: str, status: str,
+                 reason: str) -> bool:
+    abs_path = os.path.abspath(f_out)
+    with closing(connect_build_cache()) as con, con:
+        if status == 'rebuilt':
+            _, size, mtime_ns = cache.get_file_fingerprint(f_out)
+            con.execute('INSERT OR REPLACE INTO artifact VALUES '
+                        '(?, ?, ?, ?)', (abs_path, key, size, mtime_ns))
+        con.execute('INSERT INTO manifest VALUES (?, ?, ?, ?, ?)',
+                    (time.time(), abs_path, status, reason, key))
+    return True
+
+
+def build(f_out: Union[os.PathLike, str], cmd: str, inputs: list,
+          params=None, run=None) -> bool:
+    key = get_build_key(cmd, inputs, params)
+    reason = get_rebuild_reason(f_out, key)
+    if reason is None:
+        record_build(f_out, key, 'reused', 'key unchanged')
+        return False
+    ff.delete_existing_file(f_out)
+    (run or ff.run_command)(cmd)
+    record_build(f_out, key, 'rebuilt', reason)
+    return True
+
+
+def get_artifacts(folder: Union[os.PathLike, str]) -> set:
+    # paths of outputs built in folder, other files there aren't ours
+    prefix = os.path.join(os.path.abspath(folder), '')
+    with closing(connect_build_cache()) as con:
+        rows = con.execute("SELECT path FROM artifact WHERE substr(path, 1, "
+                           "?) = ?", (len(prefix), prefix)).fetchall()
+    return {row[0] for row in rows}
+
+
+def get_manifest(since=None) -> pd.DataFrame:
+    with closing(connect_build_cache()) as con:
+        rows = con.execute('SELECT time, path, status, reason, key FROM '
+                           'manifest WHERE time >= ? ORDER BY time',
+                           (since or 0,)).fetchall()
+    return pd.DataFrame(rows, columns=MANIFEST_COLUMNS)
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+
+import hashlib
+import json
+import os
+import threading
+
+from typing import Union
+
+import editor.cache as cache
+import editor.ffmpeg as ff
+import editor.metrics as m
+import editor.smartcut as sc
+
+BUMPER_FOLDER = 'bumpers'
+VIDEO_KEYS = ['codec_type', 'codec_name', 'profile', 'width', 'height',
+              'pix_fmt', 'time_base', 'r_frame_rate']
+AUDIO_KEYS = ['codec_name', 'sample_rate', 'channels', 'channel_layout']
+AUDIO_ENCODERS = {'aac': 'aac', 'mp3': 'libmp3lame', 'opus': 'libopus'}
+
+
+def get_signature(info: dict) -> dict:
+    # everything the concat demuxer needs to match for a stream copy
+    streams = info.get('streams', [])
+    video: dict = next((st for st in streams
+                        if st.get('codec_type') == 'video'), {})
+    audio = next((st for st in streams if st.get('codec_type') == 'audio'),
+                 None)
+    return {
+        'video': {k: video[k] for k in VIDEO_KEYS if k in video},
+        'audio': {k: audio[k] for k in AUDIO_KEYS if k in audio}
+        if audio is not None else None,
+    }
+
+
+def get_bumper_key(f_bumper: Union[os.PathLike, str], signature: dict) -> str:
+    payload = json.dumps({'bumper': cache.get_file_fingerprint(f_bumper),
+                          'signature': signature}, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def get_bumper_path(f_bumper: Union[os.PathLike, str],
+                    signature: dict) -> str:
+    f_ext = os.path.splitext(f_bumper)[1]
+    return os.path.join(cache.get_cache_folder(BUMPER_FOLDER),
+                        get_bumper_key(f_bumper, signature) + f_ext)
+
+
+def normalize_bumper_cmd(f_in: Union[os.PathLike, str], f_out: str,
+                         signature: dict, has_audio=True) -> str:
+    video = signature['video']
+    audio = signature['audio']
+    width, height = video['width'], video['height']
+    v_filter = f'scale={width}:{height}:force_original_aspect_ratio=' \
+               f'decrease,pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,setsar=1'
+    if video.get('r_frame_rate'):
+        v_filter += f",fps={video['r_frame_rate']}"
+    args = [f'ffmpeg -i {f_in}']
+    if audio is not None and not has_audio:
+        # silent track, so every part of the concat has the same streams
+        args.append(f"-f lavfi -i anullsrc=r={audio['sample_rate']}:"
+                    f"cl={audio.get('channel_layout', 'stereo')}")
+    args.append(f'-vf "{v_filter}"')
+    args.append(sc.get_encode_args({'streams': [video]}))
+    if audio is None:
+        args.append('-an -map 0:v:0')
+    else:
+        codec = audio.get('codec_name')
+        if codec not in AUDIO_ENCODERS:
+            raise ValueError(f"Bumper audio codec '{codec}' is not supported "
+                             f"(supported codecs: "
+                             f"[{','.join(AUDIO_ENCODERS)}])")
+        args.append(f"-c:a {AUDIO_ENCODERS[codec]} "
+                    f"-ar {audio['sample_rate']} -ac {audio['channels']}")
+        args.append('-map 0:v:0 -map 0:a:0' if has_audio else
+                    '-map 0:v:0 -map 1:a:0 -shortest')
+    args.append(f_out)
+    return ' '.join(args)
+
+
+def get_bumper(f_bumper: Union[os.PathLike, str], signature: dict) -> \
+        Union[os.PathLike, str]:
+    ff.check_existing_file(f_bumper)
+    info = ff.get_media_info(f_bumper)
+    if get_signature(info) == signature:
+        return f_bumper
+    f_out = get_bumper_path(f_bumper, signature)
+    if os.path.isfile(f_out):
+        return f_out
+    has_audio = get_signature(info)['audio'] is not None
+    # transcoded next to the final path and renamed, concurrent renders
+    # and threads never concat a partial bumper
+    f_name, f_ext = os.path.splitext(f_out)
+    f_tmp = f'{f_name}.{os.getpid()}.{threading.get_ident()}{f_ext}'
+    cmd = normalize_bumper_cmd(f_bumper, f_tmp, signature, has_audio)
+    try:
+        with m.span('normalize_bumper', f_in=f_bumper, f_out=f_tmp):
+            ff.run_command(cmd)
+        os.replace(f_tmp, f_out)
+    finally:
+        ff.delete_existing_file(f_tmp)
+    return f_out
+
+
+def get_bumpers(f_bumpers: list, signature: dict) -> list:
+    return [get_bumper(f_bumper, signature) for f_bumper in f_bumpers]
+
+
+def get_stream_path(f_bumper: Union[os.PathLike, str]) -> str:
+    f_key = get_bumper_key(f_bumper, {'format': 'mpegts'})
+    return os.path.join(cache.get_cache_folder(BUMPER_FOLDER), f_key + '.ts')
+
+
+def stream_bumper_cmd(f_in: Union[os.PathLike, str], f_out: str) -> str:
+    # the muxer turns mp4 video into annex b and prefixes aac with ADTS
+    # headers, as in the streamed body
+    return f'ffmpeg -nostdin -i {f_in} -map 0 -c copy -f mpegts {f_out}'
+
+
+def get_stream_bumper(f_bumper: Union[os.PathLike, str]) -> str:
+    # remuxed once, stream copies of mp4 and MPEG-TS parts can't be mixed
+    ff.check_existing_file(f_bumper)
+    f_out = get_stream_path(f_bumper)
+    if os.path.isfile(f_out):
+        return f_out
+    f_tmp = f'{os.path.splitext(f_out)[0]}.{os.getpid()}.' \
+            f'{threading.get_ident()}.ts'
+    try:
+        with m.span('remux_bumper', f_in=f_bumper, f_out=f_tmp):
+            ff.run_command(stream_bumper_cmd(f_bumper, f_tmp))
+        os.replace(f_tmp, f_out)
+    finally:
+        ff.delete_existing_file(f_tmp)
+    return f_out
+
+
+def get_stream_bumpers(f_bumpers: list, signature: dict) -> list:
+    return [get_stream_bumper(get_bumper(f_bumper, signature))
+            for f_bumper in f_bumpers]
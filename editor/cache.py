@@ -0,0 +1,20 @@
+#!/usr/bin/env python
+
+import os
+
+from typing import Tuple, Union
+
+CACHE_FOLDER_ENV = 'EDITOR_CACHE_DIR'
+
+
+def get_cache_folder(folder='') -> str:
+    root = os.environ.get(CACHE_FOLDER_ENV) or os.path.join('data', 'cache')
+    f_path = os.path.join(root, folder)
+    os.makedirs(f_path, exist_ok=True)
+    return f_path
+
+
+def get_file_fingerprint(f_path: Union[os.PathLike, str]) -> \
+        Tuple[str, int, int]:
+    stat = os.stat(f_path)
+    return os.path.abspath(f_path), stat.st_size, stat.st_mtime_ns
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from typing import Dict, Union
+
+import editor.dataframe as d
+import editor.snapshot as snap
+
+CLIP_COLUMNS = ['Id', 'VideoId', 'FileName', 'TimeStart', 'TimeEnd']
+VIDEO_COLUMNS = ['Id', 'Name']
+# repeated strings are stored once per category instead of once per row
+CLIP_DTYPES = {'FileName': 'category', 'TimeStart': 'category',
+               'TimeEnd': 'category'}
+
+_catalogs: Dict[str, 'MediaCatalog'] = {}
+_catalogs_lock = threading.Lock()
+
+
+class MediaCatalog:
+
+    def __init__(self, folder='data', clips_name='clips.csv',
+                 videos_name='videos.csv'):
+        self.clips_path = os.path.join(folder, clips_name)
+        self.videos_path = os.path.join(folder, videos_name)
+        self.clips = None
+        self.videos = None
+        self._mtimes = None
+        self._clip_index = {}
+        self._video_index = {}
+        self._lock = threading.Lock()
+        self.load()
+
+    def get_mtimes(self) -> tuple:
+        return (os.stat(self.clips_path).st_mtime_ns,
+                os.stat(self.videos_path).st_mtime_ns)
+
+    def load(self) -> bool:
+        mtimes = self.get_mtimes()
+        clips = snap.read_table(self.clips_path, dtype=CLIP_DTYPES)
+        videos = snap.read_table(self.videos_path)
+        d.has_columns(clips, CLIP_COLUMNS, raise_error=True)
+        d.has_columns(videos, VIDEO_COLUMNS, raise_error=True)
+        d.has_duplicates(clips, 'Id', raise_error=True)
+        d.has_duplicates(videos, 'Id', raise_error=True)
+        for column in ['Id', 'VideoId']:
+            clips[column] = pd.to_numeric(clips[column], downcast='integer')
+        # clips of a video are stored as one contiguous, Id-ordered block
+        clips = clips.sort_values(by=['VideoId', 'Id'], kind='stable')
+        clips = clips.reset_index(drop=True)
+        video_ids = clips['VideoId'].to_numpy()
+        ids, starts = np.unique(video_ids, return_index=True)
+        stops = np.append(starts[1:], len(video_ids))
+        self._clip_index = dict(zip(ids.tolist(),
+                                    zip(starts.tolist(), stops.tolist())))
+        self._video_index = {v: i for i, v in
+                             enumerate(videos['Id'].tolist())}
+        self.clips = clips
+        self.videos = videos
+        self._mtimes = mtimes
+        return True
+
+    def refresh(self) -> bool:
+        with self._lock:
+            if self.get_mtimes() == self._mtimes:
+                return False
+            return self.load()
+
+    def get_video_ids(self) -> list:
+        self.refresh()
+        return list(self._clip_index)
+
+    def get_clips(self, video_id: int) -> pd.DataFrame:
+        self.refresh()
+        if video_id not in self._clip_index:
+            raise ValueError(f"No clips found for Video ID {video_id}!")
+        start, stop = self._clip_index[video_id]
+        return self.clips.iloc[start:stop]
+
+    def get_video(self, video_id: int, column=None) -> \
+            Union[pd.DataFrame, str]:
+        self.refresh()
+        if video_id not in self._video_index:
+            raise ValueError(f"Video ID {video_id} not found!")
+        i = self._video_index[video_id]
+        if column:
+            d.has_column(self.videos, column, raise_error=True)
+            return self.videos[column].iat[i]
+        return self.videos.iloc[[i]]
+
+
+def get_catalog(folder='data') -> MediaCatalog:
+    # relative folders resolve against the current working directory
+    folder = os.path.abspath(folder)
+    with _catalogs_lock:
+        if folder not in _catalogs:
+            _catalogs[folder] = MediaCatalog(folder)
+        return _catalogs[folder]
+
+
+def find_catalog(df: pd.DataFrame) -> Union[MediaCatalog, None]:
+    # catalog whose clip table df is, without loading any
+    with _catalogs_lock:
+        for catalog in _catalogs.values():
+            if catalog.clips is df:
+                return catalog
+    return None
@@ -3,40 +3,51 @@
 import pandas as pd
 import os
 
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
 from typing import Union
 
+import editor.audiobed as ab
+import editor.build as b
+import editor.bumpers as bp
+import editor.catalog as cat
 import editor.dataframe as d
 import editor.ffmpeg as ff
+import editor.metrics as m
+import editor.proxy as px
+import editor.smartcut as sc
+import editor.snapshot as snap
+import editor.workspace as ws
+
+AUDIO_FADE_OUT = 2
+# audio beds are cached per video length rounded up to this many seconds
+AUDIO_BED_GRANULARITY = 1
+RENDER_MODES = ['steps', 'fused', 'stream', 'preview']
+# names of preview intermediates, incremental builds keep both renders
+PREVIEW_TAG = 'preview'
 
 
 def read_media_data(folder='data', f_name='clips.csv') -> pd.DataFrame:
     f_path = os.path.join(folder, f_name)
-    df = pd.read_csv(f_path)
-    return df
+    return snap.read_table(f_path)
 
 
 def get_clips(df: pd.DataFrame, video_id: int) -> pd.DataFrame:
+    catalog = cat.find_catalog(df)
+    if catalog is not None:
+        # validated on load, the clips of a video are one indexed block
+        return catalog.get_clips(video_id)
     d.has_columns(df, ['VideoId', 'Id'], raise_error=True)
     d.has_duplicates(df, 'Id', raise_error=True)
-    df.sort_values(by=['Id'], inplace=True)
-    dfc = df.copy()
-    mask = dfc['VideoId'] == video_id
-    dfc = dfc.loc[mask, :]
+    # select first so only the clips of this video are sorted and copied
+    mask = df['VideoId'] == video_id
+    dfc = df.loc[mask, :].sort_values(by=['Id'])
     if dfc.empty:
         raise ValueError(f"No clips found for Video ID {video_id}!")
     return dfc
 
 
 def get_video(video_id: int, column=None) -> Union[pd.DataFrame, str]:
-    df_videos = read_media_data(f_name='videos.csv')
-    d.has_duplicates(df_videos, 'Id', raise_error=True)
-    dfc = df_videos.copy()
-    mask = dfc['Id'] == video_id
-    dfc = dfc.loc[mask, :]
-    if column:
-        d.has_column(dfc, column, raise_error=True)
-        return dfc.loc[0, column]
-    return dfc
+    return cat.get_catalog().get_video(video_id, column)
 
 
 def get_input_folder() -> str:
@@ -48,7 +59,8 @@ def get_input_file_path(f_name: str, folder='') -> str:
     return os.path.join(input_folder, folder, f_name)
 
 
-def get_output_file_path(file_name: str, suffix=None, folder='temp') -> str:
+def get_output_file_path(file_name: str, suffix=None, folder='temp',
+                         video_id=None) -> str:
     input_folder = get_input_folder()
     f_name, f_ext = os.path.splitext(file_name)
     if suffix is None or suffix == '':
@@ -60,20 +72,90 @@ def get_output_file_path(file_name: str, suffix=None, folder='temp') -> str:
     else:
         raise ValueError(f'Invalid file suffix: {str(suffix)}')
     f_name_full = f'{f_name}{f_suffix}{f_ext}'
+    if folder == 'temp':
+        # intermediates go to the scratch folder of the running job
+        return os.path.join(ws.get_folder(video_id) or ws.get_root(
+            os.path.join(input_folder, folder)), f_name_full)
     return os.path.join(input_folder, folder, f_name_full)
 
 
-def trim_clip(row: pd.Series) -> str:
+def run_step(cmd: str, f_out: str, inputs: list, incremental=False,
+             params=None, name='step', run=None) -> str:
+    with m.span(name, f_in=inputs, f_out=f_out):
+        if incremental:
+            # reuse f_out when the command and its inputs are unchanged
+            b.build(f_out, cmd, inputs, params, run)
+        else:
+            (run or ff.run_command)(cmd)
+    return f_out
+
+
+def get_trim_file_paths(row: pd.Series) -> tuple:
     d.has_columns(row, ['Id', 'FileName', 'TimeStart', 'TimeEnd'],
                   raise_error=True)
     f_name = row['FileName']
-    f_in = get_input_file_path(f_name, folder='raw')
-    f_out = get_output_file_path(f_name, suffix=row['Id'])
+    suffix = row['Id']
+    if pd.notna(row.get('SourcePath')):
+        # previews cut from a proxy of the source
+        f_in = row['SourcePath']
+        suffix = f"{str(row['Id']).zfill(2)}_{PREVIEW_TAG}"
+    else:
+        f_in = get_input_file_path(f_name, folder='raw')
+    f_out = get_output_file_path(f_name, suffix=suffix,
+                                 video_id=row.get('VideoId'))
+    return f_in, f_out
+
+
+def trim_clip_step(row: pd.Series, incremental=False) -> tuple:
+    f_in, f_out = get_trim_file_paths(row)
     trim_cmd = ff.trim_video_cmd(f_in, f_out,
                                  t_start=row['TimeStart'],
-                                 t_end=row['TimeEnd'])
-    ff.run_command(trim_cmd)
-    return f_out
+                                 t_end=row['TimeEnd'],
+                                 overwrite=not incremental)
+    params = {'TimeStart': row['TimeStart'], 'TimeEnd': row['TimeEnd']}
+    return trim_cmd, f_out, [f_in], params
+
+
+def smart_trim_clip(row: pd.Series, incremental=False) -> str:
+    f_in, f_out = get_trim_file_paths(row)
+    cmds = sc.smart_trim_cmds(f_in, f_out, t_start=row['TimeStart'],
+                              t_end=row['TimeEnd'], overwrite=not incremental)
+    params = {'TimeStart': row['TimeStart'], 'TimeEnd': row['TimeEnd']}
+    # the joined commands only serve as build key, parts run one by one
+    return run_step(' && '.join(cmds), f_out, [f_in], incremental, params,
+                    'smart_trim_clip',
+                    run=lambda cmd: sc.run_smart_trim(cmds, f_out))
+
+
+def trim_clip(row: pd.Series, incremental=False, smart=False) -> str:
+    if smart:
+        # frame accurate cut, only partial GOPs are re-encoded
+        return smart_trim_clip(row, incremental)
+    cmd, f_out, inputs, params = trim_clip_step(row, incremental)
+    return run_step(cmd, f_out, inputs, incremental, params, 'trim_clip')
+
+
+def trim_clips(df: pd.DataFrame, max_workers=None, incremental=False,
+               smart=False) -> list:
+    d.has_column(df, 'Id', raise_error=True)
+    rows = [row for i, row in df.sort_values(by=['Id']).iterrows()]
+    if not rows:
+        return []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(trim_clip, row, incremental=incremental,
+                                   smart=smart)
+                   for row in rows]
+        done, pending = wait(futures, return_when=FIRST_EXCEPTION)
+        for future in pending:
+            # trims not started yet are dropped, running ones finish
+            future.cancel()
+        for future in futures:
+            if future.done() and not future.cancelled():
+                error = future.exception()
+                if error is not None:
+                    raise error
+    # results are returned in clip ID order regardless of completion order
+    return [future.result() for future in futures]
 
 
 def write_input_files(f_list: list, input_files_path: str) -> bool:
@@ -85,30 +167,225 @@ def write_input_files(f_list: list, input_files_path: str) -> bool:
     return True
 
 
-def merge_clips(f_list: list, video_id: int, input_files_path='temp.txt', suffix='merged', output_folder='temp') -> str:
-    write_input_files(f_list, input_files_path)
+def write_segment_files(segments: list, input_files_path: str) -> bool:
+    # let concat demuxer cut segments so no trimmed files are written
+    lines = []
+    for f_in, t_start, t_end in segments:
+        lines.append(f"file '{os.path.abspath(f_in)}'")
+        lines.append(f'inpoint {ff.get_seconds(t_start)}')
+        lines.append(f'outpoint {ff.get_seconds(t_end)}')
+    with open(input_files_path, 'w') as f:
+        f.write("\r\n".join(lines))
+    return True
+
+
+def get_input_files_path(f_out: str, video_id=None) -> str:
+    # lists go to the scratch folder of the job, or next to the output so
+    # concurrent renders don't clash
+    f_name = os.path.splitext(os.path.basename(f_out))[0] + '.txt'
+    return os.path.join(ws.get_folder(video_id) or os.path.dirname(f_out),
+                        f_name)
+
+
+def merge_clips_step(f_list: list, video_id: int, input_files_path=None,
+                     suffix='merged', output_folder='temp',
+                     incremental=False) -> tuple:
+    f_name = get_video(video_id, "Name")
+    f_out = get_output_file_path(f_name, suffix, output_folder, video_id)
+    if input_files_path is None:
+        input_files_path = get_input_files_path(f_out, video_id)
+    # concat resolves relative entries against the list file's folder
+    write_input_files([os.path.abspath(f) for f in f_list], input_files_path)
+    cmd = ff.merge_videos_cmd(input_files_path, f_out,
+                              overwrite=not incremental)
+    return cmd, f_out, f_list, None
+
+
+def merge_clips(f_list: list, video_id: int, input_files_path=None,
+                suffix='merged', output_folder='temp', incremental=False,
+                name='merge_clips') -> str:
+    cmd, f_out, inputs, params = merge_clips_step(
+        f_list, video_id, input_files_path, suffix, output_folder,
+        incremental)
+    run_step(cmd, f_out, inputs, incremental, params, name)
+    ff.delete_existing_file(input_files_path
+                            or get_input_files_path(f_out, video_id))
+    return f_out
+
+
+def get_audio_file_path() -> str:
+    return os.path.join(get_input_folder(), 'bensound-smallguitar.mp3')
+
+
+def get_bumper_file_paths() -> list:
+    return [get_input_file_path(f_name) for f_name in
+            ['intro.mp4', 'action.mp4', 'outro.mp4']]
+
+
+def add_audio_step(f_in: str, video_id: int, incremental=False,
+                   suffix='sound') -> tuple:
     f_name = get_video(video_id, "Name")
-    f_out = get_output_file_path(f_name, suffix, output_folder)
-    cmd = ff.merge_videos_cmd(input_files_path, f_out)
-    ff.run_command(cmd)
-    ff.delete_existing_file(input_files_path)
+    f_out = get_output_file_path(f_name, suffix=suffix, video_id=video_id)
+    if not incremental:
+        ff.delete_existing_file(f_out)
+    # the faded soundtrack is encoded once per length, muxing is a copy
+    f_bed = ab.get_audio_bed(get_audio_file_path(), ff.get_video_length(f_in),
+                             AUDIO_FADE_OUT, AUDIO_BED_GRANULARITY)
+    cmd = ff.add_audio_cmd(f_in, f_bed, f_out)
+    params = {'fade_out': AUDIO_FADE_OUT}
+    return cmd, f_out, [f_in, f_bed], params
+
+
+def add_audio(f_in: str, video_id: int, incremental=False,
+              suffix='sound') -> str:
+    cmd, f_out, inputs, params = add_audio_step(f_in, video_id, incremental,
+                                                suffix)
+    return run_step(cmd, f_out, inputs, incremental, params, 'add_audio')
+
+
+def get_intro_outro_list(f_in: str) -> list:
+    # bumpers are normalized once per body signature, the concat stays a
+    # stream copy
+    signature = bp.get_signature(ff.get_media_info(f_in))
+    f_intro, f_action, f_outro = bp.get_bumpers(get_bumper_file_paths(),
+                                                signature)
+    return [f_intro, f_in, f_action, f_outro]
+
+
+def add_intro_outro(f_in: str, video_id: int, incremental=False,
+                    output_folder='final') -> str:
+    video_list = get_intro_outro_list(f_in)
+    f_out = merge_clips(video_list, video_id, suffix='',
+                        output_folder=output_folder, incremental=incremental,
+                        name='add_intro_outro')
     return f_out
 
 
-def add_audio(f_in: str, video_id: int) -> str:
+def get_segments(df_clips: pd.DataFrame, video_id: int) -> list:
+    clips = get_clips(df_clips, video_id)
+    d.has_columns(clips, ['FileName', 'TimeStart', 'TimeEnd'],
+                  raise_error=True)
+    return [(get_input_file_path(row['FileName'], folder='raw'),
+             row['TimeStart'], row['TimeEnd'])
+            for i, row in clips.iterrows()]
+
+
+def render_fused(df_clips: pd.DataFrame, video_id: int, incremental=False) -> \
+        str:
+    segments = get_segments(df_clips, video_id)
     f_name = get_video(video_id, "Name")
-    f_out = get_output_file_path(f_name, suffix="sound")
-    ff.delete_existing_file(f_out)
-    f_audio = os.path.join(get_input_folder(), 'bensound-smallguitar.mp3')
-    cmd = ff.add_audio_cmd(f_in, f_audio, f_out, fade_out=2)
-    ff.run_command(cmd)
+    f_out = get_output_file_path(f_name, folder='final')
+    f_audio = get_audio_file_path()
+    f_intro, f_action, f_outro = get_bumper_file_paths()
+    cmd = ff.render_fused_cmd(segments, f_audio, f_intro, f_action, f_outro,
+                              f_out, fade_out=AUDIO_FADE_OUT,
+                              overwrite=not incremental)
+    inputs = sorted({f_in for f_in, _, _ in segments})
+    inputs += [f_audio, f_intro, f_action, f_outro]
+    params = {'fade_out': AUDIO_FADE_OUT}
+    return run_step(cmd, f_out, inputs, incremental, params, 'render_fused')
+
+
+def get_stream_signature(segments: list, f_audio: str) -> dict:
+    # the streamed body copies video of the first source and encodes the
+    # audio track to aac
+    signature = bp.get_signature(ff.get_media_info(segments[0][0]))
+    audio = bp.get_signature(ff.get_media_info(f_audio))['audio']
+    if audio is not None:
+        audio = dict(audio, codec_name='aac')
+    return dict(signature, audio=audio)
+
+
+def render_stream(df_clips: pd.DataFrame, video_id: int) -> str:
+    segments = get_segments(df_clips, video_id)
+    video_length = ff.check_segments(segments)
+    f_name = get_video(video_id, "Name")
+    f_out = get_output_file_path(f_name, folder='final')
+    f_audio = get_audio_file_path()
+    f_intro, f_action, f_outro = bp.get_stream_bumpers(
+        get_bumper_file_paths(), get_stream_signature(segments, f_audio))
+    # only the small concat lists are written, to the scratch folder
+    with ws.workspace([video_id]) as folder:
+        body_files_path = os.path.join(folder, 'body.txt')
+        final_files_path = os.path.join(folder, 'final.txt')
+        write_segment_files(segments, body_files_path)
+        # body is streamed as MPEG-TS from the audio stage through stdin,
+        # bumpers are MPEG-TS as well so every part has the same layout
+        f_list = [os.path.abspath(f_intro), 'pipe:0',
+                  os.path.abspath(f_action), os.path.abspath(f_outro)]
+        write_input_files(f_list, final_files_path)
+        cmds = [ff.concat_stream_cmd(body_files_path),
+                ff.add_audio_stream_cmd(f_audio, video_length,
+                                        fade_out=AUDIO_FADE_OUT),
+                ff.merge_stream_cmd(final_files_path, f_out)]
+        with m.span('render_stream', f_out=f_out):
+            ff.run_pipeline(cmds)
     return f_out
 
 
-def add_intro_outro(f_in: str, video_id: int) -> str:
-    f_intro = get_input_file_path('intro.mp4')
-    f_action = get_input_file_path('action.mp4')
-    f_outro = get_input_file_path('outro.mp4')
-    video_list = [f_intro, f_in, f_action, f_outro]
-    f_out = merge_clips(video_list, video_id, suffix='', output_folder='final')
+def render_video(df_clips: pd.DataFrame, video_id: int, trim_workers=None,
+                 mode='steps', incremental=False, smart_cut=False) -> str:
+    if mode not in RENDER_MODES:
+        raise ValueError(f"Unknown render mode: '{mode}' (valid modes: "
+                         f"[{','.join(RENDER_MODES)}])")
+    with m.span('render_video', kind='video', video_id=video_id,
+                mode=mode) as span:
+        f_out = render_video_mode(df_clips, video_id, trim_workers, mode,
+                                  incremental, smart_cut)
+        span.set(f_out=f_out)
     return f_out
+
+
+def render_video_mode(df_clips: pd.DataFrame, video_id: int, trim_workers,
+                      mode: str, incremental: bool, smart_cut: bool) -> str:
+    if mode == 'fused':
+        # one ffmpeg process, no intermediates under temp
+        return render_fused(df_clips, video_id, incremental)
+    if mode == 'stream':
+        if incremental:
+            raise ValueError('Incremental builds are not supported in '
+                             'stream mode!')
+        return render_stream(df_clips, video_id)
+    if mode == 'preview':
+        return render_preview(df_clips, video_id, trim_workers, incremental)
+    clips = get_clips(df_clips, video_id)
+    return render_steps(clips, video_id, trim_workers, incremental,
+                        smart_cut)
+
+
+def render_steps(clips: pd.DataFrame, video_id: int, trim_workers=None,
+                 incremental=False, smart_cut=False,
+                 output_folder='final', tag=None) -> str:
+    segments = [(get_trim_file_paths(row)[0], row['TimeStart'],
+                 row['TimeEnd']) for i, row in clips.iterrows()]
+    # reusable intermediates of incremental builds stay in the shared
+    # scratch folder, others live and die with the job's own folder
+    scratch = ws.pinned() if incremental else ws.workspace(
+        [video_id], ws.get_job_bytes(segments))
+    with scratch:
+        file_names = trim_clips(clips, trim_workers, incremental, smart_cut)
+        suffixes = ['merged', 'sound'] if tag is None else \
+            [f'merged_{tag}', f'sound_{tag}']
+        merged_file = merge_clips(file_names, video_id, suffix=suffixes[0],
+                                  incremental=incremental)
+        audio_file = add_audio(merged_file, video_id, incremental,
+                               suffixes[1])
+        final_file = add_intro_outro(audio_file, video_id, incremental,
+                                     output_folder)
+    return final_file
+
+
+def render_preview(df_clips: pd.DataFrame, video_id: int, trim_workers=None,
+                   incremental=False) -> str:
+    # the steps pipeline on low resolution all-intra proxies, copy trims
+    # are frame accurate and every stage is cheap
+    clips = get_clips(df_clips, video_id)
+    sources = [f_in for f_in, _, _ in get_segments(df_clips, video_id)]
+    proxies = px.get_proxies(sources)
+    clips = clips.assign(SourcePath=[proxies[f_in] for f_in in sources])
+    f_name = get_video(video_id, "Name")
+    os.makedirs(os.path.dirname(get_output_file_path(f_name,
+                                                     folder='preview')),
+                exist_ok=True)
+    return render_steps(clips, video_id, trim_workers, incremental,
+                        output_folder='preview', tag=PREVIEW_TAG)
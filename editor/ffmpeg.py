@@ -1,24 +1,212 @@
 #!/usr/bin/env python
 
 import subprocess as s
+import collections
+import json
 import os
 import re
+import shlex
+import sqlite3
+import tempfile
+import threading
 
-from typing import Tuple, Union
+from contextlib import closing
+from typing import TYPE_CHECKING, Deque, Dict, Tuple, Union
+
+import editor.cache as cache
+import editor.metrics as m
+import editor.scheduler as sched
+
+if TYPE_CHECKING:
+    # imported by async callers only, see run_argv_async
+    import asyncio
 
 VALID_EXTENSIONS = ['mp4']
+# renamed whenever STREAM_KEYS change, so no entry lacks a key
+PROBE_CACHE_FILE = 'probe.v2.sqlite'
+PROBE_CACHE_PERSIST = True
+STREAM_KEYS = ['index', 'codec_type', 'codec_name', 'profile', 'width',
+               'height', 'pix_fmt', 'time_base', 'r_frame_rate',
+               'avg_frame_rate', 'level', 'refs', 'sample_rate', 'channels',
+               'channel_layout', 'bit_rate']
+
+STDERR_TAIL_LINES = 50
+READ_CHUNK_SIZE = 1 << 16
+LINE_END = re.compile(rb'\r\n|\r|\n')
+PROGRESS_KEYS = ['frame', 'fps', 'bitrate', 'total_size', 'out_time_us',
+                 'out_time_ms', 'out_time', 'dup_frames', 'drop_frames',
+                 'speed', 'progress']
+
+# path -> (size, mtime_ns, info), shared by every thread of the process
+_probe_cache: Dict[str, tuple] = {}
+_probe_stats = {'hits': 0, 'disk_hits': 0, 'misses': 0}
+_probe_lock = threading.Lock()
+
+
+def get_speed(log: str) -> Union[float, None]:
+    # last speed reported in ffmpeg stats, e.g. 'speed=12.3x'
+    speeds = re.findall(r'speed=\s*([\d.]+)x', log)
+    return float(speeds[-1]) if speeds else None
 
 
 def run_command(cmd: str) -> str:
-    process = s.Popen(cmd, shell=True, stdout=s.PIPE, stderr=s.PIPE)
-    output, error = process.communicate()
-    if error != b'':
-        error_str = error.decode("utf-8")
-        if not error_str.startswith("ffmpeg version"):
-            raise ValueError(error_str)
+    with sched.admit([cmd]) as (cmd,), \
+            m.span(cmd.split(' ', 1)[0], kind='process', cmd=cmd) as span:
+        process = s.Popen(cmd, shell=True, stdout=s.PIPE, stderr=s.PIPE)
+        output, error = process.communicate()
+        if m.is_enabled():
+            span.set(speed=get_speed(error.decode("utf-8", "replace")))
+    # ffmpeg logs to stderr on success too, only the exit code is reliable
+    if process.returncode != 0:
+        raise ValueError(error.decode("utf-8"))
     return output.decode("utf-8").strip()
 
 
+def get_argv(cmd: Union[str, list]) -> list:
+    return shlex.split(cmd) if isinstance(cmd, str) else list(cmd)
+
+
+def get_progress_argv(argv: list) -> list:
+    # progress can only go to stdout if the output itself doesn't
+    if os.path.basename(argv[0]) != 'ffmpeg' or 'pipe:1' in argv:
+        return argv
+    return argv[:1] + ['-nostats', '-progress', 'pipe:1'] + argv[1:]
+
+
+def parse_progress(progress: dict) -> dict:
+    def to_float(value: str) -> float:
+        try:
+            return float(str(value).rstrip('x'))
+        except ValueError:
+            return 0.0
+
+    return {
+        'time': to_float(progress.get('out_time_us', 0)) / 1e6,
+        'speed': to_float(progress.get('speed', 0)),
+        'fps': to_float(progress.get('fps', 0)),
+        'bytes': int(to_float(progress.get('total_size', 0))),
+        'done': progress.get('progress') == 'end',
+    }
+
+
+async def read_lines(stream: 'Union[asyncio.StreamReader, None]',
+                     on_line) -> bool:
+    if stream is None:
+        # not piped, nothing to read
+        return True
+    # read in chunks, ffmpeg ends stats lines with \r only and readline
+    # fails once a line outgrows the stream's 64 KiB limit
+    buffer = b''
+    while True:
+        chunk = await stream.read(READ_CHUNK_SIZE)
+        if not chunk:
+            if buffer:
+                on_line(buffer.decode("utf-8", errors="replace").rstrip())
+            return True
+        lines = LINE_END.split(buffer + chunk)
+        buffer = lines.pop()
+        if buffer == b'' and chunk.endswith(b'\r'):
+            # \r\n may be split across chunks
+            buffer = lines.pop() + b'\r'
+        for line in lines:
+            on_line(line.decode("utf-8", errors="replace").rstrip())
+
+
+async def run_command_async(cmd: Union[str, list], on_progress=None,
+                            timeout=None) -> str:
+    # argv is rewritten with the thread count the budget admitted
+    async with sched.admit_async([shlex.join(get_argv(cmd))]) as (line,):
+        argv = shlex.split(line)
+        with m.span(argv[0], kind='process', cmd=line) as span:
+            return await run_argv_async(argv, on_progress, timeout, span)
+
+
+async def run_argv_async(argv: list, on_progress, timeout, span) -> str:
+    # deferred to async callers, asyncio is the slowest import of this module
+    import asyncio
+
+    last_progress = {}
+    if on_progress is not None or m.is_enabled():
+        argv = get_progress_argv(argv)
+    process = await asyncio.create_subprocess_exec(
+        *argv, stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE)
+    has_progress = on_progress is not None or '-progress' in argv
+    output = []
+    # keep only the end of stderr, ffmpeg can log a lot on long renders
+    errors: Deque[str] = collections.deque(maxlen=STDERR_TAIL_LINES)
+    progress = {}
+
+    def on_output(line: str):
+        key, sep, value = line.partition('=')
+        if has_progress and sep and key in PROGRESS_KEYS:
+            progress[key] = value.strip()
+            if key == 'progress':
+                last_progress.update(parse_progress(progress))
+                if on_progress is not None:
+                    on_progress(dict(last_progress))
+        else:
+            output.append(line)
+
+    try:
+        await asyncio.wait_for(asyncio.gather(
+            read_lines(process.stdout, on_output),
+            read_lines(process.stderr, errors.append),
+            process.wait()), timeout)
+    except asyncio.TimeoutError:
+        raise TimeoutError(f"Command timed out after {timeout} s: "
+                           f"{' '.join(argv)}")
+    finally:
+        # timed out or cancelled, don't leave ffmpeg running
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+    span.set(speed=last_progress.get('speed'))
+    if process.returncode != 0:
+        raise ValueError('\n'.join(errors))
+    return '\n'.join(output).strip()
+
+
+def run_pipeline(cmds: list) -> bool:
+    with sched.admit(cmds) as cmds, \
+            m.span('pipeline', kind='process', cmd=' | '.join(cmds),
+                   processes=len(cmds)):
+        return run_pipeline_processes(cmds)
+
+
+def run_pipeline_processes(cmds: list) -> bool:
+    # stdout of every command feeds stdin of the next one, so data between
+    # stages only lives in pipe buffers
+    processes = []
+    errors = []
+    stdin = None
+    for i, cmd in enumerate(cmds):
+        stdout = s.PIPE if i < len(cmds) - 1 else s.DEVNULL
+        # stderr goes to files so a chatty stage can't block the others
+        error = tempfile.TemporaryFile()
+        # the first stage must not read the terminal or the caller's stdin
+        process = s.Popen(cmd, shell=True,
+                          stdin=s.DEVNULL if stdin is None else stdin,
+                          stdout=stdout, stderr=error)
+        if stdin is not None:
+            # let the upstream stage get SIGPIPE if this one exits
+            stdin.close()
+        stdin = process.stdout
+        processes.append(process)
+        errors.append(error)
+    failed = []
+    for cmd, process, error in zip(cmds, processes, errors):
+        process.wait()
+        error.seek(0)
+        error_str = error.read().decode("utf-8")
+        error.close()
+        if process.returncode != 0:
+            failed.append(f'{cmd}\n{error_str}')
+    if failed:
+        raise ValueError('\n'.join(failed))
+    return True
+
+
 def check_existing_file(f_path: Union[os.PathLike, str]) -> bool:
     if not os.path.isfile(f_path):
         raise ValueError(f'Input file does not exist: {f_path}')
@@ -49,10 +237,104 @@ def get_video_length_cmd(f_path: Union[os.PathLike, str]) -> str:
     return cmd
 
 
+def get_media_info_cmd(f_path: Union[os.PathLike, str]) -> str:
+    check_existing_file(f_path)
+    return f'ffprobe -i {f_path} -show_format -show_streams -v quiet ' \
+           f'-of json'
+
+
+def get_frame_rate(rate: str) -> float:
+    num, _, den = str(rate).partition('/')
+    try:
+        return round(float(num) / float(den or 1), 3)
+    except (ValueError, ZeroDivisionError):
+        return 0.0
+
+
+def parse_media_info(output: str) -> dict:
+    probe = json.loads(output) if output != '' else {}
+    streams = [{k: st[k] for k in STREAM_KEYS if k in st}
+               for st in probe.get('streams', [])]
+    video = next((st for st in streams if st.get('codec_type') == 'video'),
+                 {})
+    return {
+        'duration': float(probe.get('format', {}).get('duration', 0)),
+        'frame_rate': get_frame_rate(video.get('avg_frame_rate', '0/0')),
+        'streams': streams,
+    }
+
+
+def get_probe_cache_path() -> str:
+    return os.path.join(cache.get_cache_folder(), PROBE_CACHE_FILE)
+
+
+def connect_probe_cache() -> sqlite3.Connection:
+    con = sqlite3.connect(get_probe_cache_path(), timeout=30)
+    con.execute('CREATE TABLE IF NOT EXISTS probe (path TEXT PRIMARY KEY, '
+                'size INTEGER, mtime_ns INTEGER, info TEXT)')
+    return con
+
+
+def read_probe_cache(f_path: str, size: int, mtime_ns: int) -> \
+        Union[dict, None]:
+    with closing(connect_probe_cache()) as con:
+        row = con.execute('SELECT size, mtime_ns, info FROM probe WHERE '
+                          'path = ?', (f_path,)).fetchone()
+    if row is None or tuple(row[:2]) != (size, mtime_ns):
+        return None
+    return json.loads(row[2])
+
+
+def write_probe_cache(f_path: str, size: int, mtime_ns: int,
+                      info: dict) -> bool:
+    with closing(connect_probe_cache()) as con, con:
+        con.execute('INSERT OR REPLACE INTO probe VALUES (?, ?, ?, ?)',
+                    (f_path, size, mtime_ns, json.dumps(info)))
+    return True
+
+
+def get_media_info(f_path: Union[os.PathLike, str]) -> dict:
+    check_existing_file(f_path)
+    abs_path, size, mtime_ns = cache.get_file_fingerprint(f_path)
+    with _probe_lock:
+        entry = _probe_cache.get(abs_path)
+        if entry is not None and entry[:2] == (size, mtime_ns):
+            _probe_stats['hits'] += 1
+            return entry[2]
+    info = None
+    stat = 'disk_hits'
+    if PROBE_CACHE_PERSIST:
+        info = read_probe_cache(abs_path, size, mtime_ns)
+    if info is None:
+        stat = 'misses'
+        output = run_command(get_media_info_cmd(f_path))
+        info = parse_media_info(output)
+        if PROBE_CACHE_PERSIST:
+            write_probe_cache(abs_path, size, mtime_ns, info)
+    with _probe_lock:
+        _probe_stats[stat] += 1
+        _probe_cache[abs_path] = (size, mtime_ns, info)
+    return info
+
+
+def get_probe_stats() -> dict:
+    with _probe_lock:
+        return dict(_probe_stats)
+
+
+def clear_probe_cache(persistent=False) -> bool:
+    with _probe_lock:
+        _probe_cache.clear()
+        for key in _probe_stats:
+            _probe_stats[key] = 0
+    if persistent:
+        delete_existing_file(get_probe_cache_path())
+    return True
+
+
 def get_video_length(f_path: Union[os.PathLike, str]) -> float:
-    cmd = get_video_length_cmd(f_path)
-    output = run_command(cmd)
-    video_length = round(float(output if output != '' else 0), 2)
+    info = get_media_info(f_path)
+    video_length = round(info['duration'], 2)
     return video_length
 
 
@@ -69,7 +351,10 @@ def check_time_stamps(f_in: Union[os.PathLike, str], t_start: str,
                       t_end: str) -> bool:
     sec_start = get_seconds(t_start)
     sec_end = get_seconds(t_end)
-    sec_total = get_video_length(f_in)
+    # editor.index builds on this module, a built index saves the probe
+    import editor.index as idx
+    index = idx.get_index(f_in, build=False)
+    sec_total = round(index.duration, 2) if index else get_video_length(f_in)
     if sec_start > sec_end:
         raise ValueError(f"Ending time ({t_end}) is after start time ("
                          f"{t_start})")
@@ -80,21 +365,55 @@ def check_time_stamps(f_in: Union[os.PathLike, str], t_start: str,
 
 
 def trim_video_cmd(f_in: Union[os.PathLike, str], f_out: Union[os.PathLike, str],
-                   t_start: str, t_end: str) -> str:
+                   t_start: str, t_end: str, overwrite=True) -> str:
     check_existing_file(f_in)
-    delete_existing_file(f_out)
+    if overwrite:
+        delete_existing_file(f_out)
     check_extension(f_in)
     check_extension(f_out)
     check_time_stamps(f_in, t_start, t_end)
-    return f'ffmpeg -ss {t_start} -i {f_in} -t {t_end} -c copy {f_out}'
+    # -t takes the clip duration, not the end time
+    duration = get_seconds(t_end) - get_seconds(t_start)
+    return f'ffmpeg -ss {t_start} -i {f_in} -t {duration} -c copy {f_out}'
 
 
-def merge_videos_cmd(files_path: str, f_out: str) -> str:
+def merge_videos_cmd(files_path: str, f_out: str, overwrite=True) -> str:
     check_existing_file(files_path)
-    delete_existing_file(f_out)
+    if overwrite:
+        delete_existing_file(f_out)
     return f'ffmpeg -f concat -safe 0 -i {files_path} -c copy {f_out}'
 
 
+def concat_stream_cmd(files_path: str) -> str:
+    check_existing_file(files_path)
+    return f'ffmpeg -nostdin -f concat -safe 0 -i {files_path} -c copy ' \
+           f'-f mpegts pipe:1'
+
+
+def merge_stream_cmd(files_path: str, f_out: str) -> str:
+    # -nostdin keeps key presses from eating the streamed body, the concat
+    # list still reads it as pipe:0, parts are MPEG-TS so ADTS audio goes
+    # back to the mp4 layout, concat only opens file entries unless pipe is
+    # whitelisted
+    check_existing_file(files_path)
+    delete_existing_file(f_out)
+    return f'ffmpeg -nostdin -protocol_whitelist file,pipe,crypto,data ' \
+           f'-f concat -safe 0 -i {files_path} -c copy ' \
+           f'-bsf:a aac_adtstoasc {f_out}'
+
+
+def add_audio_stream_cmd(f_audio: str, video_length: float,
+                         fade_out=0) -> str:
+    check_existing_file(f_audio)
+    a_filter = ''
+    if fade_out > 0:
+        video_length_mod = round(video_length) - fade_out
+        a_filter = f'-af "afade=t=out:st={video_length_mod}:d={fade_out}" '
+    return f'ffmpeg -f mpegts -i pipe:0 -i {f_audio} -vcodec copy ' \
+           f'{a_filter}-acodec aac -map 0:v:0 -map 1:a:0 -shortest ' \
+           f'-f mpegts pipe:1'
+
+
 def add_audio_cmd(f_in: str, f_audio: str, f_out: str, fade_out=0):
     a_filter = '-acodec copy'
     if fade_out > 0:
@@ -104,3 +423,45 @@ def add_audio_cmd(f_in: str, f_audio: str, f_out: str, fade_out=0):
     return f'ffmpeg -i {f_in} -i {f_audio} -vcodec copy {a_filter} -map ' \
            f'0:v:0 -map 1:a:0 -shortest {f_out}'
 
+
+def check_segments(segments: list) -> int:
+    # segments: [(f_in, t_start, t_end), ...] cut from raw sources
+    if not segments:
+        raise ValueError('No segments to render!')
+    total_length = 0
+    for f_in, t_start, t_end in segments:
+        check_existing_file(f_in)
+        check_extension(f_in)
+        check_time_stamps(f_in, t_start, t_end)
+        total_length += get_seconds(t_end) - get_seconds(t_start)
+    return total_length
+
+
+def render_fused_cmd(segments: list, f_audio: str, f_intro: str,
+                     f_action: str, f_outro: str, f_out: str,
+                     fade_out=0, overwrite=True) -> str:
+    body_length = check_segments(segments)
+    for f_path in [f_audio, f_intro, f_action, f_outro]:
+        check_existing_file(f_path)
+    check_extension(f_out)
+    inputs = [f'-i {f_intro}']
+    for f_in, t_start, t_end in segments:
+        duration = get_seconds(t_end) - get_seconds(t_start)
+        inputs.append(f'-ss {t_start} -t {duration} -i {f_in}')
+    n = len(segments)
+    i_action, i_outro, i_audio = n + 1, n + 2, n + 3
+    inputs += [f'-i {f_action}', f'-i {f_outro}', f'-i {f_audio}']
+    body = ''.join(f'[{i}:v:0]' for i in range(1, n + 1))
+    a_filter = f'atrim=0:{body_length},asetpts=PTS-STARTPTS'
+    if fade_out > 0:
+        a_filter += f',afade=t=out:st={body_length - fade_out}:d={fade_out}'
+    graph = f'{body}concat=n={n}:v=1:a=0[body];' \
+            f'[{i_audio}:a:0]{a_filter}[music];' \
+            f'[0:v:0][0:a:0][body][music]' \
+            f'[{i_action}:v:0][{i_action}:a:0]' \
+            f'[{i_outro}:v:0][{i_outro}:a:0]concat=n=4:v=1:a=1[v][a]'
+    if overwrite:
+        delete_existing_file(f_out)
+    return f'ffmpeg {" ".join(inputs)} -filter_complex "{graph}" ' \
+           f'-map "[v]" -map "[a]" -c:v libx264 -c:a aac ' \
+           f'-movflags +faststart {f_out}'
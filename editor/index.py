@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+
+import hashlib
+import io
+import os
+import shlex
+import threading
+
+import numpy as np
+
+from typing import Dict, Union
+
+import editor.cache as cache
+import editor.ffmpeg as ff
+
+INDEX_FOLDER = 'index'
+PACKET_COLUMNS = ['codec_type', 'pts_time', 'duration_time', 'size', 'pos',
+                  'flags']
+
+_indexes: Dict[str, 'PacketIndex'] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_packets_cmd(f_in: Union[os.PathLike, str]) -> str:
+    ff.check_existing_file(f_in)
+    # one packet scan of the whole file, nothing is decoded
+    return f'ffprobe -i {shlex.quote(str(f_in))} -show_entries ' \
+           f'packet={",".join(PACKET_COLUMNS)} -v quiet -of csv="p=0"'
+
+
+def get_index_path(f_in: Union[os.PathLike, str]) -> str:
+    key = hashlib.sha1(os.path.abspath(f_in).encode('utf-8')).hexdigest()
+    return os.path.join(cache.get_cache_folder(INDEX_FOLDER), key + '.npz')
+
+
+class PacketIndex:
+
+    def __init__(self, pts: np.ndarray, keyframe: np.ndarray,
+                 pos: np.ndarray, size: np.ndarray, duration: float,
+                 fingerprint=None):
+        # packets of all streams sorted by pts, keyframe flags video only
+        self.pts = pts
+        self.keyframe = keyframe
+        self.pos = pos
+        self.size = size
+        self.duration = duration
+        self.fingerprint = fingerprint
+        self.keyframes = pts[keyframe]
+        self._bytes = np.concatenate([[0], np.cumsum(size)])
+
+    @classmethod
+    def from_packets(cls, output: str, fingerprint=None):
+        import pandas as pd
+
+        df = pd.read_csv(io.StringIO(output), names=PACKET_COLUMNS,
+                         na_values=['N/A'])
+        df = df.dropna(subset=['pts_time']).sort_values(by='pts_time',
+                                                        kind='stable')
+        pts = df['pts_time'].to_numpy(dtype=np.float64)
+        keyframe = ((df['codec_type'] == 'video')
+                    & df['flags'].astype(str).str.contains('K')).to_numpy()
+        end = pts + df['duration_time'].fillna(0).to_numpy(dtype=np.float64)
+        return cls(pts, keyframe,
+                   df['pos'].fillna(-1).to_numpy(dtype=np.int64),
+                   df['size'].fillna(0).to_numpy(dtype=np.int64),
+                   float(end.max()) if len(end) else 0.0, fingerprint)
+
+    @classmethod
+    def read(cls, f_path: str):
+        with np.load(f_path) as data:
+            return cls(data['pts'], data['keyframe'], data['pos'],
+                       data['size'], float(data['duration']),
+                       tuple(data['fingerprint'].tolist()))
+
+    def write(self, f_path: str) -> bool:
+        # written next to the final path and renamed, readers never see a
+        # partial sidecar
+        f_tmp = f'{f_path}.{os.getpid()}.{threading.get_ident()}.npz'
+        np.savez(f_tmp, pts=self.pts, keyframe=self.keyframe, pos=self.pos,
+                 size=self.size, duration=self.duration,
+                 fingerprint=np.array(self.fingerprint, dtype=np.int64))
+        os.replace(f_tmp, f_path)
+        return True
+
+    def get_keyframe_before(self, sec: float) -> float:
+        i = np.searchsorted(self.keyframes, sec, side='right') - 1
+        return float(self.keyframes[max(i, 0)]) if len(self.keyframes) \
+            else 0.0
+
+    def get_keyframes(self, sec_start: float, sec_end: float) -> list:
+        i = np.searchsorted(self.keyframes, sec_start, side='left')
+        j = np.searchsorted(self.keyframes, sec_end, side='right')
+        return self.keyframes[i:j].tolist()
+
+    def get_bytes(self, sec_start: float, sec_end: float) -> int:
+        i = np.searchsorted(self.pts, sec_start, side='left')
+        j = np.searchsorted(self.pts, sec_end, side='left')
+        return int(self._bytes[j] - self._bytes[i])
+
+
+def get_index(f_in: Union[os.PathLike, str], build=True) -> \
+        Union[PacketIndex, None]:
+    if not os.path.isfile(f_in):
+        return None
+    abs_path, size, mtime_ns = cache.get_file_fingerprint(f_in)
+    fingerprint = (size, mtime_ns)
+    with _indexes_lock:
+        index = _indexes.get(abs_path)
+    if index is not None and index.fingerprint == fingerprint:
+        return index
+    index = None
+    f_path = get_index_path(f_in)
+    if os.path.isfile(f_path):
+        index = PacketIndex.read(f_path)
+        if index.fingerprint != fingerprint:
+            index = None
+    if index is None:
+        if not build:
+            return None
+        output = ff.run_command(get_packets_cmd(f_in))
+        index = PacketIndex.from_packets(output, fingerprint)
+        index.write(f_path)
+    with _indexes_lock:
+        _indexes[abs_path] = index
+    return index
+
+
+def get_source_index(f_in: Union[os.PathLike, str]) -> PacketIndex:
+    # for callers that can't go on without one
+    index = get_index(f_in)
+    if index is None:
+        raise ValueError(f'Input file does not exist: {f_in}')
+    return index
+
+
+def clear_indexes() -> bool:
+    with _indexes_lock:
+        _indexes.clear()
+    return True
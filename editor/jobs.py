@@ -0,0 +1,297 @@
+#!/usr/bin/env python
+
+import argparse
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+import pandas as pd
+
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing
+from typing import Union
+
+import editor.batch as b
+import editor.catalog as cat
+import editor.clips as c
+import editor.scheduler as sched
+import editor.workspace as ws
+
+QUEUE_FILE = os.path.join('data', 'jobs.sqlite')
+JOB_STATES = ['pending', 'running', 'done', 'failed']
+JOB_STAGES = ['trim', 'merge', 'audio', 'final']
+JOB_COLUMNS = ['Id', 'VideoId', 'State', 'Attempts', 'Owner', 'FileName',
+               'Error']
+LEASE_SECONDS = 600
+MAX_ATTEMPTS = 3
+
+
+def connect_queue(f_path=QUEUE_FILE) -> sqlite3.Connection:
+    # autocommit, claims open their own write transaction
+    con = sqlite3.connect(f_path, timeout=60, isolation_level=None)
+    con.execute('CREATE TABLE IF NOT EXISTS job (id INTEGER PRIMARY KEY, '
+                'video_id INTEGER UNIQUE, state TEXT, options TEXT, '
+                'attempts INTEGER, max_attempts INTEGER, owner TEXT, '
+                'lease_expires REAL, result TEXT, error TEXT, updated REAL)')
+    con.execute('CREATE TABLE IF NOT EXISTS stage (job_id INTEGER, '
+                'name TEXT, result TEXT, updated REAL, '
+                'PRIMARY KEY (job_id, name))')
+    return con
+
+
+def get_owner() -> str:
+    # unique across machines sharing the queue file
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def enqueue(video_ids: list, options=None, max_attempts=MAX_ATTEMPTS,
+            force=False, f_path=QUEUE_FILE) -> int:
+    # queued videos are kept as they are unless forced, a restarted batch
+    # does not redo finished work
+    rows = [(video_id, 'pending', json.dumps(options or {}), 0, max_attempts,
+             time.time()) for video_id in video_ids]
+    verb = 'INSERT OR REPLACE' if force else 'INSERT OR IGNORE'
+    with closing(connect_queue(f_path)) as con:
+        con.execute('BEGIN IMMEDIATE')
+        if force:
+            con.executemany('DELETE FROM stage WHERE job_id IN (SELECT id '
+                            'FROM job WHERE video_id = ?)',
+                            [(video_id,) for video_id in video_ids])
+        n_before = con.total_changes
+        con.executemany(f'{verb} INTO job (video_id, state, options, '
+                        f'attempts, max_attempts, updated) VALUES '
+                        f'(?, ?, ?, ?, ?, ?)', rows)
+        n_added = con.total_changes - n_before
+        con.execute('COMMIT')
+    return n_added
+
+
+def claim(owner: str, lease=LEASE_SECONDS, f_path=QUEUE_FILE) -> \
+        Union[dict, None]:
+    now = time.time()
+    with closing(connect_queue(f_path)) as con:
+        # one writer at a time, two workers never claim the same job
+        con.execute('BEGIN IMMEDIATE')
+        # expired leases belong to crashed workers and are given up
+        con.execute("UPDATE job SET state = 'failed', owner = NULL, "
+                    "error = 'lease expired' WHERE state = 'running' AND "
+                    "lease_expires < ? AND attempts >= max_attempts", (now,))
+        row = con.execute("SELECT id, video_id, options, attempts FROM job "
+                          "WHERE state = 'pending' OR (state = 'running' AND "
+                          "lease_expires < ?) ORDER BY id LIMIT 1",
+                          (now,)).fetchone()
+        if row is None:
+            con.execute('COMMIT')
+            return None
+        con.execute("UPDATE job SET state = 'running', owner = ?, "
+                    "lease_expires = ?, attempts = attempts + 1, "
+                    "updated = ? WHERE id = ?",
+                    (owner, now + lease, now, row[0]))
+        con.execute('COMMIT')
+    return {'id': row[0], 'video_id': row[1], 'options': json.loads(row[2]),
+            'attempts': row[3] + 1}
+
+
+def renew(job_id: int, owner: str, lease=LEASE_SECONDS,
+          f_path=QUEUE_FILE) -> bool:
+    with closing(connect_queue(f_path)) as con:
+        cursor = con.execute("UPDATE job SET lease_expires = ? WHERE id = ? "
+                             "AND owner = ? AND state = 'running'",
+                             (time.time() + lease, job_id, owner))
+        return cursor.rowcount == 1
+
+
+def finish(job_id: int, owner: str, result=None, error=None,
+           f_path=QUEUE_FILE) -> bool:
+    # failed jobs go back to pending until they run out of attempts
+    state = "'done'" if error is None else \
+        "CASE WHEN attempts < max_attempts THEN 'pending' ELSE 'failed' END"
+    with closing(connect_queue(f_path)) as con:
+        cursor = con.execute(f"UPDATE job SET state = {state}, owner = NULL, "
+                             f"lease_expires = NULL, result = ?, error = ?, "
+                             f"updated = ? WHERE id = ? AND owner = ?",
+                             (result, error, time.time(), job_id, owner))
+        return cursor.rowcount == 1
+
+
+def get_stages(job_id: int, f_path=QUEUE_FILE) -> dict:
+    with closing(connect_queue(f_path)) as con:
+        rows = con.execute('SELECT name, result FROM stage WHERE job_id = ?',
+                           (job_id,)).fetchall()
+    return {name: json.loads(result) for name, result in rows}
+
+
+def record_stage(job_id: int, name: str, result, f_path=QUEUE_FILE) -> bool:
+    with closing(connect_queue(f_path)) as con:
+        con.execute('INSERT OR REPLACE INTO stage VALUES (?, ?, ?, ?)',
+                    (job_id, name, json.dumps(result), time.time()))
+    return True
+
+
+def has_outputs(result) -> bool:
+    f_paths = result if isinstance(result, list) else [result]
+    return all(os.path.isfile(f) for f in f_paths)
+
+
+def run_stage(name: str, video_id: int, result, options: dict):
+    if name == 'trim':
+        clips = cat.get_catalog().get_clips(video_id)
+        return c.trim_clips(clips, options.get('trim_workers'),
+                            incremental=True,
+                            smart=options.get('smart_cut', False))
+    if name == 'merge':
+        return c.merge_clips(result, video_id, incremental=True)
+    if name == 'audio':
+        return c.add_audio(result, video_id, incremental=True)
+    return c.add_intro_outro(result, video_id, incremental=True)
+
+
+def run_job(job: dict, owner: str, lease=LEASE_SECONDS, f_path=QUEUE_FILE,
+            lost=None) -> Union[str, None]:
+    # finished stages are skipped on resume, the interrupted one is an
+    # incremental build and reuses whatever its previous run completed
+    lost = lost or threading.Event()
+    done = get_stages(job['id'], f_path)
+    result = None
+    rerun = False
+    for name in JOB_STAGES:
+        # stages after a re-run one consume new outputs and run again
+        if not rerun and name in done and has_outputs(done[name]):
+            result = done[name]
+            continue
+        # once the lease is lost the job may run on another worker, its
+        # results are no longer ours to record
+        if lost.is_set():
+            return None
+        rerun = True
+        result = run_stage(name, job['video_id'], result, job['options'])
+        if lost.is_set() or not renew(job['id'], owner, lease, f_path):
+            lost.set()
+            return None
+        record_stage(job['id'], name, result, f_path)
+    return result
+
+
+def keep_lease(job_id: int, owner: str, lease: float, f_path: str,
+               stop: threading.Event, lost: threading.Event) -> None:
+    while not stop.wait(lease / 3):
+        if not renew(job_id, owner, lease, f_path):
+            lost.set()
+            return
+
+
+def work(f_path=QUEUE_FILE, lease=LEASE_SECONDS, max_jobs=None) -> int:
+    owner = get_owner()
+    n_jobs = 0
+    while max_jobs is None or n_jobs < max_jobs:
+        job = claim(owner, lease, f_path)
+        if job is None:
+            break
+        stop = threading.Event()
+        lost = threading.Event()
+        heartbeat = threading.Thread(target=keep_lease, daemon=True,
+                                     args=(job['id'], owner, lease, f_path,
+                                           stop, lost))
+        heartbeat.start()
+        try:
+            # stage outputs are kept for resumes, old ones go over budget
+            # once the job is done
+            with ws.pinned():
+                f_out = run_job(job, owner, lease, f_path, lost)
+            if not lost.is_set():
+                finish(job['id'], owner, result=f_out, f_path=f_path)
+        except Exception as e:
+            if not lost.is_set():
+                finish(job['id'], owner, error=f'{type(e).__name__}: {e}',
+                       f_path=f_path)
+        finally:
+            stop.set()
+            heartbeat.join()
+        n_jobs += 1
+    return n_jobs
+
+
+def retry_failed(f_path=QUEUE_FILE) -> int:
+    with closing(connect_queue(f_path)) as con:
+        cursor = con.execute("UPDATE job SET state = 'pending', "
+                             "attempts = 0, error = NULL, updated = ? "
+                             "WHERE state = 'failed'", (time.time(),))
+        return cursor.rowcount
+
+
+def get_jobs(f_path=QUEUE_FILE) -> pd.DataFrame:
+    with closing(connect_queue(f_path)) as con:
+        rows = con.execute('SELECT id, video_id, state, attempts, owner, '
+                           'result, error FROM job ORDER BY id').fetchall()
+    return pd.DataFrame(rows, columns=JOB_COLUMNS)
+
+
+def get_status(f_path=QUEUE_FILE) -> dict:
+    counts = get_jobs(f_path)['State'].value_counts()
+    return {state: int(counts.get(state, 0)) for state in JOB_STATES}
+
+
+def parse_args(args=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Render videos through a '
+                                                 'crash-resumable job queue')
+    parser.add_argument('--queue', default=QUEUE_FILE,
+                        help=f'queue database (default: {QUEUE_FILE})')
+    commands = parser.add_subparsers(dest='command', required=True)
+    add = commands.add_parser('enqueue', help='queue videos for rendering')
+    add.add_argument('videos', nargs='*',
+                     help='video IDs or ranges to render (e.g. 1 3-5)')
+    add.add_argument('--all', action='store_true',
+                     help='queue every VideoId found in clips.csv')
+    add.add_argument('--trim-workers', type=int, default=None)
+    add.add_argument('--smart-cut', action='store_true')
+    add.add_argument('--max-attempts', type=int, default=MAX_ATTEMPTS)
+    add.add_argument('--force', action='store_true',
+                     help='queue videos again even if already done')
+    worker = commands.add_parser('work', help='render queued videos')
+    worker.add_argument('-j', '--workers', type=int, default=1,
+                        help='number of worker processes (default: 1)')
+    worker.add_argument('--lease', type=float, default=LEASE_SECONDS,
+                        help='seconds before a silent worker loses its job')
+    worker.add_argument('--cores', type=int, default=None,
+                        help='cores shared by all ffmpeg processes '
+                             '(default: number of CPUs)')
+    commands.add_parser('status', help='print queued jobs')
+    commands.add_parser('retry', help='queue failed jobs again')
+    return parser.parse_args(args)
+
+
+def main(args=None) -> int:
+    parsed = parse_args(args)
+    if parsed.command == 'enqueue':
+        if parsed.all:
+            video_ids = cat.get_catalog().get_video_ids()
+        else:
+            video_ids = b.parse_video_ids(parsed.videos)
+        options = {'trim_workers': parsed.trim_workers,
+                   'smart_cut': parsed.smart_cut}
+        n_added = enqueue(video_ids, options, parsed.max_attempts,
+                          parsed.force, parsed.queue)
+        print(f'{n_added} jobs queued')
+    elif parsed.command == 'work':
+        budget = sched.CoreBudget(parsed.cores)
+        with ProcessPoolExecutor(max_workers=parsed.workers,
+                                 initializer=sched.set_budget,
+                                 initargs=(budget,)) as executor:
+            futures = [executor.submit(work, parsed.queue, parsed.lease)
+                       for _ in range(parsed.workers)]
+            n_jobs = sum(future.result() for future in futures)
+        print(f'{n_jobs} jobs processed')
+    elif parsed.command == 'retry':
+        print(f'{retry_failed(parsed.queue)} jobs queued again')
+    else:
+        print(get_jobs(parsed.queue).to_string(index=False))
+    status = get_status(parsed.queue)
+    print(', '.join(f'{state}: {n}' for state, n in status.items()))
+    return 1 if status['failed'] else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
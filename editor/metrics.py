@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+
+import json
+import os
+import resource
+import threading
+import time
+
+from typing import List, Union
+
+METRICS_ENV = 'EDITOR_METRICS'
+
+_state = {'enabled': False, 'f_path': None}
+_records: List[dict] = []
+_lock = threading.Lock()
+
+
+def enable(f_path=None) -> bool:
+    _state['enabled'] = True
+    _state['f_path'] = f_path
+    if f_path:
+        # worker processes inherit the environment and log to the same file
+        os.environ[METRICS_ENV] = os.path.abspath(f_path)
+    return True
+
+
+def disable() -> bool:
+    _state['enabled'] = False
+    _state['f_path'] = None
+    os.environ.pop(METRICS_ENV, None)
+    with _lock:
+        _records.clear()
+    return True
+
+
+def is_enabled() -> bool:
+    return bool(_state['enabled'])
+
+
+def get_size(f_paths: Union[list, str, None]) -> int:
+    if f_paths is None:
+        return 0
+    if isinstance(f_paths, (str, os.PathLike)):
+        f_paths = [f_paths]
+    return sum(os.path.getsize(f) for f in f_paths if os.path.isfile(f))
+
+
+def emit(record: dict) -> bool:
+    with _lock:
+        _records.append(record)
+        if _state['f_path']:
+            with open(_state['f_path'], 'a') as f:
+                f.write(json.dumps(record, default=str) + '\n')
+    return True
+
+
+def get_records() -> list:
+    with _lock:
+        return list(_records)
+
+
+class Span:
+
+    def __init__(self, name: str, kind: str, f_in=None, f_out=None,
+                 **attrs):
+        self.name = name
+        self.kind = kind
+        self.attrs = dict(attrs, f_in=f_in, f_out=f_out)
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        self.start = time.time()
+        self.t_start = time.perf_counter()
+        # children rusage is process wide: exact for serial work, shared
+        # between spans that run concurrently
+        self.usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        wall = time.perf_counter() - self.t_start
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        f_in = self.attrs.pop('f_in')
+        f_out = self.attrs.pop('f_out')
+        record = {
+            'name': self.name,
+            'kind': self.kind,
+            'pid': os.getpid(),
+            'start': self.start,
+            'wall': round(wall, 6),
+            'cpu_user': round(usage.ru_utime - self.usage.ru_utime, 6),
+            'cpu_sys': round(usage.ru_stime - self.usage.ru_stime, 6),
+            'max_rss_kb': usage.ru_maxrss,
+            'bytes_in': get_size(f_in),
+            'bytes_out': get_size(f_out),
+            'error': repr(exc_value) if exc_value is not None else None,
+        }
+        record.update(self.attrs)
+        emit(record)
+        return False
+
+
+class NullSpan:
+
+    def set(self, **attrs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+NULL_SPAN = NullSpan()
+
+
+def span(name: str, kind='stage', f_in=None, f_out=None, **attrs) -> \
+        Union[Span, NullSpan]:
+    if not _state['enabled']:
+        # disabled instrumentation costs a flag check
+        return NULL_SPAN
+    return Span(name, kind, f_in, f_out, **attrs)
+
+
+def read_records(f_path: str) -> list:
+    with open(f_path, 'r') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def get_summary(records: list):
+    import pandas as pd
+
+    columns = ['wall', 'cpu_user', 'cpu_sys', 'bytes_in', 'bytes_out']
+    df = pd.DataFrame(records)
+    if df.empty:
+        return pd.DataFrame(columns=['kind', 'name', 'count'] + columns)
+    if 'speed' not in df.columns:
+        df['speed'] = None
+    df['speed'] = pd.to_numeric(df['speed'], errors='coerce')
+    groups = df.groupby(['kind', 'name'])
+    summary = groups[columns].sum()
+    summary.insert(0, 'count', groups.size())
+    summary['max_rss_kb'] = groups['max_rss_kb'].max()
+    summary['speed'] = groups['speed'].mean()
+    return summary.reset_index().sort_values(by=['kind', 'wall'],
+                                             ascending=[False, False])
+
+
+if os.environ.get(METRICS_ENV):
+    enable(os.environ[METRICS_ENV])
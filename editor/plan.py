@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+
+import os
+import time
+
+import pandas as pd
+
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, \
+    wait
+from typing import Dict
+
+import editor.batch as b
+import editor.clips as c
+import editor.dataframe as d
+import editor.ffmpeg as ff
+import editor.index as idx
+import editor.scheduler as sched
+import editor.workspace as ws
+
+NODE_KINDS = ['trim', 'merge', 'audio', 'final']
+PLAN_COLUMNS = ['Node', 'Kind', 'Videos', 'Output', 'Inputs', 'Seconds',
+                'Bytes', 'Command']
+
+
+class Node:
+
+    def __init__(self, key: tuple, kind: str, f_out: str, inputs: list,
+                 deps: list, seconds: float, row=None, video_id=None,
+                 cmd=None, n_bytes=None):
+        self.key = key
+        self.kind = kind
+        self.f_out = f_out
+        # files the node reads, deps are the nodes producing some of them
+        self.inputs = inputs
+        self.deps = deps
+        self.seconds = seconds
+        self.row = row
+        self.video_id = video_id
+        self.video_ids = [video_id] if video_id is not None else []
+        # later stages probe their inputs, their command is only known
+        # once the inputs exist
+        self.cmd = cmd
+        self.n_bytes = n_bytes
+
+
+def get_trim_key(row: pd.Series, smart: bool) -> tuple:
+    f_in, _ = c.get_trim_file_paths(row)
+    return 'trim', os.path.abspath(f_in), row['TimeStart'], row['TimeEnd'], \
+        smart
+
+
+def get_trim_bytes(f_in: str, sec_start: float, sec_end: float):
+    # only estimated when the source has a packet index already
+    index = idx.get_index(f_in, build=False)
+    return index.get_bytes(sec_start, sec_end) if index else None
+
+
+def add_node(nodes: dict, owners: dict, node: Node) -> Node:
+    # identical nodes are merged, different work on one output is an error
+    owner = owners.setdefault(os.path.abspath(node.f_out), node.key)
+    if owner != node.key:
+        raise ValueError(f"Conflicting nodes write {node.f_out}: {owner} "
+                         f"and {node.key}")
+    if node.key in nodes:
+        nodes[node.key].video_ids += node.video_ids
+        return nodes[node.key]
+    nodes[node.key] = node
+    return node
+
+
+def plan_trim(nodes: dict, owners: dict, row: pd.Series, video_id: int,
+              smart: bool) -> Node:
+    key = get_trim_key(row, smart)
+    if key in nodes:
+        nodes[key].video_ids.append(video_id)
+        return nodes[key]
+    f_in, f_out = c.get_trim_file_paths(row)
+    sec_start = ff.get_seconds(row['TimeStart'])
+    sec_end = ff.get_seconds(row['TimeEnd'])
+    cmd = None if smart else ff.trim_video_cmd(
+        f_in, f_out, row['TimeStart'], row['TimeEnd'], overwrite=False)
+    return add_node(nodes, owners, Node(
+        key, 'trim', f_out, [f_in], [], sec_end - sec_start, row=row,
+        video_id=video_id, cmd=cmd,
+        n_bytes=get_trim_bytes(f_in, sec_start, sec_end)))
+
+
+def plan_video(nodes: dict, owners: dict, clips: pd.DataFrame,
+               video_id: int, smart=False) -> Node:
+    trims = [plan_trim(nodes, owners, row, video_id, smart)
+             for i, row in clips.sort_values(by=['Id']).iterrows()]
+    f_name = c.get_video(video_id, 'Name')
+    seconds = sum(node.seconds for node in trims)
+    n_bytes = None if any(node.n_bytes is None for node in trims) else \
+        sum(node.n_bytes for node in trims)
+    f_merged = c.get_output_file_path(f_name, 'merged', video_id=video_id)
+    # only trims are shared, later stages belong to one video even when
+    # another cuts the same clips
+    merge = add_node(nodes, owners, Node(
+        ('merge', video_id), 'merge', f_merged,
+        [node.f_out for node in trims], [node.key for node in trims],
+        seconds, video_id=video_id, n_bytes=n_bytes))
+    f_sound = c.get_output_file_path(f_name, 'sound', video_id=video_id)
+    audio = add_node(nodes, owners, Node(
+        ('audio', video_id), 'audio', f_sound,
+        [f_merged, c.get_audio_file_path()], [merge.key], seconds,
+        video_id=video_id))
+    f_final = c.get_output_file_path(f_name, '', 'final', video_id)
+    return add_node(nodes, owners, Node(
+        ('final', video_id), 'final', f_final,
+        [f_sound] + c.get_bumper_file_paths(), [audio.key], seconds,
+        video_id=video_id))
+
+
+def plan_videos(df_clips: pd.DataFrame, video_ids: list,
+                smart=False) -> dict:
+    d.has_columns(df_clips, ['VideoId', 'Id'], raise_error=True)
+    nodes: Dict[tuple, Node] = {}
+    owners: Dict[str, tuple] = {}
+    groups = dict(tuple(df_clips.groupby('VideoId')))
+    for video_id in video_ids:
+        if video_id not in groups:
+            raise ValueError(f"No clips found for Video ID {video_id}!")
+        plan_video(nodes, owners, groups[video_id], video_id, smart)
+    return nodes
+
+
+def get_order(nodes: dict) -> list:
+    # Kahn's algorithm, nodes become ready once all their deps are done
+    n_deps = {key: len(node.deps) for key, node in nodes.items()}
+    users: Dict[tuple, list] = {key: [] for key in nodes}
+    for key, node in nodes.items():
+        for dep in node.deps:
+            users[dep].append(key)
+    ready = [key for key, n in n_deps.items() if n == 0]
+    order = []
+    while ready:
+        key = ready.pop(0)
+        order.append(key)
+        for user in users[key]:
+            n_deps[user] -= 1
+            if n_deps[user] == 0:
+                ready.append(user)
+    if len(order) != len(nodes):
+        raise ValueError('Render plan has a cycle!')
+    return order
+
+
+def get_plan_table(nodes: dict) -> pd.DataFrame:
+    rows = []
+    for i, key in enumerate(get_order(nodes)):
+        node = nodes[key]
+        rows.append([i, node.kind, ','.join(map(str, node.video_ids)),
+                     node.f_out, len(node.inputs), round(node.seconds, 2),
+                     node.n_bytes, node.cmd or ''])
+    return pd.DataFrame(rows, columns=PLAN_COLUMNS)
+
+
+def get_plan_cost(nodes: dict) -> dict:
+    # media seconds each stage reads, the main driver of its run time
+    cost = {kind: 0.0 for kind in NODE_KINDS}
+    for node in nodes.values():
+        cost[node.kind] += node.seconds
+    cost['total'] = sum(cost.values())
+    return {kind: round(seconds, 2) for kind, seconds in cost.items()}
+
+
+def run_node(node: Node, outputs: dict, incremental=False,
+             smart=False) -> str:
+    dep_outputs = [outputs[dep] for dep in node.deps]
+    if node.kind == 'trim':
+        return c.trim_clip(node.row, incremental=incremental, smart=smart)
+    if node.kind == 'merge':
+        return c.merge_clips(dep_outputs, node.video_id,
+                             incremental=incremental)
+    if node.kind == 'audio':
+        return c.add_audio(dep_outputs[0], node.video_id, incremental)
+    return c.add_intro_outro(dep_outputs[0], node.video_id, incremental)
+
+
+def run_plan(nodes: dict, max_workers=None, incremental=False,
+             smart=False) -> dict:
+    # every node starts as soon as its deps are done, failures only skip
+    # the nodes depending on them
+    order = get_order(nodes)
+    outputs: Dict[tuple, str] = {}
+    errors: Dict[tuple, str] = {}
+    pending = list(order)
+    running: Dict[Future, tuple] = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while pending or running:
+            for key in list(pending):
+                node = nodes[key]
+                failed = [dep for dep in node.deps if dep in errors]
+                if failed:
+                    errors[key] = errors[failed[0]]
+                    pending.remove(key)
+                elif all(dep in outputs for dep in node.deps):
+                    running[executor.submit(run_node, node, outputs,
+                                            incremental, smart)] = key
+                    pending.remove(key)
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                key = running.pop(future)
+                try:
+                    outputs[key] = future.result()
+                except Exception as e:
+                    errors[key] = f'{type(e).__name__}: {e}'
+    return {'outputs': outputs, 'errors': errors}
+
+
+def get_video_results(nodes: dict, result: dict,
+                      seconds=None) -> pd.DataFrame:
+    rows = []
+    for key, node in nodes.items():
+        if node.kind != 'final':
+            continue
+        error = result['errors'].get(key)
+        for video_id in node.video_ids:
+            rows.append({'VideoId': video_id, 'Success': error is None,
+                         'FileName': result['outputs'].get(key),
+                         'Error': error, 'Seconds': seconds})
+    df = pd.DataFrame(rows, columns=b.RESULT_COLUMNS)
+    return df.sort_values(by=['VideoId']).reset_index(drop=True)
+
+
+def render_videos(df_clips: pd.DataFrame, video_ids: list, max_workers=None,
+                  incremental=False, smart_cut=False,
+                  cores=None) -> pd.DataFrame:
+    t_start = time.perf_counter()
+    # every node runs in this process, its threads share one core budget
+    sched.set_budget(sched.CoreBudget(cores))
+    # one scratch folder for the whole graph, trims are shared by videos
+    scratch = ws.pinned() if incremental else ws.workspace(
+        video_ids, ws.get_job_bytes(
+            [segment for video_id in video_ids
+             for segment in c.get_segments(df_clips, video_id)]))
+    with scratch:
+        nodes = plan_videos(df_clips, video_ids, smart_cut)
+        result = run_plan(nodes, max_workers, incremental, smart_cut)
+    return get_video_results(nodes, result,
+                             round(time.perf_counter() - t_start, 2))
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+
+import fcntl
+import hashlib
+import json
+import os
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Union
+
+import editor.cache as cache
+import editor.ffmpeg as ff
+import editor.metrics as m
+
+PROXY_FOLDER = 'proxies'
+PROXY_HEIGHT = 360
+# every frame a keyframe, stream copy trims of a proxy are frame accurate
+PROXY_ARGS = '-c:v libx264 -preset ultrafast -crf 28 -g 1 -pix_fmt yuv420p ' \
+             '-c:a aac -b:a 96k -movflags +faststart'
+
+# max_workers -> executor, each size is created once and reused
+_executors: Dict[Union[int, None], ThreadPoolExecutor] = {}
+_executors_lock = threading.Lock()
+
+
+def get_proxy_key(f_in: Union[os.PathLike, str]) -> str:
+    payload = json.dumps({'source': cache.get_file_fingerprint(f_in),
+                          'height': PROXY_HEIGHT, 'args': PROXY_ARGS},
+                         sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def get_proxy_path(f_in: Union[os.PathLike, str]) -> str:
+    return os.path.join(cache.get_cache_folder(PROXY_FOLDER),
+                        get_proxy_key(f_in) + '.mp4')
+
+
+def proxy_cmd(f_in: Union[os.PathLike, str], f_out: str) -> str:
+    # timestamps are kept, cut points of the source apply to the proxy
+    return f'ffmpeg -i {f_in} -map 0:v:0 -map "0:a:0?" ' \
+           f'-vf "scale=-2:\'min({PROXY_HEIGHT},ih)\'" {PROXY_ARGS} {f_out}'
+
+
+def get_proxy(f_in: Union[os.PathLike, str]) -> str:
+    ff.check_existing_file(f_in)
+    f_out = get_proxy_path(f_in)
+    if os.path.isfile(f_out):
+        return f_out
+    # one build per source, other renders and threads wait for it
+    f_lock = f_out + '.lock'
+    with open(f_lock, 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            if os.path.isfile(f_out):
+                return f_out
+            f_tmp = f'{os.path.splitext(f_out)[0]}.{os.getpid()}.' \
+                    f'{threading.get_ident()}.mp4'
+            try:
+                with m.span('proxy', f_in=f_in, f_out=f_tmp):
+                    ff.run_command(proxy_cmd(f_in, f_tmp))
+                os.replace(f_tmp, f_out)
+            finally:
+                ff.delete_existing_file(f_tmp)
+        finally:
+            # removed while still held, waiters on it find the proxy built
+            ff.delete_existing_file(f_lock)
+            fcntl.flock(lock, fcntl.LOCK_UN)
+    return f_out
+
+
+def get_executor(max_workers=None) -> ThreadPoolExecutor:
+    with _executors_lock:
+        executor = _executors.get(max_workers)
+        if executor is None:
+            executor = _executors[max_workers] = ThreadPoolExecutor(
+                max_workers=max_workers, thread_name_prefix='proxy')
+        return executor
+
+
+def start_proxies(f_list: list, max_workers=None) -> dict:
+    # source -> future, proxies build in the background while the caller
+    # goes on, the core budget decides how many encode at once
+    executor = get_executor(max_workers)
+    return {f_in: executor.submit(get_proxy, f_in)
+            for f_in in dict.fromkeys(f_list)}
+
+
+def get_proxies(f_list: list, max_workers=None) -> dict:
+    futures = start_proxies(f_list, max_workers)
+    return {f_in: future.result() for f_in, future in futures.items()}
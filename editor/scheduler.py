@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+
+import multiprocessing
+import os
+import shlex
+
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, Union
+
+CODEC_OPTIONS = ['-c', '-codec', '-c:v', '-c:a', '-vcodec', '-acodec']
+FILTER_OPTIONS = ['-vf', '-af', '-filter:v', '-filter:a', '-filter_complex']
+JOB_THREADS_MAX = 4
+IO_SLOTS_PER_CORE = 2
+
+_state: Dict[str, Union['CoreBudget', None]] = {'budget': None}
+
+
+def get_kind(cmd: str) -> str:
+    # stream copies and probes wait on the disk, decoding, filtering and
+    # encoding wait on the CPU
+    argv = shlex.split(cmd)
+    if not argv or os.path.basename(argv[0]) != 'ffmpeg':
+        return 'io'
+    codecs = [argv[i + 1] for i, arg in enumerate(argv[:-1])
+              if arg in CODEC_OPTIONS]
+    if any(arg in FILTER_OPTIONS for arg in argv):
+        return 'cpu'
+    # without codec options ffmpeg encodes with its defaults
+    if not codecs or any(codec != 'copy' for codec in codecs):
+        return 'cpu'
+    return 'io'
+
+
+def get_job_threads(cores: int) -> int:
+    # encoders scale sublinearly, a few narrow jobs beat one wide job
+    return max(1, min(JOB_THREADS_MAX, cores // 2))
+
+
+def set_threads(cmd: str, threads: int) -> str:
+    # output option, goes right before the output file which may be quoted
+    i = cmd.rfind(" '", 0, len(cmd) - 1) if cmd.endswith("'") else \
+        cmd.rfind(' ')
+    return f'{cmd[:i]} -threads {threads}{cmd[i:]}'
+
+
+class CoreBudget:
+
+    def __init__(self, cores=None, io_slots=None, context=None):
+        context = context or multiprocessing.get_context()
+        self.cores = cores or os.cpu_count() or 1
+        self.io_slots = io_slots or self.cores * IO_SLOTS_PER_CORE
+        self.job_threads = get_job_threads(self.cores)
+        # process shared, so workers of a pool draw from one budget
+        self._cores = context.BoundedSemaphore(self.cores)
+        self._io = context.BoundedSemaphore(self.io_slots)
+        self._lock = context.Lock()
+
+    def acquire(self, kind: str, threads: int) -> bool:
+        if kind == 'io':
+            return self._io.acquire()
+        # cores of one job are taken together, two half admitted jobs
+        # can't block each other
+        with self._lock:
+            for _ in range(threads):
+                self._cores.acquire()
+        return True
+
+    def release(self, kind: str, threads: int) -> bool:
+        if kind == 'io':
+            self._io.release()
+            return True
+        for _ in range(threads):
+            self._cores.release()
+        return True
+
+
+def get_budget() -> CoreBudget:
+    budget = _state['budget']
+    if budget is None:
+        budget = _state['budget'] = CoreBudget()
+    return budget
+
+
+def set_budget(budget: Union[CoreBudget, None]) -> bool:
+    # pool initializer, workers use the budget of the parent
+    _state['budget'] = budget
+    return True
+
+
+def get_admission(budget: CoreBudget, cmds: list) -> tuple:
+    # kind and threads to take from the budget, and the commands with
+    # thread counts set
+    kinds = [get_kind(cmd) for cmd in cmds]
+    n_cpu = kinds.count('cpu')
+    threads = max(1, min(budget.job_threads, budget.cores // max(n_cpu, 1)))
+    kind = 'cpu' if n_cpu else 'io'
+    n_threads = min(threads * n_cpu, budget.cores) if n_cpu else 1
+    return kind, n_threads, [set_threads(cmd, threads) if k == 'cpu' else cmd
+                             for cmd, k in zip(cmds, kinds)]
+
+
+@contextmanager
+def admit(cmds: list):
+    # waits until the budget has room for all commands, which run
+    # concurrently, and yields them with thread counts set
+    budget = get_budget()
+    kind, n_threads, cmds = get_admission(budget, cmds)
+    budget.acquire(kind, n_threads)
+    try:
+        yield cmds
+    finally:
+        budget.release(kind, n_threads)
+
+
+@asynccontextmanager
+async def admit_async(cmds: list):
+    # same as admit, waiting in a thread so the event loop keeps running
+    import asyncio
+
+    budget = get_budget()
+    kind, n_threads, cmds = get_admission(budget, cmds)
+    acquire = asyncio.ensure_future(
+        asyncio.to_thread(budget.acquire, kind, n_threads))
+    try:
+        await asyncio.shield(acquire)
+    except asyncio.CancelledError:
+        # the thread still gets its share, give it back once it does
+        acquire.add_done_callback(
+            lambda _: budget.release(kind, n_threads))
+        raise
+    try:
+        yield cmds
+    finally:
+        budget.release(kind, n_threads)
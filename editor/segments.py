@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+
+import argparse
+import os
+import shlex
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Union
+
+import editor.ffmpeg as ff
+import editor.index as idx
+import editor.scheduler as sched
+import editor.smartcut as sc
+
+# shorter chunks spend more on encoder start up than they save
+MIN_CHUNK_LENGTH = 10
+AUDIO_ARGS = '-c:a aac'
+# bit rates differ between chunked and serial rate control
+CHECK_KEYS = [k for k in ff.STREAM_KEYS
+              if k not in ['index', 'avg_frame_rate', 'bit_rate']]
+
+
+def get_chunk_count(duration: float) -> int:
+    # as many encoders as the core budget runs side by side
+    budget = sched.get_budget()
+    n_jobs = max(1, budget.cores // budget.job_threads)
+    return max(1, min(n_jobs, int(duration // MIN_CHUNK_LENGTH)))
+
+
+def get_chunks(keyframes: list, sec_start: float, sec_end: float,
+               n_chunks: int) -> list:
+    # [(start, end), ...] split at the keyframes closest to even splits, so
+    # every chunk decodes from its own keyframe
+    inner = [k for k in keyframes if sec_start < k < sec_end]
+    points = [sec_start]
+    for i in range(1, n_chunks if inner else 1):
+        target = sec_start + (sec_end - sec_start) * i / n_chunks
+        k = min(inner, key=lambda k: abs(k - target))
+        if k > points[-1]:
+            points.append(k)
+    points.append(sec_end)
+    return list(zip(points[:-1], points[1:]))
+
+
+def get_chunk_path(f_out: Union[os.PathLike, str], i: int) -> str:
+    f_name, f_ext = os.path.splitext(f_out)
+    return f'{f_name}_chunk{i:02}{f_ext}'
+
+
+def get_chunks_list_path(f_out: Union[os.PathLike, str]) -> str:
+    return os.path.splitext(f_out)[0] + '_chunks.txt'
+
+
+def get_part_path(f_out: Union[os.PathLike, str]) -> str:
+    f_name, f_ext = os.path.splitext(f_out)
+    return f'{f_name}.part{f_ext}'
+
+
+def encode_cmd(f_in: Union[os.PathLike, str], f_out: str, sec_start: float,
+               sec_end: float, video_args: str, audio_args: str) -> str:
+    # the serial encode, also the reference parallel encodes are checked
+    # against
+    return f'ffmpeg -ss {sec_start:.6f} -i {shlex.quote(str(f_in))} ' \
+           f'-t {sec_end - sec_start:.6f} -map 0:v:0 -map "0:a:0?" ' \
+           f'{video_args} {audio_args} {shlex.quote(f_out)}'
+
+
+def chunk_cmd(f_in: Union[os.PathLike, str], f_out: str, sec_start: float,
+              sec_end: float, video_args: str) -> str:
+    return f'ffmpeg -ss {sec_start:.6f} -i {shlex.quote(str(f_in))} ' \
+           f'-t {sec_end - sec_start:.6f} -map 0:v:0 {video_args} ' \
+           f'{shlex.quote(f_out)}'
+
+
+def concat_cmd(f_in: Union[os.PathLike, str], list_path: str, f_out: str,
+               sec_start: float, sec_end: float, audio_args: str) -> str:
+    # audio is cheap and encoded once, chunked AAC would gap at every split
+    return f'ffmpeg -f concat -safe 0 -i {shlex.quote(list_path)} ' \
+           f'-ss {sec_start:.6f} -t {sec_end - sec_start:.6f} ' \
+           f'-i {shlex.quote(str(f_in))} -map 0:v:0 -map "1:a:0?" ' \
+           f'-c:v copy {audio_args} {shlex.quote(f_out)}'
+
+
+def encode(f_in: Union[os.PathLike, str], f_out: Union[os.PathLike, str],
+           video_args: str, audio_args=AUDIO_ARGS, sec_start=0.0,
+           sec_end=None, n_chunks=None) -> str:
+    # video_args may only hold codec options and per frame filters, state
+    # across frames (fades, fps changes) would restart at every chunk
+    ff.check_existing_file(f_in)
+    ff.check_extension(f_out)
+    index = idx.get_source_index(f_in)
+    sec_end = index.duration if sec_end is None else sec_end
+    n_chunks = n_chunks or get_chunk_count(sec_end - sec_start)
+    chunks = get_chunks(index.keyframes.tolist(), sec_start, sec_end,
+                        n_chunks)
+    f_part = get_part_path(f_out)
+    parts = [get_chunk_path(f_out, i) for i in range(len(chunks))]
+    list_path = get_chunks_list_path(f_out)
+    try:
+        if len(chunks) == 1:
+            ff.run_command(encode_cmd(f_in, f_part, sec_start, sec_end,
+                                      video_args, audio_args))
+        else:
+            cmds = [chunk_cmd(f_in, part, start, end, video_args)
+                    for part, (start, end) in zip(parts, chunks)]
+            # the core budget decides how many chunks encode at once
+            with ThreadPoolExecutor(max_workers=len(cmds)) as executor:
+                list(executor.map(ff.run_command, cmds))
+            with open(list_path, 'w') as f:
+                f.write("\r\n".join(f"file '{os.path.abspath(part)}'"
+                                    for part in parts))
+            ff.run_command(concat_cmd(f_in, list_path, f_part, sec_start,
+                                      sec_end, audio_args))
+        os.replace(f_part, f_out)
+    finally:
+        for f_path in parts + [list_path, f_part]:
+            ff.delete_existing_file(f_path)
+    return str(f_out)
+
+
+def check_encode(f_out: Union[os.PathLike, str],
+                 f_reference: Union[os.PathLike, str]) -> list:
+    # problems keeping f_out from standing in for the serial encode
+    info = ff.get_media_info(f_out)
+    reference = ff.get_media_info(f_reference)
+    problems = []
+    # chunk edges may round to a frame
+    tolerance = 1 / reference['frame_rate'] if reference['frame_rate'] \
+        else 0.1
+    if abs(info['duration'] - reference['duration']) > tolerance:
+        problems.append(f"duration {info['duration']} != "
+                        f"{reference['duration']}")
+    if len(info['streams']) != len(reference['streams']):
+        problems.append(f"{len(info['streams'])} streams != "
+                        f"{len(reference['streams'])}")
+    for i, (stream, ref) in enumerate(zip(info['streams'],
+                                          reference['streams'])):
+        for key in CHECK_KEYS:
+            if stream.get(key) != ref.get(key):
+                problems.append(f'stream {i} {key} {stream.get(key)} != '
+                                f'{ref.get(key)}')
+    return problems
+
+
+def verify_encode(f_in: Union[os.PathLike, str],
+                  f_out: Union[os.PathLike, str], video_args: str,
+                  audio_args=AUDIO_ARGS, sec_start=0.0, sec_end=None) -> \
+        list:
+    # encodes the same range serially and compares it with f_out
+    f_name, f_ext = os.path.splitext(f_out)
+    f_serial = f'{f_name}_serial{f_ext}'
+    sec_end = idx.get_source_index(f_in).duration if sec_end is None \
+        else sec_end
+    try:
+        ff.run_command(encode_cmd(f_in, f_serial, sec_start, sec_end,
+                                  video_args, audio_args))
+        return check_encode(f_out, f_serial)
+    finally:
+        ff.delete_existing_file(f_serial)
+
+
+def parse_args(args=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Re-encode a file in '
+                                                 'parallel chunks')
+    parser.add_argument('f_in')
+    parser.add_argument('f_out')
+    parser.add_argument('--video-args', default=None,
+                        help='encoder options (default: the codec, pixel '
+                             'format and profile of f_in)')
+    parser.add_argument('--audio-args', default=AUDIO_ARGS)
+    parser.add_argument('--chunks', type=int, default=None,
+                        help='number of chunks (default: fits the cores)')
+    parser.add_argument('--verify', action='store_true',
+                        help='compare with a serial encode of f_in')
+    return parser.parse_args(args)
+
+
+def main(args=None) -> int:
+    parsed = parse_args(args)
+    video_args = parsed.video_args or \
+        sc.get_encode_args(ff.get_media_info(parsed.f_in))
+    encode(parsed.f_in, parsed.f_out, video_args, parsed.audio_args,
+           n_chunks=parsed.chunks)
+    print(parsed.f_out)
+    if not parsed.verify:
+        return 0
+    problems = verify_encode(parsed.f_in, parsed.f_out, video_args,
+                             parsed.audio_args)
+    for problem in problems:
+        print(problem)
+    print(f'{len(problems)} differences to a serial encode')
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+
+import math
+import os
+
+from typing import Union
+
+import editor.ffmpeg as ff
+import editor.index as idx
+
+ENCODERS = {'h264': 'libx264', 'hevc': 'libx265', 'mpeg4': 'mpeg4'}
+PROFILES = {'High': 'high', 'Main': 'main', 'Baseline': 'baseline',
+            'Constrained Baseline': 'baseline'}
+# ffprobe reports level 4.1 as 41 for h264 and as 123 for hevc
+LEVEL_SCALES = {'h264': 10, 'hevc': 30}
+
+
+def get_cut_plan(keyframes: list, sec_start: float, sec_end: float) -> list:
+    # [(start, end, copy), ...]: partial GOPs at both edges are re-encoded,
+    # the keyframe aligned middle is copied
+    inner = [k for k in keyframes if sec_start <= k <= sec_end]
+    if len(inner) < 2 or inner[0] >= inner[-1]:
+        return [(sec_start, sec_end, False)]
+    k_first, k_last = inner[0], inner[-1]
+    plan = []
+    if sec_start < k_first:
+        plan.append((sec_start, k_first, False))
+    plan.append((k_first, k_last, True))
+    if k_last < sec_end:
+        plan.append((k_last, sec_end, False))
+    return plan
+
+
+def get_encode_args(info: dict) -> str:
+    # re-encoded edges must match the copied middle to be concatenated
+    video: dict = next((st for st in info['streams']
+                        if st.get('codec_type') == 'video'), {})
+    codec = video.get('codec_name', 'h264')
+    if codec not in ENCODERS:
+        raise ValueError(f"Smart cut is not supported for codec '{codec}' "
+                         f"(supported codecs: [{','.join(ENCODERS)}])")
+    args = [f'-c:v {ENCODERS[codec]}']
+    if video.get('pix_fmt'):
+        args.append(f"-pix_fmt {video['pix_fmt']}")
+    if video.get('profile') in PROFILES and codec == 'h264':
+        args.append(f"-profile:v {PROFILES[video['profile']]}")
+    if video.get('time_base'):
+        timescale = video['time_base'].split('/')[-1]
+        args.append(f'-video_track_timescale {timescale}')
+    # same level and reference frames as the source, and parameter sets in
+    # every keyframe, as the concat keeps the headers of the first part only
+    level = video.get('level', 0) / LEVEL_SCALES.get(codec, 1)
+    refs = video.get('refs', 0)
+    if codec == 'h264':
+        if level > 0:
+            args.append(f'-level:v {level:g}')
+        if refs > 0:
+            args.append(f'-refs {refs}')
+        args.append('-x264-params repeat-headers=1')
+    elif codec == 'hevc':
+        params = [f'level-idc={level:g}'] if level > 0 else []
+        if refs > 0:
+            params.append(f'ref={refs}')
+        params.append('repeat-headers=1')
+        args.append(f"-x265-params {':'.join(params)}")
+    return ' '.join(args)
+
+
+def get_part_path(f_out: Union[os.PathLike, str], i: int) -> str:
+    f_name, f_ext = os.path.splitext(f_out)
+    return f'{f_name}_part{i:02}{f_ext}'
+
+
+def get_parts_list_path(f_out: Union[os.PathLike, str]) -> str:
+    return os.path.splitext(f_out)[0] + '_parts.txt'
+
+
+def cut_cmd(f_in: Union[os.PathLike, str], f_out: Union[os.PathLike, str],
+            sec_start: float, sec_end: float, copy: bool,
+            encode_args: str) -> str:
+    codec_args = '-c copy' if copy else f'{encode_args} -c:a copy'
+    if copy:
+        # a keyframe rounded below its pts would seek to the keyframe
+        # before it
+        sec_start = math.ceil(round(sec_start * 1e6, 3)) / 1e6
+    return f'ffmpeg -ss {sec_start:.6f} -i {f_in} -t ' \
+           f'{sec_end - sec_start:.6f} {codec_args} ' \
+           f'-avoid_negative_ts make_zero {f_out}'
+
+
+def smart_trim_cmds(f_in: Union[os.PathLike, str],
+                    f_out: Union[os.PathLike, str], t_start: str,
+                    t_end: str, overwrite=True) -> list:
+    ff.check_existing_file(f_in)
+    if overwrite:
+        ff.delete_existing_file(f_out)
+    ff.check_extension(f_in)
+    ff.check_extension(f_out)
+    # the index is built once per source and shared by all its clips
+    index = idx.get_source_index(f_in)
+    ff.check_time_stamps(f_in, t_start, t_end)
+    sec_start = ff.get_seconds(t_start)
+    sec_end = ff.get_seconds(t_end)
+    keyframes = index.get_keyframes(sec_start, sec_end)
+    plan = get_cut_plan(keyframes, sec_start, sec_end)
+    encode_args = get_encode_args(ff.get_media_info(f_in))
+    if len(plan) == 1:
+        start, end, copy = plan[0]
+        return [cut_cmd(f_in, f_out, start, end, copy, encode_args)]
+    cmds = [cut_cmd(f_in, get_part_path(f_out, i), start, end, copy,
+                    encode_args)
+            for i, (start, end, copy) in enumerate(plan)]
+    list_path = get_parts_list_path(f_out)
+    cmds.append(f'ffmpeg -f concat -safe 0 -i {list_path} -c copy {f_out}')
+    return cmds
+
+
+def run_smart_trim(cmds: list, f_out: Union[os.PathLike, str]) -> bool:
+    part_cmds = cmds[:-1] if len(cmds) > 1 else cmds
+    parts = [get_part_path(f_out, i) for i in range(len(cmds) - 1)]
+    list_path = get_parts_list_path(f_out)
+    try:
+        for cmd in part_cmds:
+            ff.run_command(cmd)
+        if parts:
+            with open(list_path, 'w') as f:
+                f.write("\r\n".join(f"file '{os.path.abspath(part)}'"
+                                    for part in parts))
+            ff.run_command(cmds[-1])
+    finally:
+        for f_path in parts + [list_path]:
+            ff.delete_existing_file(f_path)
+    return True
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+
+import hashlib
+import importlib.util
+import json
+import os
+import threading
+
+import pandas as pd
+
+from typing import Dict, Union
+
+import editor.cache as cache
+
+SNAPSHOT_FOLDER = 'snapshots'
+HASH_CHUNK_SIZE = 1 << 20
+
+# path -> (size, mtime_ns, dtype key, DataFrame), shared by every thread
+_snapshots: Dict[str, tuple] = {}
+_snapshots_lock = threading.Lock()
+
+
+def get_format() -> str:
+    # feather needs pyarrow, pickle keeps dtypes just as well without it
+    return 'feather' if importlib.util.find_spec('pyarrow') else 'pickle'
+
+
+def get_file_hash(f_path: Union[os.PathLike, str]) -> str:
+    sha = hashlib.sha256()
+    with open(f_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def get_snapshot_path(f_path: Union[os.PathLike, str], dtype_key: str) -> str:
+    key = hashlib.sha1(f'{os.path.abspath(f_path)}|{dtype_key}'
+                       .encode('utf-8')).hexdigest()
+    return os.path.join(cache.get_cache_folder(SNAPSHOT_FOLDER),
+                        f'{key}.{get_format()}')
+
+
+def parse_source(f_path: Union[os.PathLike, str], dtype=None) -> \
+        pd.DataFrame:
+    if os.path.splitext(f_path)[1].lower() in ['.xlsx', '.xls']:
+        df = pd.read_excel(f_path, dtype=dtype)
+    else:
+        df = pd.read_csv(f_path, dtype=dtype)
+    return df.reset_index(drop=True)
+
+
+def get_snapshot_format(f_snapshot: str, meta=None) -> str:
+    # snapshots of tables feather can't store are pickled under the same path
+    if meta is not None and meta.get('format'):
+        return meta['format']
+    return 'feather' if f_snapshot.endswith('.feather') else 'pickle'
+
+
+def read_snapshot(f_snapshot: str, meta=None) -> pd.DataFrame:
+    if get_snapshot_format(f_snapshot, meta) == 'feather':
+        return pd.read_feather(f_snapshot)
+    return pd.read_pickle(f_snapshot)
+
+
+def write_snapshot(df: pd.DataFrame, f_snapshot: str, meta: dict) -> bool:
+    # written next to the final paths and renamed, readers never see a
+    # partial snapshot
+    f_tmp = f'{f_snapshot}.{os.getpid()}.{threading.get_ident()}'
+    snapshot_format = get_snapshot_format(f_snapshot)
+    try:
+        if snapshot_format == 'feather':
+            try:
+                df.to_feather(f_tmp)
+            except (ValueError, TypeError, NotImplementedError):
+                # e.g. object columns mixing numbers and strings
+                snapshot_format = 'pickle'
+        if snapshot_format == 'pickle':
+            df.to_pickle(f_tmp, compression=None)
+        with open(f_tmp + '.json', 'w') as f:
+            json.dump(dict(meta, format=snapshot_format), f)
+        os.replace(f_tmp, f_snapshot)
+        os.replace(f_tmp + '.json', f_snapshot + '.json')
+    finally:
+        for f_name in [f_tmp, f_tmp + '.json']:
+            if os.path.isfile(f_name):
+                os.remove(f_name)
+    return True
+
+
+def read_meta(f_snapshot: str) -> Union[dict, None]:
+    if not os.path.isfile(f_snapshot) or \
+            not os.path.isfile(f_snapshot + '.json'):
+        return None
+    with open(f_snapshot + '.json') as f:
+        return json.load(f)
+
+
+def load_table(f_path: Union[os.PathLike, str], dtype_key: str,
+               dtype=None) -> pd.DataFrame:
+    _, size, mtime_ns = cache.get_file_fingerprint(f_path)
+    f_snapshot = get_snapshot_path(f_path, dtype_key)
+    meta = read_meta(f_snapshot)
+    if meta is not None and (meta['size'], meta['mtime_ns']) == \
+            (size, mtime_ns):
+        return read_snapshot(f_snapshot, meta)
+    # a touched but unchanged source keeps its snapshot
+    file_hash = get_file_hash(f_path)
+    meta_new = {'size': size, 'mtime_ns': mtime_ns, 'hash': file_hash}
+    if meta is not None and meta['hash'] == file_hash:
+        df = read_snapshot(f_snapshot, meta)
+    else:
+        df = parse_source(f_path, dtype)
+    write_snapshot(df, f_snapshot, meta_new)
+    return df
+
+
+def read_table(f_path: Union[os.PathLike, str], dtype=None) -> pd.DataFrame:
+    abs_path, size, mtime_ns = cache.get_file_fingerprint(f_path)
+    dtype_key = json.dumps(dtype, sort_keys=True, default=str)
+    with _snapshots_lock:
+        entry = _snapshots.get(abs_path)
+    if entry is None or entry[:3] != (size, mtime_ns, dtype_key):
+        df = load_table(f_path, dtype_key, dtype)
+        entry = (size, mtime_ns, dtype_key, df)
+        with _snapshots_lock:
+            _snapshots[abs_path] = entry
+    # callers are free to modify what they get
+    return entry[3].copy()
+
+
+def clear_snapshots() -> bool:
+    with _snapshots_lock:
+        _snapshots.clear()
+    return True
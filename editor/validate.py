@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+
+import os
+
+import numpy as np
+import pandas as pd
+
+import editor.clips as c
+import editor.dataframe as d
+import editor.ffmpeg as ff
+
+PROBLEM_COLUMNS = ['Id', 'VideoId', 'FileName', 'Problem']
+
+
+def parse_time_stamps(sr: pd.Series) -> pd.Series:
+    # NaN marks values that are not formatted as HH:MM:SS
+    parts = sr.astype(str).str.extract(r'^(\d\d):([0-5]\d):([0-5]\d)$')
+    parts = parts.astype(float)
+    return parts[0] * 3600 + parts[1] * 60 + parts[2]
+
+
+def get_source_lengths(file_names: pd.Series) -> pd.Series:
+    # every source is probed once no matter how many clips use it
+    lengths = {}
+    for f_name in file_names.astype(str).unique():
+        f_path = c.get_input_file_path(f_name, folder='raw')
+        if os.path.isfile(f_path):
+            lengths[f_name] = ff.get_video_length(f_path)
+        else:
+            lengths[f_name] = np.nan
+    return file_names.astype(str).map(lengths).astype(float)
+
+
+def get_overlaps(df: pd.DataFrame, start: pd.Series,
+                 end: pd.Series) -> pd.Series:
+    dfs = pd.DataFrame({'VideoId': df['VideoId'],
+                        'FileName': df['FileName'].astype(str),
+                        'Start': start, 'End': end})
+    dfs = dfs.sort_values(by=['VideoId', 'FileName', 'Start'], kind='stable')
+    groups = dfs.groupby(['VideoId', 'FileName'], sort=False)['End']
+    # latest end of every earlier clip cut from the same source
+    prev_end = groups.cummax().groupby([dfs['VideoId'], dfs['FileName']],
+                                       sort=False).shift()
+    overlaps = dfs['Start'] < prev_end
+    return overlaps.reindex(df.index, fill_value=False)
+
+
+def validate_clips(df: pd.DataFrame, check_sources=True) -> pd.DataFrame:
+    d.has_columns(df, ['Id', 'VideoId', 'FileName', 'TimeStart', 'TimeEnd'],
+                  raise_error=True)
+    problems = []
+
+    def add_problem(mask: pd.Series, problem: str):
+        if mask.any():
+            df_problem = df.loc[mask, PROBLEM_COLUMNS[:-1]].copy()
+            df_problem['Problem'] = problem
+            problems.append(df_problem)
+
+    start = parse_time_stamps(df['TimeStart'])
+    end = parse_time_stamps(df['TimeEnd'])
+    add_problem(df.duplicated(['Id'], keep=False), "Duplicate Id")
+    add_problem(start.isna(), "Incorrect time format in TimeStart (valid "
+                              "time format: HH:MM:SS)")
+    add_problem(end.isna(), "Incorrect time format in TimeEnd (valid time "
+                            "format: HH:MM:SS)")
+    add_problem(start > end, "Ending time is before start time")
+    extensions = df['FileName'].astype(str).str.rsplit('.', n=1).str[-1]
+    valid_ext = extensions.str.lower().isin(ff.VALID_EXTENSIONS)
+    add_problem(~valid_ext, f"Unknown extension (valid extensions: "
+                            f"[{','.join(ff.VALID_EXTENSIONS)}])")
+    add_problem(get_overlaps(df, start, end), "Overlaps another clip of the "
+                                              "same source")
+    if check_sources:
+        lengths = get_source_lengths(df['FileName'])
+        add_problem(lengths.isna(), "Input file does not exist")
+        add_problem(end > lengths, "Ending time is longer then video length")
+    if not problems:
+        return pd.DataFrame(columns=PROBLEM_COLUMNS)
+    df_problems = pd.concat(problems)
+    df_problems = df_problems.sort_values(by=['Id'], kind='stable')
+    return df_problems.reset_index(drop=True)
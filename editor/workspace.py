@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+
+import fcntl
+import os
+import re
+import shutil
+import socket
+import threading
+import time
+import uuid
+
+from contextlib import contextmanager
+from typing import Dict, Union
+
+import editor.build as b
+import editor.ffmpeg as ff
+
+SCRATCH_FOLDER_ENV = 'EDITOR_SCRATCH_DIR'
+SCRATCH_BYTES_ENV = 'EDITOR_SCRATCH_BYTES'
+DEFAULT_FOLDER = os.path.join('data', 'videos', 'temp')
+# the scratch option may point at a folder other programs use, e.g. /dev/shm
+OWN_FOLDER = 'video-editor'
+JOBS_FOLDER = '.jobs'
+LOCK_FILE = '.lock'
+RESERVED_FILE = '.reserved'
+# marks jobs building in the shared folder, nothing is evicted while they run
+PINNED_FILE = '.pinned'
+# share of the volume's free space used without an explicit budget
+BUDGET_SHARE = 0.5
+# trimmed clips, the merged body and the body with sound
+JOB_COPIES = 3
+# shared intermediates touched this recently may still be read
+EVICT_MIN_AGE = 60
+POLL_SECONDS = 0.5
+# jobs of other hosts renew their folder this often, or expire after
+JOB_LEASE = 600
+SIZE_UNITS = {'': 1, 'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30, 'T': 1 << 40}
+
+# video ID -> scratch folder of the job rendering it in this process
+_folders: Dict[int, str] = {}
+_folders_lock = threading.Lock()
+
+
+def get_root(default=DEFAULT_FOLDER) -> str:
+    return os.path.join(os.environ.get(SCRATCH_FOLDER_ENV) or default,
+                        OWN_FOLDER)
+
+
+def parse_size(value: str) -> int:
+    match = re.match(r'^(\d+(?:\.\d+)?)\s*([KMGT]?)B?$',
+                     str(value).strip().upper())
+    if not match:
+        raise ValueError(f"Invalid size: '{value}' (e.g. 500M, 4G)")
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2)])
+
+
+def get_budget(root: str, used: int) -> int:
+    if os.environ.get(SCRATCH_BYTES_ENV):
+        return parse_size(os.environ[SCRATCH_BYTES_ENV])
+    return int((shutil.disk_usage(root).free + used) * BUDGET_SHARE)
+
+
+def get_folder(video_id=None) -> Union[str, None]:
+    with _folders_lock:
+        return _folders.get(video_id)
+
+
+def get_job_bytes(segments: list) -> int:
+    # clip bytes scale with their share of the source, every stage keeps
+    # a copy of the body until the job ends
+    n_bytes = 0
+    for f_in, t_start, t_end in segments:
+        if not os.path.isfile(f_in):
+            # ffmpeg reports missing sources
+            continue
+        length = ff.get_video_length(f_in)
+        share = (ff.get_seconds(t_end) - ff.get_seconds(t_start)) / length \
+            if length else 1
+        n_bytes += int(os.path.getsize(f_in) * min(share, 1))
+    return n_bytes * JOB_COPIES
+
+
+def get_size(folder: str) -> int:
+    n_bytes = 0
+    for f_folder, _, f_names in os.walk(folder):
+        for f_name in f_names:
+            try:
+                n_bytes += os.path.getsize(os.path.join(f_folder, f_name))
+            except FileNotFoundError:
+                # removed by its job while counting
+                pass
+    return n_bytes
+
+
+def is_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+@contextmanager
+def locked(root: str):
+    # one admission at a time across every process using the volume
+    with open(os.path.join(root, LOCK_FILE), 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield root
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def get_job_name() -> str:
+    return f'{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex}'
+
+
+def is_expired(folder: str) -> bool:
+    # processes of this host are asked directly, jobs of other hosts
+    # sharing the folder only by their lease
+    host, pid, _ = (os.path.basename(folder).rsplit('-', 2) + ['', ''])[:3]
+    if host == socket.gethostname() and pid.isdigit():
+        return not is_alive(int(pid))
+    try:
+        t_renewed = os.path.getmtime(os.path.join(folder, RESERVED_FILE))
+    except FileNotFoundError:
+        t_renewed = os.path.getmtime(folder)
+    return time.time() - t_renewed > JOB_LEASE
+
+
+def get_jobs(root: str) -> dict:
+    # job folder -> reserved bytes, folders of crashed jobs are removed
+    jobs_folder = os.path.join(root, JOBS_FOLDER)
+    jobs = {}
+    for name in os.listdir(jobs_folder):
+        folder = os.path.join(jobs_folder, name)
+        try:
+            expired = is_expired(folder)
+        except FileNotFoundError:
+            # removed by its job
+            continue
+        if expired:
+            shutil.rmtree(folder, ignore_errors=True)
+            continue
+        try:
+            with open(os.path.join(folder, RESERVED_FILE)) as f:
+                reserved = int(f.read() or 0)
+        except FileNotFoundError:
+            reserved = 0
+        # a job may outgrow its estimate
+        jobs[folder] = max(reserved, get_size(folder))
+    return jobs
+
+
+def has_pinned(jobs: dict) -> bool:
+    return any(os.path.isfile(os.path.join(folder, PINNED_FILE))
+               for folder in jobs)
+
+
+def get_shared_files(root: str) -> list:
+    # [(last use, size, path), ...] reusable intermediates, oldest first,
+    # only outputs of our builds are ever counted or evicted
+    artifacts = b.get_artifacts(root)
+    files = []
+    for entry in os.scandir(root):
+        if not entry.is_file() or os.path.abspath(entry.path) not in \
+                artifacts:
+            continue
+        try:
+            stat = entry.stat()
+        except FileNotFoundError:
+            continue
+        files.append((max(stat.st_atime, stat.st_mtime), stat.st_size,
+                      entry.path))
+    return sorted(files)
+
+
+def evict(root: str, used: int, budget: int) -> int:
+    # drops least recently used shared intermediates until used fits the
+    # budget, incremental builds rebuild them when needed again
+    t_min = time.time() - EVICT_MIN_AGE
+    for t_used, size, f_path in get_shared_files(root):
+        if used <= budget or t_used > t_min:
+            break
+        ff.delete_existing_file(f_path)
+        used -= size
+    return used
+
+
+def trim_shared(root=None) -> int:
+    # keeps reusable intermediates within the budget after a render
+    root = root or get_root()
+    if not os.path.isdir(root):
+        return 0
+    os.makedirs(os.path.join(root, JOBS_FOLDER), exist_ok=True)
+    with locked(root):
+        jobs = get_jobs(root)
+        reserved = sum(jobs.values())
+        shared = sum(size for _, size, _ in get_shared_files(root))
+        used = reserved + shared
+        if has_pinned(jobs):
+            # the last incremental build to finish trims the folder
+            return used
+        return evict(root, used, get_budget(root, used))
+
+
+def admit(root: str, n_bytes: int, pinned=False) -> str:
+    os.makedirs(os.path.join(root, JOBS_FOLDER), exist_ok=True)
+    while True:
+        with locked(root):
+            jobs = get_jobs(root)
+            reserved = sum(jobs.values())
+            shared = sum(size for _, size, _ in get_shared_files(root))
+            budget = get_budget(root, reserved + shared)
+            used = reserved + shared + n_bytes
+            # shared files may be inputs of a running incremental build
+            if not has_pinned(jobs):
+                used = evict(root, used, budget)
+            # a job larger than the budget runs alone instead of never,
+            # incremental builds only wait for the eviction above
+            if used <= budget or not jobs or pinned:
+                folder = os.path.join(root, JOBS_FOLDER, get_job_name())
+                os.makedirs(folder)
+                with open(os.path.join(folder, RESERVED_FILE), 'w') as f:
+                    f.write(str(n_bytes))
+                if pinned:
+                    open(os.path.join(folder, PINNED_FILE), 'w').close()
+                return folder
+        time.sleep(POLL_SECONDS)
+
+
+def keep_lease(folder: str, stop: threading.Event) -> None:
+    while not stop.wait(JOB_LEASE / 3):
+        try:
+            os.utime(os.path.join(folder, RESERVED_FILE))
+        except FileNotFoundError:
+            return
+
+
+@contextmanager
+def leased(folder: str):
+    # other hosts can't tell if our process is alive, the lease tells them
+    stop = threading.Event()
+    thread = threading.Thread(target=keep_lease, args=(folder, stop),
+                              daemon=True)
+    thread.start()
+    try:
+        yield folder
+    finally:
+        stop.set()
+        thread.join()
+
+
+@contextmanager
+def workspace(video_ids: list, n_bytes=0, root=None):
+    # a scratch folder for the intermediates of the videos, waits until the
+    # budget has room and is removed when the job ends, however it ends
+    folder = admit(root or get_root(), n_bytes)
+    with _folders_lock:
+        for video_id in video_ids:
+            _folders[video_id] = folder
+    try:
+        with leased(folder):
+            yield folder
+    finally:
+        with _folders_lock:
+            for video_id in video_ids:
+                if _folders.get(video_id) == folder:
+                    del _folders[video_id]
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+@contextmanager
+def pinned(root=None):
+    # incremental builds write reusable intermediates to the shared folder
+    # and read them back later, they stay until the build ends
+    root = root or get_root()
+    os.makedirs(root, exist_ok=True)
+    folder = admit(root, 0, pinned=True)
+    try:
+        with leased(folder):
+            yield root
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+    trim_shared(root)
@@ -1,20 +1,59 @@
-import moviepy.editor as movie
 import os
 import re
+import shlex
 import pandas as pd
-import datetime
 import time
 
-# open current directory
-os.chdir(os.path.dirname(os.path.realpath(__file__)))
+import editor.ffmpeg as ff
+import editor.segments as seg
+import editor.snapshot as snap
 
-clip_intro = movie.VideoFileClip('input/intro.mp4')
-clip_action = movie.VideoFileClip('input/call-to-action-up.mp4')
-clip_outro = movie.VideoFileClip('input/outro.mp4')
+# paths are relative to this folder, importing doesn't change directory
+FOLDER = os.path.dirname(os.path.realpath(__file__))
+BUMPERS = ['input/intro.mp4', 'input/call-to-action-up.mp4',
+           'input/outro.mp4']
+FPS = 30
+VIDEO_ARGS = '-c:v libx264'
+AUDIO_ARGS = '-c:a aac'
+ENCODE_ARGS = f'{VIDEO_ARGS} {AUDIO_ARGS}'
+INTRO_LENGTH = 4
+CLIP_DATA_COLUMNS = ['Id', 'VideoId', 'ClipId', 'VideoName', 'ClipName',
+                     'ClipPath', 'ExerciseLink', 'ShortLink', 'YoutubeLink',
+                     'CardLinks', 'Tags']
+
+
+def get_path(f_path: str):
+    return os.path.join(FOLDER, f_path)
+
+
+def get_part_path(f_out: str):
+    f_name, f_ext = os.path.splitext(f_out)
+    return f'{f_name}.part{f_ext}'
+
+
+def run_ffmpeg(args: str, f_out: str):
+    # frames stay inside ffmpeg, the output only appears once complete so
+    # an interrupted run is not skipped as done
+    f_part = get_part_path(f_out)
+    ff.delete_existing_file(f_part)
+    try:
+        ff.run_command(f'ffmpeg {args} {shlex.quote(f_part)}')
+        os.replace(f_part, f_out)
+    finally:
+        ff.delete_existing_file(f_part)
+    return f_out
+
+
+def add_intro_outro_args(f_paths: list):
+    inputs = ' '.join(f'-i {shlex.quote(f_path)}' for f_path in f_paths)
+    streams = ''.join(f'[{i}:v:0][{i}:a:0]' for i in range(len(f_paths)))
+    graph = f'{streams}concat=n={len(f_paths)}:v=1:a=1[v][a]'
+    return f'{inputs} -filter_complex "{graph}" -map "[v]" -map "[a]" ' \
+           f'{ENCODE_ARGS}'
 
 
 def get_videos():
-    videos = pd.read_excel('videos.xlsx')
+    videos = snap.read_table(get_path('videos.xlsx'))
     return videos
 
 
@@ -30,19 +69,19 @@ def get_video_column(video_id: int, column: str):
 
 
 def get_clips():
-    clips = pd.read_excel('clips_final.xlsx')
+    clips = snap.read_table(get_path('clips_final.xlsx'))
     return clips
 
 
 def get_video_path(video_id: int):
-    files = os.listdir('input/regi')
+    files = os.listdir(get_path('input/regi'))
     for f_path in files:
         try:
             video_index = int(re.split(' |-', f_path)[0])
         except ValueError:
             video_index = None
         if video_index == video_id:
-            return f'input/regi/{f_path}'
+            return get_path(f'input/regi/{f_path}')
     raise ValueError(f'Video #{video_id} not found.')
 
 
@@ -52,7 +91,7 @@ def get_sec(time_str: str):
         m, s, f = time_str.split(':')
     elif len(time_str.split(':')) == 4:
         h, m, s, f = time_str.split(':')
-    sec_float = int(h) * 3600 + int(m) * 60 + int(s) + int(f) / 30
+    sec_float = int(h) * 3600 + int(m) * 60 + int(s) + int(f) / FPS
     return round(sec_float, ndigits=2)
 
 
@@ -66,42 +105,94 @@ def trim_video_clip(video_id: int, clip_id: int, clip_path: str):
     end_str = video.End.values[0].split('\n')[clip_id]
     start = get_sec(start_str)
     end = get_sec(end_str)
-    trimmed_clip = movie.VideoFileClip(video_path).subclip(start, end)
-    trimmed_clip.write_videofile(clip_path)
+    # long clips are encoded in keyframe aligned chunks side by side
+    seg.encode(video_path, get_path(clip_path), VIDEO_ARGS, AUDIO_ARGS,
+               start, end)
     print(f'Clip exported to {clip_path}')
 
 
-def get_clip_data():
-    videos = get_videos()
-    pd_clips = pd.DataFrame(columns=['Id', 'VideoId', 'ClipId', 'VideoName',
-                                     'ClipName', 'ClipPath', 'ExerciseLink',
-                                     'ShortLink', 'YoutubeLink',
-                                     'CardLinks', 'Tags'])
-    clip_index = 0
-    for index, video in videos.iterrows():
-        for clip_id, clip in enumerate(video.Clips.split('\n')):
-            clip_path = f'output/raw/video{video.Id:02}_clip{clip_id:02}.mp4'
-            clip_name = video.Clips.split('\n')[clip_id]
-            exercise_link = video.ExerciseLink.split('\n')[clip_id]
-            short_link = video.ShortLink.split('\n')[clip_id]
-            card_links = get_card_links(video_id=video.Id, clip_id=clip_id)
-            pd_clip = pd.DataFrame({
-                'Id': [clip_index],
-                'VideoId': [video.Id],
-                'ClipId': [clip_id],
-                'VideoName': [video.Name],
-                'ClipName': [clip_name],
-                'ClipPath': [clip_path],
-                'ExerciseLink': [exercise_link],
-                'ShortLink': [short_link],
-                'YoutubeLink': [video.YoutubeLink],
-                'Tags': [video.Tags],
-                'CardLinks': ['\n'.join(card_links) if len(card_links) > 0
-                              else '']
-            })
-            clip_index = clip_index + 1
-            pd_clips = pd_clips.append(pd_clip, ignore_index=True)
-    return pd_clips
+def explode_column(videos: pd.DataFrame, column: str):
+    # one row per newline separated entry, numbered per video
+    df = videos[['Id', column]].copy()
+    df[column] = df[column].astype(str).str.split('\n')
+    df = df.explode(column, ignore_index=True)
+    df['ClipId'] = df.groupby('Id').cumcount()
+    return df.rename(columns={'Id': 'VideoId'})
+
+
+def get_secs(time_strs: pd.Series):
+    # vectorized get_sec: [HH:]MM:SS:FF, anything else counts as 0
+    if time_strs.empty:
+        return pd.Series(dtype=float, index=time_strs.index)
+    n_parts = time_strs.str.count(':') + 1
+    padded = time_strs.where(n_parts == 4, '0:' + time_strs)
+    padded = padded.where(n_parts.isin([3, 4]), '0:0:0:0')
+    parts = padded.str.split(':', expand=True).astype(int)
+    secs = parts[0] * 3600 + parts[1] * 60 + parts[2] + parts[3] / FPS
+    return secs.round(2)
+
+
+def format_seconds(seconds: pd.Series):
+    # same as str(datetime.timedelta(seconds=...)) below one day
+    seconds = seconds.astype(int)
+    return (seconds // 3600).astype(str) + ':' + \
+        (seconds // 60 % 60).astype(str).str.zfill(2) + ':' + \
+        (seconds % 60).astype(str).str.zfill(2)
+
+
+def get_card_link_table(videos: pd.DataFrame, clips: pd.DataFrame):
+    # clips: VideoId, ClipId, Start, End -> VideoId, ClipId, CardLinks
+    links = explode_column(videos, 'Links').rename(
+        columns={'ClipId': 'LinkId'})
+    parts = links['Links'].str.split('-')
+    links = links[parts.str.len() > 1].copy()
+    parts = parts[links.index]
+    links['LinkVideoId'] = parts.str[1].str.strip().astype(int)
+    links['LinkTime'] = get_secs(parts.str[0].str.strip() + ':00')
+    links = links[links['LinkVideoId'] > 0]
+    # interval join: every link of a video against every clip of it
+    df = clips[['VideoId', 'ClipId']].assign(
+        ClipStart=get_secs(clips['Start']), ClipEnd=get_secs(clips['End']))
+    df = df.merge(links, on='VideoId')
+    inside = (df['LinkTime'] >= df['ClipStart']) & \
+             (df['LinkTime'] <= df['ClipEnd'])
+    df = df[inside].copy()
+    diff = (df['LinkTime'] - df['ClipStart']).round()
+    # links right at the clip start are skipped, as get_time_diff_seconds
+    # returns 0 for them
+    df = df[diff != 0].copy()
+    # only links that end up on a card need their video
+    names = videos.set_index('Id')['Name']
+    unknown = ~df['LinkVideoId'].isin(names.index)
+    if unknown.any():
+        raise ValueError(f"Video ID {df['LinkVideoId'][unknown].iloc[0]} "
+                         f"not found!")
+    df['CardLinks'] = format_seconds(diff[df.index] + INTRO_LENGTH) + \
+        ' - ' + df['LinkVideoId'].astype(str) + '. ' + \
+        df['LinkVideoId'].map(names).astype(str)
+    df = df.sort_values(by=['VideoId', 'ClipId', 'LinkId'], kind='stable')
+    return df.groupby(['VideoId', 'ClipId'], as_index=False, sort=False)[
+        'CardLinks'].agg('\n'.join)
+
+
+def get_clip_data(videos=None):
+    videos = get_videos() if videos is None else videos
+    clips = explode_column(videos, 'Clips').rename(
+        columns={'Clips': 'ClipName'})
+    for column in ['ExerciseLink', 'ShortLink', 'Start', 'End']:
+        clips = clips.merge(explode_column(videos, column),
+                            on=['VideoId', 'ClipId'], how='left')
+    clips = clips.merge(videos[['Id', 'Name', 'YoutubeLink', 'Tags']].rename(
+        columns={'Id': 'VideoId', 'Name': 'VideoName'}), on='VideoId',
+        how='left')
+    clips = clips.merge(get_card_link_table(videos, clips),
+                        on=['VideoId', 'ClipId'], how='left')
+    clips['CardLinks'] = clips['CardLinks'].fillna('')
+    clips['Id'] = range(len(clips.index))
+    clips['ClipPath'] = 'output/raw/video' + \
+        clips['VideoId'].astype(str).str.zfill(2) + '_clip' + \
+        clips['ClipId'].astype(str).str.zfill(2) + '.mp4'
+    return clips[CLIP_DATA_COLUMNS]
 
 
 def trim_video_clips(video_ids: list):
@@ -109,7 +200,7 @@ def trim_video_clips(video_ids: list):
     for index, video in videos[videos.Id.isin(video_ids)].iterrows():
         for clip_id, clip in enumerate(video.Clips.split('\n')):
             clip_path = f'output/raw/video{video.Id:02}_clip{clip_id:02}.mp4'
-            if not os.path.isfile(clip_path):
+            if not os.path.isfile(get_path(clip_path)):
                 trim_video_clip(video_id=video.Id, clip_id=clip_id,
                                 clip_path=clip_path)
             else:
@@ -120,13 +211,10 @@ def add_intro_outro(clip_ids: list):
     clips = get_clips()
     for index, clip in clips[clips.Id.isin(clip_ids)].iterrows():
         final_path = f"output/final/{clip.VideoTitle}.mp4"
-        if not os.path.isfile(final_path):
-            clip_exercise = movie.VideoFileClip(clip.ClipPath)
-            final_clip = movie.concatenate_videoclips([clip_intro,
-                                                       clip_exercise,
-                                                       clip_action,
-                                                       clip_outro])
-            final_clip.write_videofile(final_path)
+        if not os.path.isfile(get_path(final_path)):
+            f_intro, f_action, f_outro = [get_path(f) for f in BUMPERS]
+            f_paths = [f_intro, get_path(clip.ClipPath), f_action, f_outro]
+            run_ffmpeg(add_intro_outro_args(f_paths), get_path(final_path))
             print(f"Clip {clip.Id} exported to {final_path}")
         else:
             print(f'Skipping {final_path} (already done)')
@@ -144,25 +232,10 @@ def get_time_diff_seconds(t_start: str, t_end: str, t_middle: str):
 
 def get_card_links(video_id: int, clip_id: int):
     videos = get_videos()
-    video = videos[videos.Id == video_id].squeeze()
-    clip_start = str(video.Start).split('\n')[clip_id]
-    clip_end = str(video.End).split('\n')[clip_id]
-    card_links = []
-    intro_length = 4
-    for link in str(video.Links).split('\n'):
-        if len(link.split('-')) > 1:
-            link_video_id = int(link.split('-')[1].strip())
-            if link_video_id > 0:
-                link_timestamp = link.split('-')[0].strip()
-                link_diff = get_time_diff_seconds(t_start=clip_start,
-                                                  t_end=clip_end,
-                                                  t_middle=link_timestamp)
-                if link_diff:
-                    total_diff = link_diff + intro_length
-                    str_diff = str(datetime.timedelta(seconds=total_diff))
-                    link_name = get_video_column(video_id=link_video_id,
-                                                 column='Name')
-                    card_link = f'{str_diff} - {link_video_id}.' \
-                                f' {link_name}'
-                    card_links.append(card_link)
-    return card_links
+    clips = explode_column(videos[videos.Id == video_id], 'Start').merge(
+        explode_column(videos[videos.Id == video_id], 'End'),
+        on=['VideoId', 'ClipId'])
+    card_links = get_card_link_table(videos, clips[clips.ClipId == clip_id])
+    if card_links.empty:
+        return []
+    return card_links['CardLinks'].iloc[0].split('\n')
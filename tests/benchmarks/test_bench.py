@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+
+import pandas as pd
+
+import benchmarks.bench as bench
+
+
+def test_generate_video_cmd():
+    cmd = bench.generate_video_cmd('out.mp4', '640x360', 10, 30)
+    assert 'testsrc=size=640x360:rate=30' in cmd
+    assert '-t 10 ' in cmd and '-g 30 ' in cmd
+    assert cmd.endswith(' out.mp4')
+
+
+def test_format_time():
+    assert bench.format_time(3725) == '01:02:05'
+
+
+def test_write_media_data(tmp_path):
+    (tmp_path / 'data').mkdir()
+    assert bench.write_media_data(tmp_path, 20, 10)
+    df = pd.read_csv(tmp_path / 'data' / 'clips.csv')
+    # it should write requested number of one second clips
+    assert len(df.index) == 20
+    assert list(df['Id']) == list(range(1, 21))
+    assert (df['TimeEnd'] <= '00:00:10').all()
+
+
+def test_compare_results():
+    base = {'scenario': 'trim', 'resolution': '640x360', 'duration': 60,
+            'gop': 30, 'clips': 10, 'wall': 1.0, 'processes': 10,
+            'bytes_written': 100, 'peak_rss_kb': 1000}
+    # it should accept noise within threshold
+    assert bench.compare_results([dict(base, wall=1.05)], [base], 0.1) == []
+    # it should flag slower runs and more processes
+    regressions = bench.compare_results(
+        [dict(base, wall=1.5, processes=11)], [base], 0.1)
+    assert [r['metric'] for r in regressions] == ['wall', 'processes']
+    assert regressions[0]['change'] == 0.5
+    # it should ignore cases missing from baseline
+    assert bench.compare_results([dict(base, clips=100)], [base]) == []
+
+
+def test_run_case(tmp_path, mocker):
+    mocker.patch("benchmarks.bench.setup_workspace",
+                 return_value=str(tmp_path))
+    mocker.patch("benchmarks.bench.write_media_data", return_value=True)
+    calls = []
+
+    def run_bench_command(args, workspace, env, stdin=None):
+        calls.append((args, env['EDITOR_CACHE_DIR'], stdin))
+        return ['trim.mp4'] if args[0] == 'prepare' else {'wall': 1.0}
+
+    mocker.patch("benchmarks.bench.run_bench_command",
+                 side_effect=run_bench_command)
+    result = bench.run_case(str(tmp_path), 'merge', '640x360', 10, 30, 1)
+    assert result['scenario'] == 'merge' and result['wall'] == 1.0
+    # it should prepare inputs in a process of their own
+    assert [args for args, _, _ in calls] == [['prepare', 'merge'],
+                                              ['scenario', 'merge']]
+    assert calls[1][2] == b'["trim.mp4"]'
+    # it should give every case fresh caches
+    bench.run_case(str(tmp_path), 'trim', '640x360', 10, 30, 1)
+    assert calls[2][0] == ['scenario', 'trim'] and calls[2][2] == b'null'
+    assert calls[2][1] != calls[0][1]
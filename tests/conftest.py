@@ -0,0 +1,28 @@
+#!/usr/bin/env python
+
+import pytest
+
+import editor.cache as cache
+import editor.ffmpeg as ff
+import editor.index as idx
+import editor.metrics as m
+import editor.scheduler as sched
+import editor.snapshot as snap
+import editor.workspace as ws
+
+
+@pytest.fixture(autouse=True)
+def cache_folder(tmp_path, monkeypatch):
+    # keep caches of every test isolated from data/cache
+    f_path = tmp_path / 'cache'
+    monkeypatch.setenv(cache.CACHE_FOLDER_ENV, str(f_path))
+    monkeypatch.setenv(ws.SCRATCH_FOLDER_ENV, str(tmp_path / 'scratch'))
+    ff.clear_probe_cache()
+    idx.clear_indexes()
+    snap.clear_snapshots()
+    yield f_path
+    ff.clear_probe_cache()
+    idx.clear_indexes()
+    snap.clear_snapshots()
+    sched.set_budget(None)
+    m.disable()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+
+import asyncio
+
+import pandas as pd
+import pytest
+
+import editor.aio as a
+
+
+def test_run_step_async(mocker):
+    run_command = mocker.patch("editor.ffmpeg.run_command_async",
+                               return_value='')
+    # it should run command and return output file
+    assert asyncio.run(a.run_step_async('cmd', 'out.mp4', [])) == 'out.mp4'
+    run_command.assert_called_once_with('cmd', None, None)
+    # it should skip command when build cache has the output
+    mocker.patch("editor.build.get_rebuild_reason", return_value=None)
+    record_build = mocker.patch("editor.build.record_build",
+                                return_value=True)
+    assert asyncio.run(a.run_step_async('cmd', 'out.mp4', [], True)) == \
+           'out.mp4'
+    assert run_command.call_count == 1
+    assert record_build.call_args[0][2] == 'reused'
+
+
+def test_trim_clips_async(mocker):
+    df = pd.DataFrame(data={'Id': [3, 1, 2]})
+    cancelled = []
+
+    async def trim_clip(row, incremental, on_progress, timeout):
+        if row['Id'] == 1:
+            await asyncio.sleep(0.01)
+            return '1.mp4'
+        if row['Id'] == 2:
+            raise ValueError('broken clip')
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(row['Id'])
+            raise
+
+    mocker.patch("editor.aio.trim_clip_async", side_effect=trim_clip)
+    # it should raise the first error and cancel the other trims
+    with pytest.raises(ValueError) as context_info:
+        asyncio.run(a.trim_clips_async(df))
+    assert 'broken clip' in str(context_info.value)
+    assert cancelled == [3]
+
+    async def trim_clip_ok(row, incremental, on_progress, timeout):
+        await asyncio.sleep(0.01 * (4 - row['Id']))
+        return f"{row['Id']}.mp4"
+
+    # it should return trimmed files in clip ID order
+    mocker.patch("editor.aio.trim_clip_async", side_effect=trim_clip_ok)
+    assert asyncio.run(a.trim_clips_async(df, max_concurrency=2)) == \
+           ['1.mp4', '2.mp4', '3.mp4']
+
+
+def test_render_videos_async(mocker):
+    async def render_video(df_clips, video_id):
+        if video_id == 2:
+            raise ValueError('broken')
+        return f'{video_id}.mp4'
+
+    mocker.patch("editor.aio.render_video_async", side_effect=render_video)
+    results = asyncio.run(a.render_videos_async(pd.DataFrame(), [1, 2, 3]))
+    # it should keep rendering after a failed video
+    assert results[1] == '1.mp4' and results[3] == '3.mp4'
+    assert isinstance(results[2], ValueError)
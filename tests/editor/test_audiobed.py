@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+
+import threading
+
+import editor.audiobed as ab
+
+
+def test_get_bed_length():
+    # it should round video length up to granularity
+    assert ab.get_bed_length(10.2) == 11
+    assert ab.get_bed_length(10) == 10
+    assert ab.get_bed_length(10.2, 5) == 15
+    assert ab.get_bed_length(0.1) == 1
+
+
+def test_audio_bed_cmd():
+    assert ab.audio_bed_cmd('a.mp3', 'bed.m4a', 100) == \
+           'ffmpeg -stream_loop -1 -i a.mp3 -t 100 -vn -c:a aac bed.m4a'
+    assert ab.audio_bed_cmd('a.mp3', 'bed.m4a', 100, 5) == \
+           'ffmpeg -stream_loop -1 -i a.mp3 -t 100 -vn ' \
+           '-af "afade=t=out:st=95:d=5" -c:a aac bed.m4a'
+    assert ab.audio_bed_cmd('a.mp3', 'bed.m4a', 100, 5, 93) == \
+           'ffmpeg -stream_loop -1 -i a.mp3 -t 100 -vn ' \
+           '-af "afade=t=out:st=93:d=5" -c:a aac bed.m4a'
+
+
+def test_get_audio_bed(tmp_path, mocker):
+    f_audio = tmp_path / 'a.mp3'
+    f_audio.write_bytes(b'0')
+    run_command = mocker.patch(
+        "editor.ffmpeg.run_command",
+        side_effect=lambda cmd: open(cmd.split(' ')[-1], 'w').close())
+    # it should encode bed once per quantized length
+    f_bed = ab.get_audio_bed(f_audio, 10.2, 0)
+    assert f_bed == ab.get_bed_path(f_audio, 11, 0)
+    assert ab.get_audio_bed(f_audio, 10.7, 0) == f_bed
+    assert run_command.call_count == 1
+    assert '-t 11 ' in run_command.call_args[0][0]
+    # it should fade out at the end of the video, not of the bed
+    f_fade = ab.get_audio_bed(f_audio, 10.2, 2)
+    assert f_fade == ab.get_bed_path(f_audio, 11, 2, 8)
+    assert 'afade=t=out:st=8:d=2' in run_command.call_args[0][0]
+    assert ab.get_audio_bed(f_audio, 10.4, 2) == f_fade
+    assert ab.get_audio_bed(f_audio, 10.7, 2) != f_fade
+    assert 'afade=t=out:st=9:d=2' in run_command.call_args[0][0]
+    # it should encode new bed for other lengths
+    assert ab.get_audio_bed(f_audio, 12, 0) != f_bed
+    assert run_command.call_count == 4
+
+
+def test_get_audio_bed_threads(tmp_path, mocker):
+    f_audio = tmp_path / 'a.mp3'
+    f_audio.write_bytes(b'0')
+    barrier = threading.Barrier(2, timeout=5)
+    f_tmps = []
+
+    def run_command(cmd):
+        f_tmps.append(cmd.split(' ')[-1])
+        open(f_tmps[-1], 'w').close()
+        barrier.wait()
+
+    mocker.patch("editor.ffmpeg.run_command", side_effect=run_command)
+    # it should encode to a file of its own in every thread
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(
+        ab.get_audio_bed(f_audio, 10, 2))) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(set(f_tmps)) == 2
+    assert results == [ab.get_bed_path(f_audio, 10, 2, 8)] * 2
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+
+import pandas as pd
+import pytest
+
+from concurrent.futures import ThreadPoolExecutor
+
+import editor.batch as b
+
+
+def test_parse_video_ids():
+    # it should parse single IDs and ranges
+    assert b.parse_video_ids(['1', '3-5']) == [1, 3, 4, 5]
+    # it should drop repeated IDs
+    assert b.parse_video_ids(['2', '1-3']) == [2, 1, 3]
+    # it should raise error for invalid values
+    for arg in ['a', '5-3', '1-']:
+        with pytest.raises(ValueError) as context_info:
+            b.parse_video_ids([arg])
+        assert f"'{arg}'" in str(context_info.value)
+
+
+def test_get_video_ids():
+    df = pd.DataFrame(data={'VideoId': [3, 1, 3, 2]})
+    assert b.get_video_ids(df) == [1, 2, 3]
+    with pytest.raises(ValueError) as context_info:
+        b.get_video_ids(pd.DataFrame())
+    assert "Column 'VideoId' not found" in str(context_info.value)
+
+
+def test_render_video_safe(mocker):
+    # it should return output file on success
+    mocker.patch("editor.clips.render_video", return_value='out.mp4')
+    result = b.render_video_safe(pd.DataFrame(), 1)
+    assert result['Success'] and result['FileName'] == 'out.mp4'
+    # it should catch errors instead of raising them
+    mocker.patch("editor.clips.render_video",
+                 side_effect=ValueError('broken'))
+    result = b.render_video_safe(pd.DataFrame(), 1)
+    assert not result['Success']
+    assert result['Error'] == 'ValueError: broken'
+
+
+def test_render_videos(mocker):
+    mocker.patch("editor.batch.ProcessPoolExecutor", ThreadPoolExecutor)
+
+    def render_video(df_clips, video_id, mode):
+        if video_id == 2:
+            raise ValueError('broken')
+        assert set(df_clips['VideoId']) == {video_id}
+        return f'{video_id}.mp4'
+
+    mocker.patch("editor.clips.render_video", side_effect=render_video)
+    df = pd.DataFrame(data={'Id': [1, 2, 3], 'VideoId': [1, 2, 3]})
+    df_results = b.render_videos(df, [3, 2, 1], max_workers=2,
+                                 mode='fused')
+    # it should keep rendering after a failed video
+    assert list(df_results['VideoId']) == [1, 2, 3]
+    assert list(df_results['Success']) == [True, False, True]
+    assert df_results.loc[2, 'FileName'] == '3.mp4'
+
+
+def test_get_summary():
+    df = pd.DataFrame(data={'Success': [True, True, False]})
+    summary = b.get_summary(df, 3600)
+    assert summary['Videos'] == 3
+    assert summary['Failed'] == 1
+    assert summary['VideosPerHour'] == 2
@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+
+import os
+
+import editor.build as b
+
+
+def test_get_build_key(tmp_path):
+    f_in = tmp_path / 'in.mp4'
+    f_in.write_bytes(b'video')
+    key = b.get_build_key('cmd', [f_in], {'TimeStart': '00:00:00'})
+    # it should be stable for the same inputs
+    assert key == b.get_build_key('cmd', [f_in], {'TimeStart': '00:00:00'})
+    # it should change with command, parameters and input files
+    assert key != b.get_build_key('cmd2', [f_in], {'TimeStart': '00:00:00'})
+    assert key != b.get_build_key('cmd', [f_in], {'TimeStart': '00:00:01'})
+    f_in.write_bytes(b'new video')
+    assert key != b.get_build_key('cmd', [f_in], {'TimeStart': '00:00:00'})
+    # it should work for missing inputs
+    assert b.get_build_key('cmd', [tmp_path / 'missing.mp4'])
+
+
+def test_build(tmp_path, mocker):
+    f_in = tmp_path / 'in.mp4'
+    f_in.write_bytes(b'video')
+    f_out = tmp_path / 'out.mp4'
+
+    def run_command(cmd):
+        f_out.write_bytes(b'output')
+        return ''
+
+    run = mocker.patch("editor.ffmpeg.run_command", side_effect=run_command)
+    # it should build missing artifacts
+    assert b.build(f_out, 'cmd', [f_in])
+    # it should reuse artifacts with unchanged key
+    assert not b.build(f_out, 'cmd', [f_in])
+    assert run.call_count == 1
+    # it should rebuild when inputs change
+    f_in.write_bytes(b'new video')
+    assert b.build(f_out, 'cmd', [f_in])
+    # it should rebuild when output was modified outside of the build
+    os.utime(f_out, ns=(0, 0))
+    assert b.build(f_out, 'cmd', [f_in])
+    assert run.call_count == 3
+    # it should record what was rebuilt and why
+    df = b.get_manifest()
+    assert list(df['Status']) == ['rebuilt', 'reused', 'rebuilt', 'rebuilt']
+    assert list(df['Reason']) == ['missing output', 'key unchanged',
+                                  'inputs changed', 'output modified']
+    assert set(df['Artifact']) == {str(f_out)}
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+
+import os
+import threading
+
+import pytest
+
+import editor.bumpers as bp
+
+VIDEO = {'codec_type': 'video', 'codec_name': 'h264', 'profile': 'High',
+         'width': 1280, 'height': 720, 'pix_fmt': 'yuv420p',
+         'time_base': '1/15360', 'r_frame_rate': '30/1'}
+AUDIO = {'codec_name': 'aac', 'sample_rate': '44100', 'channels': 2,
+         'channel_layout': 'stereo'}
+SIGNATURE = {'video': VIDEO, 'audio': AUDIO}
+
+
+def test_get_signature():
+    info = {'streams': [dict(VIDEO, index=0, bit_rate='1000'),
+                        dict(AUDIO, index=1, codec_type='audio')]}
+    # it should keep stream properties that concat needs to match
+    assert bp.get_signature(info) == SIGNATURE
+    assert bp.get_signature({'streams': [VIDEO]}) == {'video': VIDEO,
+                                                      'audio': None}
+
+
+def test_normalize_bumper_cmd():
+    cmd = bp.normalize_bumper_cmd('in.mp4', 'out.mp4', SIGNATURE)
+    assert cmd == 'ffmpeg -i in.mp4 -vf "scale=1280:720:force_original_' \
+                  'aspect_ratio=decrease,pad=1280:720:(ow-iw)/2:(oh-ih)/2,' \
+                  'setsar=1,fps=30/1" -c:v libx264 -pix_fmt yuv420p ' \
+                  '-profile:v high -video_track_timescale 15360 ' \
+                  '-x264-params repeat-headers=1 -c:a aac -ar 44100 -ac 2 ' \
+                  '-map 0:v:0 -map 0:a:0 out.mp4'
+    # it should add silent track to bumpers without audio
+    cmd = bp.normalize_bumper_cmd('in.mp4', 'out.mp4', SIGNATURE,
+                                  has_audio=False)
+    assert '-f lavfi -i anullsrc=r=44100:cl=stereo' in cmd
+    assert cmd.endswith('-map 0:v:0 -map 1:a:0 -shortest out.mp4')
+    # it should raise error for unsupported audio codecs
+    with pytest.raises(ValueError) as context_info:
+        bp.normalize_bumper_cmd('in.mp4', 'out.mp4',
+                                {'video': VIDEO,
+                                 'audio': {'codec_name': 'pcm_s16le'}})
+    assert "Bumper audio codec 'pcm_s16le' is not supported" in \
+           str(context_info.value)
+
+
+def test_get_bumper(tmp_path, mocker):
+    f_bumper = tmp_path / 'intro.mp4'
+    f_bumper.write_bytes(b'0')
+    info = {'streams': [dict(VIDEO, width=640, height=360)]}
+    mocker.patch("editor.ffmpeg.get_media_info", return_value=info)
+    run_command = mocker.patch(
+        "editor.ffmpeg.run_command",
+        side_effect=lambda cmd: open(cmd.split(' ')[-1], 'w').close())
+    # it should reuse bumpers that match already
+    assert bp.get_bumper(f_bumper, bp.get_signature(info)) == f_bumper
+    # it should transcode bumper once per signature
+    f_out = bp.get_bumper(f_bumper, SIGNATURE)
+    assert f_out == bp.get_bumper_path(f_bumper, SIGNATURE)
+    assert bp.get_bumper(f_bumper, SIGNATURE) == f_out
+    assert run_command.call_count == 1
+    assert 'anullsrc' in run_command.call_args[0][0]
+    # it should transcode again when bumper changes
+    f_bumper.write_bytes(b'01')
+    assert bp.get_bumper(f_bumper, SIGNATURE) != f_out
+    assert run_command.call_count == 2
+
+
+def test_get_bumper_threads(tmp_path, mocker):
+    f_bumper = tmp_path / 'intro.mp4'
+    f_bumper.write_bytes(b'0')
+    mocker.patch("editor.ffmpeg.get_media_info",
+                 return_value={'streams': [VIDEO]})
+    barrier = threading.Barrier(2, timeout=5)
+    f_tmps = []
+
+    def run_command(cmd):
+        f_tmps.append(cmd.split(' ')[-1])
+        open(f_tmps[-1], 'w').close()
+        barrier.wait()
+
+    mocker.patch("editor.ffmpeg.run_command", side_effect=run_command)
+    # it should transcode to a file of its own in every thread
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(
+        bp.get_bumper(f_bumper, SIGNATURE))) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(set(f_tmps)) == 2
+    assert results == [bp.get_bumper_path(f_bumper, SIGNATURE)] * 2
+
+
+def test_get_stream_bumpers(tmp_path, mocker):
+    f_bumper = tmp_path / 'intro.mp4'
+    f_bumper.write_bytes(b'0')
+    mocker.patch("editor.bumpers.get_bumper",
+                 side_effect=lambda f_in, signature: f_in)
+    run_command = mocker.patch(
+        "editor.ffmpeg.run_command",
+        side_effect=lambda cmd: open(cmd.split(' ')[-1], 'w').close())
+    # it should remux bumpers to MPEG-TS once
+    f_list = bp.get_stream_bumpers([f_bumper, f_bumper], SIGNATURE)
+    assert f_list == [bp.get_stream_path(f_bumper)] * 2
+    assert f_list[0].endswith('.ts') and os.path.isfile(f_list[0])
+    assert run_command.call_count == 1
+    assert '-c copy -f mpegts' in run_command.call_args[0][0]
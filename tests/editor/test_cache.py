@@ -0,0 +1,23 @@
+#!/usr/bin/env python
+
+import os
+
+import editor.cache as cache
+
+
+def test_get_cache_folder(tmp_path, monkeypatch):
+    monkeypatch.setenv(cache.CACHE_FOLDER_ENV, str(tmp_path))
+    # it should create folder inside cache root
+    assert cache.get_cache_folder('probe') == str(tmp_path / 'probe')
+    assert os.path.isdir(tmp_path / 'probe')
+
+
+def test_get_file_fingerprint(tmp_path):
+    f_path = tmp_path / 'file.txt'
+    f_path.write_text('abc')
+    abs_path, size, mtime_ns = cache.get_file_fingerprint(f_path)
+    assert abs_path == str(f_path)
+    assert size == 3
+    # it should change when file is modified
+    os.utime(f_path, ns=(0, 0))
+    assert cache.get_file_fingerprint(f_path)[2] == 0
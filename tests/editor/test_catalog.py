@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+
+import os
+
+import pandas as pd
+import pytest
+
+import editor.catalog as cat
+
+
+def write_media_data(folder, clips: dict, videos: dict):
+    pd.DataFrame(data=clips).to_csv(folder / 'clips.csv', index=False)
+    pd.DataFrame(data=videos).to_csv(folder / 'videos.csv', index=False)
+
+
+CLIPS = {
+    'Id': [3, 1, 2],
+    'VideoId': [2, 1, 1],
+    'FileName': ['b.mp4', 'a.mp4', 'a.mp4'],
+    'TimeStart': ['00:00:00', '00:00:05', '00:00:00'],
+    'TimeEnd': ['00:00:05', '00:00:10', '00:00:05'],
+}
+VIDEOS = {'Id': [1, 2], 'Name': ['one.mp4', 'two.mp4']}
+
+
+def test_media_catalog(tmp_path):
+    write_media_data(tmp_path, CLIPS, VIDEOS)
+    catalog = cat.MediaCatalog(tmp_path)
+    assert catalog.get_video_ids() == [1, 2]
+    # it should return clips of a video ordered by ID
+    assert list(catalog.get_clips(1)['Id']) == [1, 2]
+    assert list(catalog.get_clips(2)['FileName']) == ['b.mp4']
+    # it should store repeated strings as categories
+    assert catalog.clips['FileName'].dtype == 'category'
+    # it should return video data
+    assert catalog.get_video(2, 'Name') == 'two.mp4'
+    assert list(catalog.get_video(1)['Name']) == ['one.mp4']
+    # it should raise error for unknown IDs and columns
+    with pytest.raises(ValueError) as context_info:
+        catalog.get_clips(3)
+    assert "No clips found for Video ID 3!" in str(context_info.value)
+    with pytest.raises(ValueError) as context_info:
+        catalog.get_video(3)
+    assert "Video ID 3 not found!" in str(context_info.value)
+    with pytest.raises(ValueError) as context_info:
+        catalog.get_video(1, 'Missing')
+    assert "Column 'Missing' not found" in str(context_info.value)
+
+
+def test_media_catalog_validation(tmp_path):
+    # it should raise error if IDs are duplicated
+    write_media_data(tmp_path, CLIPS, {'Id': [1, 1], 'Name': ['a', 'b']})
+    with pytest.raises(ValueError) as context_info:
+        cat.MediaCatalog(tmp_path)
+    assert "Duplicates found in 'Id'" in str(context_info.value)
+    # it should raise error if columns are missing
+    write_media_data(tmp_path, {'Id': [1]}, VIDEOS)
+    with pytest.raises(ValueError) as context_info:
+        cat.MediaCatalog(tmp_path)
+    assert "Column 'VideoId' not found" in str(context_info.value)
+
+
+def test_media_catalog_refresh(tmp_path):
+    write_media_data(tmp_path, CLIPS, VIDEOS)
+    catalog = cat.MediaCatalog(tmp_path)
+    # it should not reload unchanged files
+    assert not catalog.refresh()
+    # it should reload when files change
+    write_media_data(tmp_path, CLIPS, {'Id': [1, 2], 'Name': ['new', 'b']})
+    os.utime(tmp_path / 'videos.csv', ns=(0, 0))
+    assert catalog.get_video(1, 'Name') == 'new'
+
+
+def test_get_catalog(tmp_path):
+    write_media_data(tmp_path, CLIPS, VIDEOS)
+    # it should load every folder once
+    catalog = cat.get_catalog(str(tmp_path))
+    assert cat.get_catalog(str(tmp_path)) is catalog
+
+
+def test_find_catalog(tmp_path):
+    write_media_data(tmp_path, CLIPS, VIDEOS)
+    catalog = cat.get_catalog(str(tmp_path))
+    # it should find the catalog a clip table was loaded by
+    assert cat.find_catalog(catalog.clips) is catalog
+    assert cat.find_catalog(catalog.clips.copy()) is None
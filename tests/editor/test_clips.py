@@ -3,8 +3,12 @@
 import pandas as pd
 import pytest
 import os
+import shutil
 
+import editor.catalog as cat
 import editor.clips as c
+import editor.ffmpeg as ff
+import editor.workspace as ws
 
 
 def test_read_media_data(tmp_path):
@@ -45,29 +49,35 @@ def test_get_clips():
         'VideoId': [video_id, video_id, video_id]})
     df_multi_sorted = df_multi.sort_values(by=['Id'])
     assert c.get_clips(df_multi, video_id).equals(df_multi_sorted)
+    # it should not modify input data
+    assert list(df_multi['Id']) == [3, 2, 1]
 
 
-def test_get_video(mocker):
-    # it should throw error if video ids are duplicated
-    df_multi = pd.DataFrame(data={'Id': [1, 1]})
-    mocker.patch("editor.clips.read_media_data", return_value=df_multi)
-    with pytest.raises(ValueError) as context_info:
-        c.get_video(1)
-    assert "Duplicates found in 'Id'" in str(context_info.value)
-    # it should throw error if column is missing
-    df_missing = pd.DataFrame(data={'Id': [1]})
-    mocker.patch("editor.clips.read_media_data", return_value=df_missing)
+def test_get_clips_catalog(tmp_path, mocker):
+    pd.DataFrame(data={'Id': [2, 1, 3], 'VideoId': [1, 1, 2],
+                       'FileName': ['a.mp4'] * 3,
+                       'TimeStart': ['00:00:00'] * 3,
+                       'TimeEnd': ['00:00:01'] * 3}).to_csv(
+        tmp_path / 'clips.csv', index=False)
+    pd.DataFrame(data={'Id': [1, 2], 'Name': ['a', 'b']}).to_csv(
+        tmp_path / 'videos.csv', index=False)
+    catalog = cat.get_catalog(str(tmp_path))
+    has_duplicates = mocker.patch("editor.dataframe.has_duplicates")
+    # it should serve clips of the catalog's table from its index
+    assert list(c.get_clips(catalog.clips, 1)['Id']) == [1, 2]
+    has_duplicates.assert_not_called()
     with pytest.raises(ValueError) as context_info:
-        c.get_video(1, 'Missing')
-    assert "Column 'Missing' not found" in str(context_info.value)
-    # it should return column value
-    df_single = pd.DataFrame(data={'Id': [1], 'Col': ['value']})
-    mocker.patch("editor.clips.read_media_data", return_value=df_single)
+        c.get_clips(catalog.clips, 3)
+    assert "No clips found for Video ID 3!" in str(context_info.value)
+
+
+def test_get_video(mocker):
+    catalog = mocker.Mock()
+    catalog.get_video.return_value = 'value'
+    mocker.patch("editor.catalog.get_catalog", return_value=catalog)
+    # it should look up video in the media catalog
     assert c.get_video(1, 'Col') == 'value'
-    # it should return dataframe if column is not specified
-    df_full = pd.DataFrame(data={'Id': [1], 'Col': ['value']})
-    mocker.patch("editor.clips.read_media_data", return_value=df_full)
-    assert c.get_video(1).equals(df_full)
+    catalog.get_video.assert_called_once_with(1, 'Col')
 
 
 def test_get_input_folder():
@@ -85,20 +95,22 @@ def test_get_input_file_path(tmp_path, mocker):
 
 
 
-def test_get_output_file_path(tmp_path, mocker):
+def test_get_output_file_path(tmp_path, mocker, monkeypatch):
     mocker.patch("editor.clips.get_input_folder", return_value=tmp_path)
+    # it should default to a folder of ours in temp next to the inputs
+    monkeypatch.delenv(ws.SCRATCH_FOLDER_ENV)
     f_name = 'test.txt'
     # it should work without suffix
-    f_path = tmp_path / 'temp' / f_name
+    f_path = tmp_path / 'temp' / ws.OWN_FOLDER / f_name
     assert c.get_output_file_path(f_name) == str(f_path)
     assert c.get_output_file_path(f_name, '') == str(f_path)
     # it should work for integers
     f_name_int = 'test_01.txt'
-    f_path_int = tmp_path / 'temp' / f_name_int
+    f_path_int = tmp_path / 'temp' / ws.OWN_FOLDER / f_name_int
     assert c.get_output_file_path(f_name, 1) == str(f_path_int)
     # it should work for strings
     f_name_sfx = 'test_suffix.txt'
-    f_path_sfx = tmp_path / 'temp' / f_name_sfx
+    f_path_sfx = tmp_path / 'temp' / ws.OWN_FOLDER / f_name_sfx
     assert c.get_output_file_path(f_name, "suffix") == str(f_path_sfx)
     # it should throw error otherwise
     with pytest.raises(ValueError) as context_info:
@@ -106,6 +118,21 @@ def test_get_output_file_path(tmp_path, mocker):
     assert "Invalid file suffix: ['']" in str(context_info.value)
 
 
+def test_run_step(mocker):
+    run_command = mocker.patch("editor.ffmpeg.run_command",
+                               return_value=True)
+    build = mocker.patch("editor.build.build", return_value=True)
+    # it should run command directly by default
+    assert c.run_step('cmd', 'out.mp4', ['in.mp4']) == 'out.mp4'
+    run_command.assert_called_once_with('cmd')
+    # it should go through the build cache in incremental mode
+    assert c.run_step('cmd', 'out.mp4', ['in.mp4'], True, {'a': 1}) == \
+           'out.mp4'
+    build.assert_called_once_with('out.mp4', 'cmd', ['in.mp4'], {'a': 1},
+                                  None)
+    assert run_command.call_count == 1
+
+
 def test_trim_clip(mocker):
     mocker.patch("editor.dataframe.has_columns", return_value=True)
     mocker.patch("editor.clips.get_input_file_path", return_value='in.mp4')
@@ -121,6 +148,44 @@ def test_trim_clip(mocker):
     assert c.trim_clip(row) == 'out.mp4'
 
 
+def test_smart_trim_clip(mocker):
+    mocker.patch("editor.clips.get_input_file_path", return_value='in.mp4')
+    mocker.patch("editor.clips.get_output_file_path", return_value='out.mp4')
+    mocker.patch("editor.smartcut.smart_trim_cmds",
+                 return_value=['cmd1', 'cmd2'])
+    run_smart_trim = mocker.patch("editor.smartcut.run_smart_trim",
+                                  return_value=True)
+    row = pd.Series(data={'Id': 1, 'FileName': 'f.mp4',
+                          'TimeStart': '00:00:00', 'TimeEnd': '00:00:01'})
+    # it should run every smart cut command
+    assert c.trim_clip(row, smart=True) == 'out.mp4'
+    run_smart_trim.assert_called_once_with(['cmd1', 'cmd2'], 'out.mp4')
+
+
+def test_trim_clips(mocker):
+    df = pd.DataFrame(data={'Id': [3, 1, 2]})
+    mocker.patch("editor.clips.trim_clip",
+                 side_effect=lambda row, **kwargs: f"{row['Id']}.mp4")
+    # it should return trimmed files in clip ID order
+    assert c.trim_clips(df, max_workers=3) == ['1.mp4', '2.mp4', '3.mp4']
+    # it should work without clips
+    assert c.trim_clips(df.iloc[0:0]) == []
+    # it should raise the first error and skip trims not started yet
+    trimmed = []
+
+    def trim_clip(row, incremental, smart):
+        if row['Id'] == 1:
+            raise ValueError('broken clip')
+        trimmed.append(row['Id'])
+        return 'out.mp4'
+
+    mocker.patch("editor.clips.trim_clip", side_effect=trim_clip)
+    with pytest.raises(ValueError) as context_info:
+        c.trim_clips(df, max_workers=1)
+    assert 'broken clip' in str(context_info.value)
+    assert trimmed == []
+
+
 def test_write_input_files(tmp_path):
     input_files_path = tmp_path / 'temp.txt'
     f_list = ['file1.txt', 'file2.txt']
@@ -149,20 +214,220 @@ def test_merge_clips(mocker, tmp_path):
     assert c.merge_clips([], 1, f_input_list) == f_out
     # it should delete input list file
     assert not os.path.isfile(f_input_list)
+    # it should write absolute paths to input list
+    write_input_files = mocker.patch("editor.clips.write_input_files",
+                                     return_value=True)
+    c.merge_clips(['in.mp4'], 1)
+    write_input_files.assert_called_once_with([os.path.abspath('in.mp4')],
+                                              'out.txt')
 
 
 def test_add_audio(mocker):
     f_out = 'out.mp4'
     mocker.patch("editor.clips.get_video", return_value=f_out)
     mocker.patch("editor.clips.get_output_file_path", return_value=f_out)
-    mocker.patch("editor.ffmpeg.add_audio_cmd", return_value='cmd')
+    mocker.patch("editor.ffmpeg.get_video_length", return_value=10.2)
+    get_audio_bed = mocker.patch("editor.audiobed.get_audio_bed",
+                                 return_value='bed.m4a')
+    add_audio_cmd = mocker.patch("editor.ffmpeg.add_audio_cmd",
+                                 return_value='cmd')
     mocker.patch("editor.ffmpeg.run_command", return_value=True)
     mocker.patch("editor.ffmpeg.delete_existing_file", return_value=True)
     assert c.add_audio('in.mp4', 1) == f_out
+    # it should mux the cached audio bed without re-encoding
+    assert get_audio_bed.call_args[0][1:] == (10.2, c.AUDIO_FADE_OUT,
+                                              c.AUDIO_BED_GRANULARITY)
+    add_audio_cmd.assert_called_once_with('in.mp4', 'bed.m4a', f_out)
 
 
 def test_add_intro_outro(mocker):
     f_out = 'out.mp4'
     mocker.patch("editor.clips.get_input_file_path", return_value=f_out)
-    mocker.patch("editor.clips.merge_clips", return_value=f_out)
+    mocker.patch("editor.ffmpeg.get_media_info", return_value={})
+    get_bumpers = mocker.patch("editor.bumpers.get_bumpers",
+                               return_value=['i.mp4', 'a.mp4', 'o.mp4'])
+    merge_clips = mocker.patch("editor.clips.merge_clips", return_value=f_out)
     assert c.add_intro_outro('in.mp4', 1) == f_out
+    # it should concat bumpers normalized to the body signature
+    assert get_bumpers.call_args[0][1] == {'video': {}, 'audio': None}
+    assert merge_clips.call_args[0][0] == ['i.mp4', 'in.mp4', 'a.mp4',
+                                           'o.mp4']
+
+
+def test_get_stream_signature(mocker):
+    infos = {'raw.mp4': {'streams': [{'codec_type': 'video',
+                                      'codec_name': 'h264'},
+                                     {'codec_type': 'audio',
+                                      'codec_name': 'mp3'}]},
+             'song.mp3': {'streams': [{'codec_type': 'audio',
+                                       'codec_name': 'mp3',
+                                       'sample_rate': '44100'}]}}
+    mocker.patch("editor.ffmpeg.get_media_info", side_effect=infos.get)
+    segments = [('raw.mp4', '00:00:00', '00:00:05')]
+    # it should take video of source and aac encoded audio track
+    assert c.get_stream_signature(segments, 'song.mp3') == {
+        'video': {'codec_type': 'video', 'codec_name': 'h264'},
+        'audio': {'codec_name': 'aac', 'sample_rate': '44100'}}
+
+
+def test_render_video(mocker):
+    df = pd.DataFrame(data={'Id': [2, 1], 'VideoId': [1, 1],
+                            'FileName': ['a.mp4', 'b.mp4'],
+                            'TimeStart': ['00:00:00', '00:00:01'],
+                            'TimeEnd': ['00:00:01', '00:00:02']})
+    trim_clip = mocker.patch(
+        "editor.clips.trim_clip",
+        side_effect=lambda row, **kwargs: f"{row['Id']}.mp4")
+    merge_clips = mocker.patch("editor.clips.merge_clips",
+                               return_value='merged.mp4')
+    mocker.patch("editor.clips.add_audio", return_value='sound.mp4')
+    mocker.patch("editor.clips.add_intro_outro", return_value='final.mp4')
+    # it should run every step and return the final file
+    assert c.render_video(df, 1) == 'final.mp4'
+    assert trim_clip.call_count == 2
+    # it should merge trimmed clips in clip ID order
+    merge_clips.assert_called_once_with(['1.mp4', '2.mp4'], 1,
+                                        suffix='merged', incremental=False)
+    # it should skip intermediate steps in fused and stream modes
+    mocker.patch("editor.clips.render_fused", return_value='fused.mp4')
+    assert c.render_video(df, 1, mode='fused') == 'fused.mp4'
+    mocker.patch("editor.clips.render_stream", return_value='stream.mp4')
+    assert c.render_video(df, 1, mode='stream') == 'stream.mp4'
+    assert trim_clip.call_count == 2
+    # it should raise error for unknown modes
+    with pytest.raises(ValueError) as context_info:
+        c.render_video(df, 1, mode='unknown')
+    assert "Unknown render mode: 'unknown'" in str(context_info.value)
+
+
+def test_render_preview(tmp_path, mocker):
+    df = pd.DataFrame(data={'Id': [2, 1], 'VideoId': [1, 1],
+                            'FileName': ['a.mp4', 'b.mp4'],
+                            'TimeStart': ['00:00:00', '00:00:01'],
+                            'TimeEnd': ['00:00:01', '00:00:02']})
+    mocker.patch("editor.clips.get_input_folder", return_value=str(tmp_path))
+    mocker.patch("editor.clips.get_video", return_value='video.mp4')
+    get_proxies = mocker.patch(
+        "editor.proxy.get_proxies",
+        side_effect=lambda f_list: {f: f'{f}.proxy' for f in f_list})
+    sources = []
+    trims = []
+
+    def trim_clip(row, **kwargs):
+        f_in, f_out = c.get_trim_file_paths(row)
+        sources.append(f_in)
+        trims.append(os.path.basename(f_out))
+        return 'clip.mp4'
+
+    mocker.patch("editor.clips.trim_clip", side_effect=trim_clip)
+    merge_clips = mocker.patch("editor.clips.merge_clips",
+                               return_value='merged.mp4')
+    add_audio = mocker.patch("editor.clips.add_audio",
+                             return_value='sound.mp4')
+    add_intro_outro = mocker.patch("editor.clips.add_intro_outro",
+                                   return_value='preview.mp4')
+    assert c.render_video(df, 1, mode='preview') == 'preview.mp4'
+    # it should trim the proxies of the sources
+    f_raw = [str(tmp_path / 'raw' / f) for f in ['b.mp4', 'a.mp4']]
+    get_proxies.assert_called_once_with(f_raw)
+    assert sources == [f'{f}.proxy' for f in f_raw]
+    # it should not write over the full quality render or intermediates
+    add_intro_outro.assert_called_once_with('sound.mp4', 1, False,
+                                            'preview')
+    assert trims == ['b_01_preview.mp4', 'a_02_preview.mp4']
+    assert merge_clips.call_args[1]['suffix'] == 'merged_preview'
+    assert add_audio.call_args[0][3] == 'sound_preview'
+    assert os.path.isdir(tmp_path / 'preview')
+
+
+def test_render_fused(mocker):
+    df = pd.DataFrame(data={
+        'Id': [2, 1],
+        'VideoId': [1, 1],
+        'FileName': ['b.mp4', 'a.mp4'],
+        'TimeStart': ['00:00:05', '00:00:00'],
+        'TimeEnd': ['00:00:10', '00:00:05'],
+    })
+    mocker.patch("editor.clips.get_input_folder", return_value='in')
+    mocker.patch("editor.clips.get_video", return_value='video.mp4')
+    mocker.patch("editor.clips.get_output_file_path", return_value='out.mp4')
+    fused_cmd = mocker.patch("editor.ffmpeg.render_fused_cmd",
+                             return_value='cmd')
+    run_command = mocker.patch("editor.ffmpeg.run_command",
+                               return_value=True)
+    assert c.render_fused(df, 1) == 'out.mp4'
+    # it should pass segments in clip ID order
+    segments = fused_cmd.call_args[0][0]
+    assert segments == [(os.path.join('in', 'raw', 'a.mp4'), '00:00:00',
+                         '00:00:05'),
+                        (os.path.join('in', 'raw', 'b.mp4'), '00:00:05',
+                         '00:00:10')]
+    # it should run a single command
+    run_command.assert_called_once_with('cmd')
+
+
+def test_write_segment_files(tmp_path):
+    input_files_path = tmp_path / 'segments.txt'
+    segments = [('a.mp4', '00:00:01', '00:00:05')]
+    assert c.write_segment_files(segments, input_files_path)
+    with open(input_files_path, 'r') as f:
+        lines = [line.strip() for line in f.readlines()]
+    # it should cut segments with inpoint and outpoint directives
+    assert lines == [f"file '{os.path.abspath('a.mp4')}'", 'inpoint 1',
+                     'outpoint 5']
+
+
+def test_render_stream(mocker):
+    segments = [('raw.mp4', '00:00:00', '00:00:05')]
+    mocker.patch("editor.clips.get_segments", return_value=segments)
+    mocker.patch("editor.ffmpeg.check_segments", return_value=5)
+    mocker.patch("editor.clips.get_video", return_value='video.mp4')
+    mocker.patch("editor.clips.get_output_file_path", return_value='out.mp4')
+    mocker.patch("editor.clips.get_stream_signature", return_value={})
+    mocker.patch("editor.bumpers.get_stream_bumpers",
+                 return_value=['i.ts', 'a.ts', 'o.ts'])
+    write_input_files = mocker.patch("editor.clips.write_input_files",
+                                     return_value=True)
+    mocker.patch("editor.ffmpeg.concat_stream_cmd", return_value='concat')
+    mocker.patch("editor.ffmpeg.add_audio_stream_cmd", return_value='audio')
+    mocker.patch("editor.ffmpeg.merge_stream_cmd", return_value='merge')
+    run_pipeline = mocker.patch("editor.ffmpeg.run_pipeline",
+                                return_value=True)
+    assert c.render_stream(pd.DataFrame(), 1) == 'out.mp4'
+    # it should read body from the previous stage
+    assert write_input_files.call_args[0][0][1] == 'pipe:0'
+    # it should run all stages as one pipeline
+    run_pipeline.assert_called_once_with(['concat', 'audio', 'merge'])
+
+
+def generate_video(f_out, duration):
+    ff.run_command(f'ffmpeg -y -v error -f lavfi -i testsrc=size=320x240:'
+                   f'rate=30 -f lavfi -i sine=frequency=440 -t {duration} '
+                   f'-c:v libx264 -preset ultrafast -g 30 -pix_fmt yuv420p '
+                   f'-c:a aac -shortest {f_out}')
+
+
+@pytest.mark.skipif(shutil.which('ffmpeg') is None,
+                    reason='ffmpeg is not installed')
+def test_render_stream_lavfi(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    folder = tmp_path / 'data' / 'videos'
+    for sub_folder in ['raw', 'final']:
+        (folder / sub_folder).mkdir(parents=True)
+    generate_video(folder / 'raw' / 'source.mp4', 6)
+    for f_name in ['intro.mp4', 'action.mp4', 'outro.mp4']:
+        generate_video(folder / f_name, 1)
+    ff.run_command(f'ffmpeg -y -v error -f lavfi -i sine=frequency=220 '
+                   f'-t 6 -c:a libmp3lame '
+                   f'{folder / "bensound-smallguitar.mp3"}')
+    (tmp_path / 'data' / 'clips.csv').write_text(
+        'Id,VideoId,FileName,TimeStart,TimeEnd\n'
+        '1,1,source.mp4,00:00:00,00:00:02\n'
+        '2,1,source.mp4,00:00:03,00:00:05\n')
+    (tmp_path / 'data' / 'videos.csv').write_text('Id,Name\n1,video.mp4\n')
+    df_clips = cat.get_catalog().clips
+    # it should read the streamed body through the concat list
+    f_out = c.render_stream(df_clips, 1)
+    assert f_out == os.path.join('data', 'videos', 'final', 'video.mp4')
+    # it should hold the body between the three bumpers
+    assert ff.get_media_info(f_out)['duration'] == pytest.approx(7, abs=0.5)
@@ -1,6 +1,8 @@
 #!/usr/bin/env python
 
 import editor.ffmpeg as ff
+import editor.scheduler as sched
+import asyncio
 import pytest
 import os
 
@@ -16,6 +18,87 @@ def test_run_command(tmp_path):
     assert f"{f_path}" in str(context_info.value)
 
 
+def test_get_speed():
+    log = 'frame=10 speed=1.5x\rframe=20 speed=12.3x\n'
+    assert ff.get_speed(log) == 12.3
+    assert ff.get_speed('') is None
+
+
+def test_get_progress_argv():
+    argv = ['ffmpeg', '-i', 'in.mp4', 'out.mp4']
+    # it should ask ffmpeg to report progress on stdout
+    assert ff.get_progress_argv(argv) == \
+           ['ffmpeg', '-nostats', '-progress', 'pipe:1', '-i', 'in.mp4',
+            'out.mp4']
+    # it should leave stdout alone if output goes there
+    argv_pipe = ['ffmpeg', '-i', 'in.mp4', '-f', 'mpegts', 'pipe:1']
+    assert ff.get_progress_argv(argv_pipe) == argv_pipe
+    assert ff.get_progress_argv(['ffprobe', 'in.mp4']) == ['ffprobe',
+                                                           'in.mp4']
+
+
+def test_parse_progress():
+    progress = ff.parse_progress({'out_time_us': '1500000', 'speed': '2.5x',
+                                  'fps': '60.0', 'total_size': '1024',
+                                  'progress': 'end'})
+    assert progress == {'time': 1.5, 'speed': 2.5, 'fps': 60, 'bytes': 1024,
+                        'done': True}
+    # it should handle values ffmpeg reports as N/A
+    assert ff.parse_progress({'speed': 'N/A'})['speed'] == 0
+
+
+def test_run_command_async(tmp_path):
+    # it should run argv without shell and return output
+    assert asyncio.run(ff.run_command_async('echo Hello World')) == \
+           'Hello World'
+    assert asyncio.run(ff.run_command_async(['echo', '$HOME'])) == '$HOME'
+    # it should fail on exit code and report stderr
+    f_path = tmp_path / "unknown.txt"
+    with pytest.raises(ValueError) as context_info:
+        asyncio.run(ff.run_command_async(f"cat {f_path}"))
+    assert f"{f_path}" in str(context_info.value)
+    # it should not fail on stderr output alone
+    assert asyncio.run(ff.run_command_async(
+        ['sh', '-c', 'echo log >&2; echo done'])) == 'done'
+    # it should kill commands running too long
+    with pytest.raises(TimeoutError):
+        asyncio.run(ff.run_command_async('sleep 10', timeout=0.1))
+    # it should report progress lines to callback
+    progress = []
+    script = 'echo out_time_us=1000000; echo progress=continue; ' \
+             'echo speed=2x; echo progress=end'
+    assert asyncio.run(ff.run_command_async(
+        ['sh', '-c', script], on_progress=progress.append)) == ''
+    assert [p['done'] for p in progress] == [False, True]
+    assert progress[1]['speed'] == 2
+    # it should split lines on carriage returns and allow long lines
+    script = "printf 'frame=1\\rframe=2\\r\\n'; head -c 100000 /dev/zero " \
+             "| tr '\\0' a"
+    lines = asyncio.run(ff.run_command_async(['sh', '-c', script]))
+    assert lines.split('\n') == ['frame=1', 'frame=2', 'a' * 100000]
+
+
+def test_run_command_async_admit(mocker):
+    sched.set_budget(sched.CoreBudget(cores=4))
+    mocker.patch("editor.scheduler.get_kind", return_value='cpu')
+    # it should run the command with the thread count it was admitted with
+    assert asyncio.run(ff.run_command_async(['echo', 'in', 'a b'])) == \
+           'in -threads 2 a b'
+
+
+def test_run_pipeline(mocker):
+    # it should pipe output of every command to the next one
+    assert ff.run_pipeline(['echo Hello', 'tr a-z A-Z', 'grep -q HELLO'])
+    # it should raise error with stderr of failing commands
+    with pytest.raises(ValueError) as context_info:
+        ff.run_pipeline(['echo Hello', 'grep -q World'])
+    assert 'grep -q World' in str(context_info.value)
+    # it should not let the first command read stdin of the caller
+    popen = mocker.spy(ff.s, 'Popen')
+    assert ff.run_pipeline(['cat', 'wc -c'])
+    assert popen.call_args_list[0][1]['stdin'] == ff.s.DEVNULL
+
+
 def test_check_existing_file(tmp_path):
     f_missing = tmp_path / 'unknown.txt'
     # it should raise error if videos file doesn't exist
@@ -61,9 +144,62 @@ def test_get_video_length_cmd(mocker):
     assert ff.get_video_length_cmd(f_path) == cmd
 
 
+def test_get_media_info_cmd(mocker):
+    mocker.patch("editor.ffmpeg.check_existing_file", return_value=True)
+    f_path = 'test.mp4'
+    assert ff.get_media_info_cmd(f_path) == \
+           f'ffprobe -i {f_path} -show_format -show_streams -v quiet -of json'
+
+
+def test_get_frame_rate():
+    assert ff.get_frame_rate('30000/1001') == 29.97
+    assert ff.get_frame_rate('25') == 25
+    assert ff.get_frame_rate('0/0') == 0
+
+
+def test_parse_media_info():
+    output = '{"format": {"duration": "12.5"}, "streams": [' \
+             '{"codec_type": "audio", "codec_name": "aac", "tags": {}}, ' \
+             '{"codec_type": "video", "codec_name": "h264", ' \
+             '"avg_frame_rate": "30/1"}]}'
+    info = ff.parse_media_info(output)
+    assert info['duration'] == 12.5
+    assert info['frame_rate'] == 30
+    # it should keep only codec parameters of streams
+    assert info['streams'][0] == {'codec_type': 'audio', 'codec_name': 'aac'}
+    # it should handle empty output
+    assert ff.parse_media_info('')['duration'] == 0
+
+
+def test_get_media_info(tmp_path, mocker):
+    f_path = tmp_path / 'test.mp4'
+    f_path.write_bytes(b'video')
+    output = '{"format": {"duration": "100"}, "streams": []}'
+    run_command = mocker.patch("editor.ffmpeg.run_command",
+                               return_value=output)
+    # it should probe file on first call only
+    assert ff.get_media_info(f_path)['duration'] == 100
+    assert ff.get_media_info(f_path)['duration'] == 100
+    assert run_command.call_count == 1
+    assert ff.get_probe_stats() == {'hits': 1, 'disk_hits': 0, 'misses': 1}
+    # it should read persisted entries after memory cache is cleared
+    ff.clear_probe_cache()
+    assert ff.get_media_info(f_path)['duration'] == 100
+    assert run_command.call_count == 1
+    assert ff.get_probe_stats()['disk_hits'] == 1
+    # it should probe again when file changes
+    f_path.write_bytes(b'longer video')
+    ff.get_media_info(f_path)
+    assert run_command.call_count == 2
+    # it should raise error if file doesn't exist
+    with pytest.raises(ValueError) as context_info:
+        ff.get_media_info(tmp_path / 'unknown.mp4')
+    assert "Input file does not exist" in str(context_info.value)
+
+
 def test_get_video_length(mocker):
-    mocker.patch("editor.ffmpeg.get_video_length_cmd", return_value='')
-    mocker.patch("editor.ffmpeg.run_command", return_value=100)
+    mocker.patch("editor.ffmpeg.get_media_info",
+                 return_value={'duration': 100.004})
     f_path = 'test.mp4'
     assert ff.get_video_length(f_path) == 100
 
@@ -95,6 +231,10 @@ def test_check_time_stamps(mocker):
         ff.check_time_stamps(f_path, '00:00:00', '00:02:00')
     assert f"Ending time (00:02:00) is longer then video length " \
            f"({f_path} - 60 s)" in str(context_info.value)
+    # it should take video length from packet index if built
+    mocker.patch("editor.index.get_index",
+                 return_value=mocker.Mock(duration=200))
+    assert ff.check_time_stamps(f_path, '00:00:00', '00:02:00')
 
 
 def test_trim_video_cmd(mocker):
@@ -108,7 +248,7 @@ def test_trim_video_cmd(mocker):
     t_start = '00:12:56'
     t_end = '00:15:56'
     assert ff.trim_video_cmd(f_in, f_out, t_start, t_end) == \
-           f'ffmpeg -ss {t_start} -i {f_in} -t {t_end} -c copy {f_out}'
+           f'ffmpeg -ss {t_start} -i {f_in} -t 180 -c copy {f_out}'
 
 
 def test_merge_videos_cmd(tmp_path, mocker):
@@ -133,3 +273,68 @@ def test_add_audio_cmd(mocker):
            f'ffmpeg -i {f_in} -i {f_audio} -vcodec copy ' \
            f'-af "afade=t=out:st=95:d=5" -map 0:v:0 -map 1:a:0' \
            f' -shortest {f_out}'
+
+
+def test_render_fused_cmd(mocker):
+    mocker.patch("editor.ffmpeg.check_existing_file", return_value=True)
+    mocker.patch("editor.ffmpeg.delete_existing_file", return_value=False)
+    mocker.patch("editor.ffmpeg.check_time_stamps", return_value=True)
+    segments = [('raw.mp4', '00:00:00', '00:00:05'),
+                ('raw.mp4', '00:01:00', '00:01:10')]
+    cmd = ff.render_fused_cmd(segments, 'a.mp3', 'i.mp4', 'c.mp4', 'o.mp4',
+                              'out.mp4', fade_out=2)
+    # it should cut every segment with input seeking
+    assert cmd.startswith('ffmpeg -i i.mp4 -ss 00:00:00 -t 5 -i raw.mp4 '
+                          '-ss 00:01:00 -t 10 -i raw.mp4 -i c.mp4 '
+                          '-i o.mp4 -i a.mp3 ')
+    # it should fade music at the end of the body
+    assert '[5:a:0]atrim=0:15,asetpts=PTS-STARTPTS,' \
+           'afade=t=out:st=13:d=2[music]' in cmd
+    assert '[1:v:0][2:v:0]concat=n=2:v=1:a=0[body]' in cmd
+    assert cmd.endswith('-movflags +faststart out.mp4')
+    # it should raise error without segments
+    with pytest.raises(ValueError) as context_info:
+        ff.render_fused_cmd([], 'a.mp3', 'i.mp4', 'c.mp4', 'o.mp4',
+                            'out.mp4')
+    assert "No segments to render!" in str(context_info.value)
+
+
+def test_check_segments(mocker):
+    mocker.patch("editor.ffmpeg.check_existing_file", return_value=True)
+    check_time_stamps = mocker.patch("editor.ffmpeg.check_time_stamps",
+                                     return_value=True)
+    segments = [('raw.mp4', '00:00:00', '00:00:05'),
+                ('raw.mp4', '00:01:00', '00:01:10')]
+    # it should return total length of segments
+    assert ff.check_segments(segments) == 15
+    assert check_time_stamps.call_count == 2
+    with pytest.raises(ValueError) as context_info:
+        ff.check_segments([])
+    assert "No segments to render!" in str(context_info.value)
+
+
+def test_concat_stream_cmd(mocker):
+    mocker.patch("editor.ffmpeg.check_existing_file", return_value=True)
+    assert ff.concat_stream_cmd('list.txt') == \
+           'ffmpeg -nostdin -f concat -safe 0 -i list.txt -c copy ' \
+           '-f mpegts pipe:1'
+
+
+def test_merge_stream_cmd(mocker):
+    mocker.patch("editor.ffmpeg.check_existing_file", return_value=True)
+    mocker.patch("editor.ffmpeg.delete_existing_file", return_value=True)
+    assert ff.merge_stream_cmd('list.txt', 'out.mp4') == \
+           'ffmpeg -nostdin -protocol_whitelist file,pipe,crypto,data ' \
+           '-f concat -safe 0 -i list.txt -c copy ' \
+           '-bsf:a aac_adtstoasc out.mp4'
+
+
+def test_add_audio_stream_cmd(mocker):
+    mocker.patch("editor.ffmpeg.check_existing_file", return_value=True)
+    assert ff.add_audio_stream_cmd('a.mp3', 100) == \
+           'ffmpeg -f mpegts -i pipe:0 -i a.mp3 -vcodec copy -acodec aac ' \
+           '-map 0:v:0 -map 1:a:0 -shortest -f mpegts pipe:1'
+    assert ff.add_audio_stream_cmd('a.mp3', 100, 5) == \
+           'ffmpeg -f mpegts -i pipe:0 -i a.mp3 -vcodec copy ' \
+           '-af "afade=t=out:st=95:d=5" -acodec aac -map 0:v:0 ' \
+           '-map 1:a:0 -shortest -f mpegts pipe:1'
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+
+import os
+
+import pytest
+
+import editor.index as idx
+
+PACKETS = 'video,0.000000,0.033333,5000,48,K__\n' \
+          'audio,0.000000,0.023220,300,5048,K__\n' \
+          'video,0.033333,0.033333,1000,5348,___\n' \
+          'video,2.000000,0.033333,6000,6348,K__\n' \
+          'video,1.000000,0.033333,1000,12348,___\n' \
+          'video,N/A,N/A,10,N/A,___\n' \
+          'video,4.000000,0.040000,4000,13348,K__'
+
+
+def test_get_packets_cmd(mocker):
+    mocker.patch("editor.ffmpeg.check_existing_file", return_value=True)
+    assert idx.get_packets_cmd('in.mp4') == \
+           'ffprobe -i in.mp4 -show_entries packet=codec_type,pts_time,' \
+           'duration_time,size,pos,flags -v quiet -of csv="p=0"'
+
+
+def test_packet_index():
+    index = idx.PacketIndex.from_packets(PACKETS)
+    # it should sort packets and keep video keyframes only
+    assert index.pts.tolist() == [0, 0, 0.033333, 1, 2, 4]
+    assert index.keyframes.tolist() == [0, 2, 4]
+    assert index.duration == 4.04
+    # it should find nearest keyframe before time stamp
+    assert index.get_keyframe_before(1.9) == 0
+    assert index.get_keyframe_before(2) == 2
+    assert index.get_keyframe_before(10) == 4
+    assert index.get_keyframes(1, 4) == [2, 4]
+    # it should sum packet sizes in interval
+    assert index.get_bytes(0, 1) == 6300
+    assert index.get_bytes(1, 4) == 7000
+    assert index.get_bytes(0, 10) == 17300
+
+
+def test_get_index(tmp_path, mocker):
+    f_in = tmp_path / 'in.mp4'
+    f_in.write_bytes(b'0')
+    run_command = mocker.patch("editor.ffmpeg.run_command",
+                               return_value=PACKETS)
+    # it should not build index when asked not to
+    assert idx.get_index(f_in, build=False) is None
+    assert idx.get_index(tmp_path / 'missing.mp4') is None
+    # it should scan source once and write sidecar
+    index = idx.get_index(f_in)
+    assert os.path.isfile(idx.get_index_path(f_in))
+    assert idx.get_index(f_in) is index
+    idx.clear_indexes()
+    assert idx.get_index(f_in).keyframes.tolist() == [0, 2, 4]
+    assert run_command.call_count == 1
+    # it should rebuild index when source changes
+    f_in.write_bytes(b'01')
+    os.utime(f_in, ns=(0, 0))
+    assert idx.get_index(f_in, build=False) is None
+    idx.get_index(f_in)
+    assert run_command.call_count == 2
+    # it should raise error when a required index has no source
+    with pytest.raises(ValueError) as context_info:
+        idx.get_source_index(tmp_path / 'missing.mp4')
+    assert 'Input file does not exist' in str(context_info.value)
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+
+import editor.jobs as j
+
+
+def test_enqueue(tmp_path):
+    f_path = str(tmp_path / 'jobs.sqlite')
+    assert j.enqueue([1, 2], {'smart_cut': True}, f_path=f_path) == 2
+    # it should not queue videos again unless forced
+    assert j.enqueue([2, 3], f_path=f_path) == 1
+    assert j.get_jobs(f_path)['VideoId'].tolist() == [1, 2, 3]
+    job = j.claim('a', f_path=f_path)
+    j.finish(job['id'], 'a', result='1.mp4', f_path=f_path)
+    assert j.enqueue([1], f_path=f_path) == 0
+    assert j.enqueue([1], force=True, f_path=f_path) == 1
+    assert j.get_status(f_path) == {'pending': 3, 'running': 0, 'done': 0,
+                                    'failed': 0}
+
+
+def test_claim(tmp_path):
+    f_path = str(tmp_path / 'jobs.sqlite')
+    j.enqueue([1, 2], {'smart_cut': True}, max_attempts=2, f_path=f_path)
+    # it should hand out each job to one worker only
+    job_a = j.claim('a', f_path=f_path)
+    job_b = j.claim('b', f_path=f_path)
+    assert (job_a['video_id'], job_b['video_id']) == (1, 2)
+    assert job_a['options'] == {'smart_cut': True}
+    assert j.claim('c', f_path=f_path) is None
+    # it should only let lease owner renew or finish a job
+    assert j.renew(job_a['id'], 'a', f_path=f_path)
+    assert not j.renew(job_a['id'], 'b', f_path=f_path)
+    assert not j.finish(job_a['id'], 'b', result='x', f_path=f_path)
+
+
+def test_claim_expired_lease(tmp_path):
+    f_path = str(tmp_path / 'jobs.sqlite')
+    j.enqueue([1], max_attempts=2, f_path=f_path)
+    # it should hand out jobs of crashed workers again
+    j.claim('a', lease=-1, f_path=f_path)
+    job = j.claim('b', lease=-1, f_path=f_path)
+    assert job['attempts'] == 2
+    assert not j.finish(job['id'], 'a', result='x', f_path=f_path)
+    # it should give up once attempts run out
+    assert j.claim('c', f_path=f_path) is None
+    df = j.get_jobs(f_path)
+    assert df.loc[0, 'State'] == 'failed'
+    assert df.loc[0, 'Error'] == 'lease expired'
+
+
+def test_finish(tmp_path):
+    f_path = str(tmp_path / 'jobs.sqlite')
+    j.enqueue([1], max_attempts=2, f_path=f_path)
+    # it should retry failed jobs until attempts run out
+    job = j.claim('a', f_path=f_path)
+    assert j.finish(job['id'], 'a', error='boom', f_path=f_path)
+    assert j.get_status(f_path)['pending'] == 1
+    job = j.claim('a', f_path=f_path)
+    j.finish(job['id'], 'a', error='boom', f_path=f_path)
+    assert j.get_status(f_path)['failed'] == 1
+    assert j.retry_failed(f_path) == 1
+    job = j.claim('a', f_path=f_path)
+    j.finish(job['id'], 'a', result='1.mp4', f_path=f_path)
+    df = j.get_jobs(f_path)
+    assert df.loc[0, 'State'] == 'done'
+    assert df.loc[0, 'FileName'] == '1.mp4'
+
+
+def test_work(tmp_path, mocker):
+    f_path = str(tmp_path / 'jobs.sqlite')
+    outputs = {'trim': [str(tmp_path / '1.mp4'), str(tmp_path / '2.mp4')],
+               'merge': str(tmp_path / 'merged.mp4'),
+               'audio': str(tmp_path / 'sound.mp4'),
+               'final': str(tmp_path / 'final.mp4')}
+    calls = []
+    crashes = ['audio']
+
+    def run_stage(name, video_id, result, options):
+        calls.append(name)
+        if name in crashes:
+            crashes.remove(name)
+            raise ValueError('crash')
+        f_out = outputs[name]
+        for f in f_out if isinstance(f_out, list) else [f_out]:
+            open(f, 'w').close()
+        return f_out
+
+    mocker.patch("editor.jobs.run_stage", side_effect=run_stage)
+    j.enqueue([1], f_path=f_path)
+    assert j.work(f_path, max_jobs=1) == 1
+    assert j.get_status(f_path)['pending'] == 1
+    # it should resume from the stage that failed
+    assert j.work(f_path) == 1
+    assert calls == ['trim', 'merge', 'audio', 'audio', 'final']
+    df = j.get_jobs(f_path)
+    assert df.loc[0, 'State'] == 'done'
+    assert df.loc[0, 'FileName'] == outputs['final']
+    # it should run again stages whose outputs are gone
+    j.enqueue([1], f_path=f_path)
+    with j.closing(j.connect_queue(f_path)) as con:
+        con.execute("UPDATE job SET state = 'pending'")
+    (tmp_path / 'merged.mp4').unlink()
+    calls.clear()
+    j.work(f_path)
+    assert calls == ['merge', 'audio', 'final']
+
+
+def test_run_job_lost_lease(tmp_path, mocker):
+    f_path = str(tmp_path / 'jobs.sqlite')
+    calls = []
+
+    def run_stage(name, video_id, result, options):
+        calls.append(name)
+        if name == 'merge':
+            # another worker claimed the job meanwhile
+            with j.closing(j.connect_queue(f_path)) as con:
+                con.execute("UPDATE job SET owner = 'b'")
+        return str(tmp_path / f'{name}.mp4')
+
+    mocker.patch("editor.jobs.run_stage", side_effect=run_stage)
+    j.enqueue([1], f_path=f_path)
+    job = j.claim('a', f_path=f_path)
+    lost = j.threading.Event()
+    # it should stop without recording results of the lost job
+    assert j.run_job(job, 'a', f_path=f_path, lost=lost) is None
+    assert lost.is_set()
+    assert calls == ['trim', 'merge']
+    assert list(j.get_stages(job['id'], f_path)) == ['trim']
+    # it should not start the next stage once the heartbeat lost the lease
+    calls.clear()
+    assert j.run_job(job, 'b', f_path=f_path, lost=lost) is None
+    assert calls == []
+
+
+def test_keep_lease(mocker):
+    renew = mocker.patch("editor.jobs.renew", side_effect=[True, False])
+    stop = j.threading.Event()
+    lost = j.threading.Event()
+    # it should flag the job once a renewal fails
+    j.keep_lease(1, 'a', 0.003, 'jobs.sqlite', stop, lost)
+    assert lost.is_set()
+    assert renew.call_count == 2
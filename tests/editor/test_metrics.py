@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+
+import pytest
+
+import editor.metrics as m
+
+
+def test_span_disabled():
+    m.disable()
+    # it should return shared no-op span
+    with m.span('stage') as span:
+        span.set(speed=1)
+    assert span is m.NULL_SPAN
+    assert m.get_records() == []
+
+
+def test_span(tmp_path):
+    f_metrics = tmp_path / 'metrics.jsonl'
+    f_in = tmp_path / 'in.mp4'
+    f_in.write_bytes(b'12345')
+    f_out = tmp_path / 'out.mp4'
+    m.enable(str(f_metrics))
+    with m.span('trim_clip', f_in=[f_in], f_out=f_out, video_id=1) as span:
+        f_out.write_bytes(b'123')
+        span.set(speed=2.0)
+    # it should record wall time, sizes and extra attributes
+    record = m.get_records()[0]
+    assert record['name'] == 'trim_clip'
+    assert record['bytes_in'] == 5 and record['bytes_out'] == 3
+    assert record['video_id'] == 1 and record['speed'] == 2.0
+    assert record['wall'] >= 0 and record['error'] is None
+    # it should record errors and re-raise them
+    with pytest.raises(ValueError):
+        with m.span('add_audio'):
+            raise ValueError('broken')
+    assert "broken" in m.get_records()[1]['error']
+    # it should write records as JSON lines
+    assert [r['name'] for r in m.read_records(f_metrics)] == \
+           ['trim_clip', 'add_audio']
+    m.disable()
+
+
+def test_get_summary():
+    records = [
+        {'kind': 'stage', 'name': 'trim_clip', 'wall': 1, 'cpu_user': 1,
+         'cpu_sys': 0, 'bytes_in': 10, 'bytes_out': 5, 'max_rss_kb': 100,
+         'speed': 2},
+        {'kind': 'stage', 'name': 'trim_clip', 'wall': 2, 'cpu_user': 1,
+         'cpu_sys': 0, 'bytes_in': 10, 'bytes_out': 5, 'max_rss_kb': 200,
+         'speed': 4},
+    ]
+    summary = m.get_summary(records)
+    row = summary.iloc[0]
+    assert row['count'] == 2 and row['wall'] == 3
+    assert row['bytes_out'] == 10 and row['max_rss_kb'] == 200
+    assert row['speed'] == 3
+    # it should handle runs without records
+    assert m.get_summary([]).empty
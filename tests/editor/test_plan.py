@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+
+import os
+
+import pandas as pd
+import pytest
+
+import editor.plan as plan
+
+DF_CLIPS = pd.DataFrame(data={
+    'Id': [1, 2, 3, 4],
+    'VideoId': [1, 1, 2, 2],
+    'FileName': ['a.mp4', 'b.mp4', 'a.mp4', 'c.mp4'],
+    'TimeStart': ['00:00:01', '00:00:00', '00:00:01', '00:00:00'],
+    'TimeEnd': ['00:00:03', '00:00:04', '00:00:03', '00:00:01'],
+})
+
+
+def get_trim_file_paths(row: pd.Series) -> tuple:
+    return f"in/{row['FileName']}", f"temp/{row['Id']}.mp4"
+
+
+@pytest.fixture
+def planner(mocker):
+    mocker.patch("editor.clips.get_trim_file_paths",
+                 side_effect=get_trim_file_paths)
+    mocker.patch("editor.clips.get_video", side_effect=lambda i, col: f'v{i}')
+    mocker.patch("editor.clips.get_audio_file_path", return_value='a.mp3')
+    mocker.patch("editor.clips.get_bumper_file_paths",
+                 return_value=['intro.mp4', 'outro.mp4'])
+    mocker.patch("editor.ffmpeg.trim_video_cmd",
+                 side_effect=lambda f_in, f_out, *args, **kwargs:
+                 f'ffmpeg -i {f_in} {f_out}')
+    mocker.patch("editor.index.get_index", return_value=None)
+
+
+def test_plan_videos(planner):
+    nodes = plan.plan_videos(DF_CLIPS, [1, 2])
+    trims = [node for node in nodes.values() if node.kind == 'trim']
+    # it should trim the clip shared by both videos only once
+    assert len(trims) == 3
+    shared = [node for node in trims if node.video_ids == [1, 2]]
+    assert len(shared) == 1 and shared[0].f_out == 'temp/1.mp4'
+    assert shared[0].cmd == 'ffmpeg -i in/a.mp4 temp/1.mp4'
+    # it should build merge, audio and final nodes for every video
+    assert [node.kind for node in nodes.values()].count('final') == 2
+    # it should raise error for videos without clips
+    with pytest.raises(ValueError) as context_info:
+        plan.plan_videos(DF_CLIPS, [3])
+    assert 'Video ID 3' in str(context_info.value)
+
+
+def test_plan_videos_same_clips(planner, mocker):
+    mocker.patch("editor.workspace.get_folder",
+                 side_effect=lambda video_id=None: f'scratch{video_id}')
+    df = pd.DataFrame(data={'Id': [1, 2], 'VideoId': [1, 2],
+                            'FileName': ['a.mp4', 'a.mp4'],
+                            'TimeStart': ['00:00:01', '00:00:01'],
+                            'TimeEnd': ['00:00:03', '00:00:03']})
+    nodes = plan.plan_videos(df, [1, 2])
+    # it should share the trim but render every video on its own
+    trims = [node for node in nodes.values() if node.kind == 'trim']
+    assert len(trims) == 1 and trims[0].video_ids == [1, 2]
+    finals = [node for node in nodes.values() if node.kind == 'final']
+    assert [node.video_ids for node in finals] == [[1], [2]]
+    assert [node.f_out for node in finals] == \
+           [os.path.join('data', 'videos', 'final', f'v{i}') for i in [1, 2]]
+    merges = [node for node in nodes.values() if node.kind == 'merge']
+    assert [node.deps for node in merges] == [[trims[0].key]] * 2
+    # it should keep intermediates in the scratch folder of their video
+    assert [node.f_out for node in merges] == \
+           [os.path.join(f'scratch{i}', f'v{i}_merged') for i in [1, 2]]
+    audios = [node for node in nodes.values() if node.kind == 'audio']
+    assert [node.f_out for node in audios] == \
+           [os.path.join(f'scratch{i}', f'v{i}_sound') for i in [1, 2]]
+
+
+def test_add_node():
+    nodes = {}
+    owners = {}
+    node = plan.add_node(nodes, owners, plan.Node('a', 'trim', 'x.mp4', [],
+                                                  [], 1, video_id=1))
+    # it should merge identical nodes
+    assert plan.add_node(nodes, owners, plan.Node(
+        'a', 'trim', 'x.mp4', [], [], 1, video_id=2)) is node
+    assert node.video_ids == [1, 2]
+    # it should raise error for different nodes writing one file
+    with pytest.raises(ValueError) as context_info:
+        plan.add_node(nodes, owners, plan.Node('b', 'trim', 'x.mp4', [], [],
+                                               1))
+    assert 'Conflicting nodes' in str(context_info.value)
+
+
+def test_get_order():
+    nodes = {key: plan.Node(key, 'trim', f'{key}.mp4', [], deps, 1)
+             for key, deps in [('c', ['a', 'b']), ('b', ['a']), ('a', [])]}
+    assert plan.get_order(nodes) == ['a', 'b', 'c']
+    # it should raise error for cycles
+    nodes['a'].deps = ['c']
+    with pytest.raises(ValueError) as context_info:
+        plan.get_order(nodes)
+    assert 'cycle' in str(context_info.value)
+
+
+def test_get_plan_table(planner):
+    nodes = plan.plan_videos(DF_CLIPS, [1, 2])
+    df = plan.get_plan_table(nodes)
+    assert list(df.columns) == plan.PLAN_COLUMNS
+    # it should list nodes after the nodes they depend on
+    assert list(df['Kind'][:3]) == ['trim'] * 3
+    assert list(df['Kind'][-2:]) == ['final'] * 2
+    cost = plan.get_plan_cost(nodes)
+    assert cost['trim'] == 2 + 4 + 1
+    assert cost['merge'] == 6 + 3
+    assert cost['total'] == 7 + 9 * 3
+
+
+def test_run_plan(mocker):
+    mocker.patch("editor.clips.trim_clip",
+                 side_effect=lambda row, **kwargs: f'{row}.mp4')
+
+    def merge_clips(f_list, video_id, incremental):
+        if video_id == 1:
+            raise ValueError('broken')
+        return '+'.join(f_list)
+
+    mocker.patch("editor.clips.merge_clips", side_effect=merge_clips)
+    add_audio = mocker.patch("editor.clips.add_audio",
+                             side_effect=lambda f_in, *args: f'{f_in}.sound')
+    mocker.patch("editor.clips.add_intro_outro",
+                 side_effect=lambda f_in, *args: f'{f_in}.final')
+    nodes = {}
+    for video_id in [1, 2]:
+        nodes[f't{video_id}'] = plan.Node(f't{video_id}', 'trim', '', [], [],
+                                          1, row=video_id,
+                                          video_id=video_id)
+        for kind, dep in [('merge', 't'), ('audio', 'merge'),
+                          ('final', 'audio')]:
+            nodes[f'{kind}{video_id}'] = plan.Node(
+                f'{kind}{video_id}', kind, '', [], [f'{dep}{video_id}'], 1,
+                video_id=video_id)
+    result = plan.run_plan(nodes, max_workers=2)
+    # it should only skip the nodes depending on a failed node
+    assert result['outputs']['final2'] == '2.mp4.sound.final'
+    assert result['outputs']['t1'] == '1.mp4'
+    assert result['errors']['final1'] == 'ValueError: broken'
+    add_audio.assert_called_once_with('2.mp4', 2, False)
+    df = plan.get_video_results(nodes, result)
+    assert list(df['Success']) == [False, True]
+
+
+def test_render_videos(planner, mocker):
+    run_plan = mocker.patch("editor.plan.run_plan",
+                            return_value={'outputs': {}, 'errors': {}})
+    df = plan.render_videos(DF_CLIPS, [2, 1], max_workers=3)
+    assert list(df['VideoId']) == [1, 2]
+    assert run_plan.call_args[0][1:] == (3, False, False)
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+
+import os
+import shlex
+
+import editor.proxy as px
+
+
+def test_proxy_cmd():
+    assert px.proxy_cmd('in.mp4', 'out.mp4') == \
+           'ffmpeg -i in.mp4 -map 0:v:0 -map "0:a:0?" ' \
+           '-vf "scale=-2:\'min(360,ih)\'" -c:v libx264 -preset ultrafast ' \
+           '-crf 28 -g 1 -pix_fmt yuv420p -c:a aac -b:a 96k ' \
+           '-movflags +faststart out.mp4'
+
+
+def test_get_proxy(tmp_path, mocker):
+    f_in = str(tmp_path / 'in.mp4')
+    with open(f_in, 'w') as f:
+        f.write('a')
+    cmds = []
+
+    def run_command(cmd):
+        cmds.append(cmd)
+        open(shlex.split(cmd)[-1], 'w').close()
+        return ''
+
+    mocker.patch("editor.ffmpeg.run_command", side_effect=run_command)
+    # it should build the proxy once per source
+    f_proxy = px.get_proxy(f_in)
+    assert os.path.isfile(f_proxy) and f_proxy == px.get_proxy_path(f_in)
+    assert px.get_proxy(f_in) == f_proxy
+    assert len(cmds) == 1
+    # it should not leave its lock behind
+    assert not os.path.isfile(f_proxy + '.lock')
+    # it should build a new proxy when the source changes
+    with open(f_in, 'w') as f:
+        f.write('ab')
+    assert px.get_proxy(f_in) != f_proxy
+    assert len(cmds) == 2
+
+
+def test_get_proxies(mocker):
+    get_proxy = mocker.patch("editor.proxy.get_proxy",
+                             side_effect=lambda f_in: f'proxy_{f_in}')
+    # it should build each source once, in parallel
+    assert px.get_proxies(['a.mp4', 'b.mp4', 'a.mp4'], max_workers=2) == \
+           {'a.mp4': 'proxy_a.mp4', 'b.mp4': 'proxy_b.mp4'}
+    assert get_proxy.call_count == 2
+
+
+def test_get_executor():
+    # it should keep one executor per size, later sizes are not ignored
+    assert px.get_executor(3) is px.get_executor(3)
+    assert px.get_executor(3)._max_workers == 3
+    assert px.get_executor(5)._max_workers == 5
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+
+import asyncio
+import threading
+import time
+
+import editor.scheduler as sched
+
+
+def test_get_kind():
+    # it should treat stream copies and probes as io bound
+    assert sched.get_kind('ffmpeg -ss 1 -i a.mp4 -t 2 -c copy b.mp4') == 'io'
+    assert sched.get_kind('ffmpeg -i a.mp4 -i b.mp3 -vcodec copy -acodec '
+                          'copy -map 0:v:0 -map 1:a:0 c.mp4') == 'io'
+    assert sched.get_kind('ffprobe -i a.mp4 -show_format') == 'io'
+    # it should treat filters and encodes as cpu bound
+    assert sched.get_kind('ffmpeg -i a.mp4 -i b.mp3 -vcodec copy -af '
+                          '"afade=t=out:st=95:d=5" c.mp4') == 'cpu'
+    assert sched.get_kind('ffmpeg -i a.mp4 -c:v libx264 -c:a copy '
+                          'b.mp4') == 'cpu'
+    assert sched.get_kind('ffmpeg -i a.mp4 b.mp4') == 'cpu'
+
+
+def test_set_threads():
+    assert sched.set_threads('ffmpeg -i a.mp4 -c:v libx264 b.mp4', 2) == \
+           'ffmpeg -i a.mp4 -c:v libx264 -threads 2 b.mp4'
+    assert sched.set_threads("ffmpeg -i a.mp4 'b c.mp4'", 2) == \
+           "ffmpeg -i a.mp4 -threads 2 'b c.mp4'"
+
+
+def test_admit():
+    sched.set_budget(sched.CoreBudget(cores=4, io_slots=1))
+    # it should set thread counts of cpu bound commands only
+    with sched.admit(['ffmpeg -i a.mp4 -c:v libx264 b.mp4',
+                      'ffmpeg -i a.mp4 -c copy b.mp4']) as cmds:
+        assert cmds == ['ffmpeg -i a.mp4 -c:v libx264 -threads 2 b.mp4',
+                        'ffmpeg -i a.mp4 -c copy b.mp4']
+    # it should split cores between cpu bound stages of a pipeline
+    with sched.admit(['ffmpeg -i a.mp4 -c:v libx264 pipe:1'] * 4) as cmds:
+        assert all('-threads 1 ' in cmd for cmd in cmds)
+
+
+def test_admit_budget():
+    sched.set_budget(sched.CoreBudget(cores=4, io_slots=1))
+    running = []
+    peaks = {'cpu': 0, 'io': 0}
+    lock = threading.Lock()
+
+    def run(cmd, kind):
+        with sched.admit([cmd]):
+            with lock:
+                running.append(kind)
+                peaks[kind] = max(peaks[kind], running.count(kind))
+            time.sleep(0.05)
+            with lock:
+                running.remove(kind)
+
+    cmds = [('ffmpeg -i a.mp4 -c:v libx264 b.mp4', 'cpu')] * 4 \
+        + [('ffmpeg -i a.mp4 -c copy b.mp4', 'io')] * 3
+    threads = [threading.Thread(target=run, args=(cmd, kind))
+               for cmd, kind in cmds]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # it should only admit jobs the budget has room for
+    assert peaks == {'cpu': 2, 'io': 1}
+
+
+def test_admit_async():
+    sched.set_budget(sched.CoreBudget(cores=4, io_slots=1))
+    peaks = {'running': 0}
+    running = []
+
+    async def run(cmd):
+        async with sched.admit_async([cmd]) as (admitted,):
+            running.append(admitted)
+            peaks['running'] = max(peaks['running'], len(running))
+            await asyncio.sleep(0.05)
+            running.remove(admitted)
+        return admitted
+
+    async def run_all():
+        return await asyncio.gather(*[run('ffmpeg -i a.mp4 -c copy b.mp4')
+                                      for _ in range(3)])
+
+    # it should share the budget of sync commands
+    assert asyncio.run(run_all()) == ['ffmpeg -i a.mp4 -c copy b.mp4'] * 3
+    assert peaks['running'] == 1
+
+    async def cancel():
+        sched.get_budget().acquire('io', 1)
+        task = asyncio.ensure_future(run('ffmpeg -i a.mp4 -c copy b.mp4'))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        sched.get_budget().release('io', 1)
+        await asyncio.sleep(0.05)
+
+    # it should give back slots acquired after a cancel
+    asyncio.run(cancel())
+    assert sched.get_budget()._io.acquire(timeout=1)
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+
+import os
+import shlex
+
+import numpy as np
+import pytest
+
+import editor.index as idx
+import editor.scheduler as sched
+import editor.segments as seg
+
+INFO = {'duration': 60.0, 'frame_rate': 30.0, 'streams': [
+    {'index': 0, 'codec_type': 'video', 'codec_name': 'h264',
+     'width': 1280, 'height': 720, 'bit_rate': '1000'},
+    {'index': 1, 'codec_type': 'audio', 'codec_name': 'aac',
+     'sample_rate': '44100', 'bit_rate': '128'}]}
+
+
+def get_index(keyframes: list, duration: float) -> idx.PacketIndex:
+    pts = np.array(keyframes, dtype=np.float64)
+    n = len(pts)
+    return idx.PacketIndex(pts, np.ones(n, dtype=bool), np.zeros(n),
+                           np.zeros(n), duration)
+
+
+def test_get_chunks():
+    keyframes = [0, 8, 16, 24, 32, 40]
+    # it should split at the keyframes closest to even splits
+    assert seg.get_chunks(keyframes, 0, 48, 3) == [(0, 16), (16, 32),
+                                                   (32, 48)]
+    assert seg.get_chunks(keyframes, 5, 30, 2) == [(5, 16), (16, 30)]
+    # it should not produce empty chunks when keyframes are sparse
+    assert seg.get_chunks([0, 20], 0, 30, 4) == [(0, 20), (20, 30)]
+    assert seg.get_chunks([0], 0, 30, 4) == [(0, 30)]
+
+
+def test_get_chunk_count():
+    sched.set_budget(sched.CoreBudget(8))
+    assert seg.get_chunk_count(600) == 2
+    # it should not cut short inputs into tiny chunks
+    assert seg.get_chunk_count(15) == 1
+    sched.set_budget(sched.CoreBudget(16))
+    assert seg.get_chunk_count(600) == 4
+
+
+def test_concat_cmd():
+    assert seg.concat_cmd('a b.mp4', 'list.txt', 'out.mp4', 1, 3,
+                          '-c:a aac') == \
+           'ffmpeg -f concat -safe 0 -i list.txt -ss 1.000000 ' \
+           "-t 2.000000 -i 'a b.mp4' -map 0:v:0 -map \"1:a:0?\" -c:v copy " \
+           '-c:a aac out.mp4'
+
+
+def test_encode(tmp_path, mocker):
+    f_in = str(tmp_path / 'in.mp4')
+    f_out = str(tmp_path / 'out.mp4')
+    open(f_in, 'w').close()
+    mocker.patch("editor.index.get_index",
+                 return_value=get_index([0, 10, 20, 30], 40))
+    cmds = []
+
+    def run_command(cmd):
+        cmds.append(cmd)
+        if 'concat' in cmd:
+            assert len(open(seg.get_chunks_list_path(f_out))
+                       .read().splitlines()) == 2
+        open(shlex.split(cmd)[-1], 'w').close()
+        return ''
+
+    mocker.patch("editor.ffmpeg.run_command", side_effect=run_command)
+    assert seg.encode(f_in, f_out, '-c:v libx264', n_chunks=2) == f_out
+    # it should encode video chunks and mux them with the audio once
+    assert sorted(cmds[:2]) == [
+        seg.chunk_cmd(f_in, seg.get_chunk_path(f_out, 0), 0, 20,
+                      '-c:v libx264'),
+        seg.chunk_cmd(f_in, seg.get_chunk_path(f_out, 1), 20, 40,
+                      '-c:v libx264')]
+    assert cmds[2] == seg.concat_cmd(f_in, seg.get_chunks_list_path(f_out),
+                                     seg.get_part_path(f_out), 0, 40,
+                                     '-c:a aac')
+    # it should only leave the output behind
+    assert sorted(os.listdir(tmp_path)) == ['in.mp4', 'out.mp4']
+    # it should encode short inputs in one go
+    cmds.clear()
+    seg.encode(f_in, f_out, '-c:v libx264', sec_start=5, sec_end=8)
+    assert cmds == [seg.encode_cmd(f_in, seg.get_part_path(f_out), 5, 8,
+                                   '-c:v libx264', '-c:a aac')]
+    # it should clean up after a failed chunk
+    mocker.patch("editor.ffmpeg.run_command", side_effect=ValueError('boom'))
+    os.remove(f_out)
+    with pytest.raises(ValueError):
+        seg.encode(f_in, f_out, '-c:v libx264', n_chunks=2)
+    assert os.listdir(tmp_path) == ['in.mp4']
+
+
+def test_check_encode(mocker):
+    other = {'duration': 60.02, 'frame_rate': 30.0, 'streams': [
+        dict(INFO['streams'][0], bit_rate='900'),
+        dict(INFO['streams'][1], sample_rate='48000')]}
+    mocker.patch("editor.ffmpeg.get_media_info",
+                 side_effect=lambda f_path: {'a.mp4': INFO,
+                                             'b.mp4': other}[f_path])
+    # it should ignore bit rates and one frame of duration
+    assert seg.check_encode('a.mp4', 'a.mp4') == []
+    assert seg.check_encode('b.mp4', 'a.mp4') == \
+           ['stream 1 sample_rate 48000 != 44100']
+    other['duration'] = 61
+    assert seg.check_encode('b.mp4', 'a.mp4')[0] == 'duration 61 != 60.0'
+
+
+def test_verify_encode(tmp_path, mocker):
+    f_out = str(tmp_path / 'out.mp4')
+    mocker.patch("editor.index.get_index", return_value=get_index([0], 40))
+    run_command = mocker.patch("editor.ffmpeg.run_command", return_value='')
+    check_encode = mocker.patch("editor.segments.check_encode",
+                                return_value=[])
+    assert seg.verify_encode('in.mp4', f_out, '-c:v libx264') == []
+    f_serial = str(tmp_path / 'out_serial.mp4')
+    run_command.assert_called_once_with(seg.encode_cmd(
+        'in.mp4', f_serial, 0, 40, '-c:v libx264', '-c:a aac'))
+    check_encode.assert_called_once_with(f_out, f_serial)
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+
+import os
+
+import numpy as np
+import pytest
+
+import editor.index as idx
+import editor.smartcut as sc
+
+INFO = {'streams': [{'codec_type': 'video', 'codec_name': 'h264',
+                     'profile': 'High', 'pix_fmt': 'yuv420p',
+                     'time_base': '1/15360', 'level': 41, 'refs': 4},
+                    {'codec_type': 'audio', 'codec_name': 'aac'}]}
+
+
+def test_get_cut_plan():
+    keyframes = [0, 2, 4, 6, 8]
+    # it should encode partial GOPs and copy the middle
+    assert sc.get_cut_plan(keyframes, 1, 7) == [(1, 2, False), (2, 6, True),
+                                                (6, 7, False)]
+    # it should not encode edges that are keyframes already
+    assert sc.get_cut_plan(keyframes, 2, 6) == [(2, 6, True)]
+    # it should encode whole clip if it doesn't span two keyframes
+    assert sc.get_cut_plan(keyframes, 2.5, 3.5) == [(2.5, 3.5, False)]
+    assert sc.get_cut_plan(keyframes, 1, 3) == [(1, 3, False)]
+
+
+def test_get_encode_args():
+    assert sc.get_encode_args(INFO) == \
+           '-c:v libx264 -pix_fmt yuv420p -profile:v high ' \
+           '-video_track_timescale 15360 -level:v 4.1 -refs 4 ' \
+           '-x264-params repeat-headers=1'
+    # it should pass level and references to x265 as parameters
+    assert sc.get_encode_args({'streams': [{
+        'codec_type': 'video', 'codec_name': 'hevc', 'level': 120,
+        'refs': 1}]}) == \
+        '-c:v libx265 -x265-params level-idc=4:ref=1:repeat-headers=1'
+    # it should raise error for codecs without matching encoder
+    with pytest.raises(ValueError) as context_info:
+        sc.get_encode_args({'streams': [{'codec_type': 'video',
+                                         'codec_name': 'prores'}]})
+    assert "Smart cut is not supported for codec 'prores'" in \
+           str(context_info.value)
+
+
+def test_smart_trim_cmds(mocker):
+    mocker.patch("editor.ffmpeg.check_existing_file", return_value=True)
+    mocker.patch("editor.ffmpeg.delete_existing_file", return_value=False)
+    mocker.patch("editor.ffmpeg.check_time_stamps", return_value=True)
+    index = idx.PacketIndex(np.array([0., 2, 4, 6]), np.ones(4, dtype=bool),
+                            np.zeros(4), np.zeros(4), 8)
+    mocker.patch("editor.index.get_index", return_value=index)
+    mocker.patch("editor.ffmpeg.get_media_info", return_value=INFO)
+    cmds = sc.smart_trim_cmds('in.mp4', 'out.mp4', '00:00:01', '00:00:05')
+    # it should cut edges, copy middle and concat parts
+    assert len(cmds) == 4
+    assert cmds[0].startswith('ffmpeg -ss 1.000000 -i in.mp4 -t 1.000000 '
+                              '-c:v libx264')
+    assert cmds[0].endswith('out_part00.mp4')
+    assert '-c copy' in cmds[1] and cmds[1].endswith('out_part01.mp4')
+    assert cmds[3] == 'ffmpeg -f concat -safe 0 -i out_parts.txt -c copy ' \
+                      'out.mp4'
+    # it should write single cut straight to output
+    cmds = sc.smart_trim_cmds('in.mp4', 'out.mp4', '00:00:02', '00:00:04')
+    assert len(cmds) == 1 and '-c copy' in cmds[0]
+    assert cmds[0].endswith(' out.mp4')
+
+
+def test_cut_cmd():
+    # it should never start a copy before the keyframe
+    assert sc.cut_cmd('in.mp4', 'out.mp4', 1 / 3, 2, True, '') == \
+           'ffmpeg -ss 0.333334 -i in.mp4 -t 1.666666 -c copy ' \
+           '-avoid_negative_ts make_zero out.mp4'
+    assert sc.cut_cmd('in.mp4', 'out.mp4', 0.1 * 3, 2, True, '').startswith(
+        'ffmpeg -ss 0.300000 ')
+    # it should start encoded edges where asked
+    assert sc.cut_cmd('in.mp4', 'out.mp4', 1 / 3, 2, False,
+                      '-c:v libx264').startswith('ffmpeg -ss 0.333333 ')
+
+
+def test_run_smart_trim(tmp_path, mocker):
+    f_out = str(tmp_path / 'out.mp4')
+    lists = []
+
+    def run_command(cmd):
+        if 'concat' in cmd:
+            with open(sc.get_parts_list_path(f_out)) as f:
+                lists.append(f.read().splitlines())
+        else:
+            open(cmd.split(' ')[-1], 'w').close()
+        return ''
+
+    mocker.patch("editor.ffmpeg.run_command", side_effect=run_command)
+    cmds = [f'a {sc.get_part_path(f_out, 0)}',
+            f'b {sc.get_part_path(f_out, 1)}', 'concat']
+    assert sc.run_smart_trim(cmds, f_out)
+    # it should concat parts in order
+    assert lists[0] == [f"file '{sc.get_part_path(f_out, 0)}'",
+                        f"file '{sc.get_part_path(f_out, 1)}'"]
+    # it should clean up parts and list
+    assert os.listdir(tmp_path) == []
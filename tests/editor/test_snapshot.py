@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+
+import os
+
+import pandas as pd
+
+import editor.snapshot as snap
+
+
+def test_read_table(tmp_path, mocker):
+    f_path = tmp_path / 'clips.csv'
+    f_path.write_text('Id,FileName\n1,a.mp4\n2,b.mp4\n')
+    parse_source = mocker.spy(snap, 'parse_source')
+    df = snap.read_table(f_path, dtype={'FileName': 'category'})
+    # it should keep explicit dtypes
+    assert df['FileName'].dtype == 'category'
+    assert df['Id'].tolist() == [1, 2]
+    # it should hand out copies callers may modify
+    df.loc[0, 'Id'] = 5
+    df = snap.read_table(f_path, dtype={'FileName': 'category'})
+    assert df['Id'].tolist() == [1, 2]
+    # it should read snapshot instead of source in a new process
+    snap.clear_snapshots()
+    df = snap.read_table(f_path, dtype={'FileName': 'category'})
+    assert df['FileName'].dtype == 'category'
+    assert parse_source.call_count == 1
+    # it should keep snapshot when source is touched but unchanged
+    snap.clear_snapshots()
+    os.utime(f_path, ns=(0, 0))
+    snap.read_table(f_path, dtype={'FileName': 'category'})
+    assert parse_source.call_count == 1
+    # it should parse source again when it changes
+    f_path.write_text('Id,FileName\n1,a.mp4\n')
+    assert len(snap.read_table(f_path, dtype={'FileName': 'category'})) == 1
+    assert parse_source.call_count == 2
+
+
+def test_read_table_dtype(tmp_path):
+    f_path = tmp_path / 'videos.csv'
+    f_path.write_text('Id,Name\n1,10\n')
+    # it should keep separate snapshots per dtype
+    assert snap.read_table(f_path)['Name'].dtype == 'int64'
+    assert snap.read_table(f_path, dtype={'Name': str})['Name'].tolist() \
+           == ['10']
+
+
+def test_get_format(mocker):
+    mocker.patch("importlib.util.find_spec", return_value=None)
+    assert snap.get_format() == 'pickle'
+    assert snap.get_snapshot_path('a.csv', 'null').endswith('.pickle')
+
+
+def test_write_snapshot(tmp_path, mocker):
+    f_path = tmp_path / 'clips.csv'
+    f_path.write_text('Id,Note\n1,a\n2,3\n')
+    mocker.patch("editor.snapshot.get_format", return_value='feather')
+
+    def to_feather(df, f_out):
+        open(f_out, 'w').close()
+        raise ValueError('mixed types')
+
+    mocker.patch.object(pd.DataFrame, 'to_feather', to_feather)
+    parse_source = mocker.spy(snap, 'parse_source')
+    # it should pickle tables feather can't store
+    assert snap.read_table(f_path)['Note'].tolist() == ['a', '3']
+    snap.clear_snapshots()
+    assert snap.read_table(f_path)['Note'].tolist() == ['a', '3']
+    assert parse_source.call_count == 1
+    # it should not leave temp files behind
+    folder = os.path.dirname(snap.get_snapshot_path(f_path, 'null'))
+    assert sorted(os.listdir(folder)) == \
+           [os.path.basename(snap.get_snapshot_path(f_path, 'null')) + ext
+            for ext in ['', '.json']]
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import editor.validate as v
+
+
+def test_parse_time_stamps():
+    sr = pd.Series(['00:02:13', '4:5', '00:99:99', None])
+    seconds = v.parse_time_stamps(sr)
+    assert seconds[0] == 133
+    # it should return NaN for incorrect formats
+    assert seconds[1:].isna().all()
+
+
+def test_get_source_lengths(tmp_path, mocker):
+    (tmp_path / 'raw').mkdir()
+    (tmp_path / 'raw' / 'a.mp4').write_bytes(b'video')
+    mocker.patch("editor.clips.get_input_folder", return_value=tmp_path)
+    get_video_length = mocker.patch("editor.ffmpeg.get_video_length",
+                                    return_value=60)
+    lengths = v.get_source_lengths(pd.Series(['a.mp4', 'b.mp4', 'a.mp4']))
+    # it should probe every existing source once
+    assert get_video_length.call_count == 1
+    assert lengths[0] == 60 and lengths[2] == 60
+    # it should return NaN for missing sources
+    assert np.isnan(lengths[1])
+
+
+def test_get_overlaps():
+    df = pd.DataFrame(data={'VideoId': [1, 1, 1, 2],
+                            'FileName': ['a', 'a', 'b', 'a']})
+    start = pd.Series([0, 5, 2, 3])
+    end = pd.Series([10, 8, 4, 6])
+    # it should flag clips starting before an earlier clip ends
+    assert list(v.get_overlaps(df, start, end)) == [False, True, False, False]
+
+
+def test_validate_clips(mocker):
+    mocker.patch("editor.validate.get_source_lengths",
+                 return_value=pd.Series([60, 60, np.nan, 60, 60]))
+    df = pd.DataFrame(data={
+        'Id': [1, 2, 3, 4, 5],
+        'VideoId': [1, 1, 1, 2, 2],
+        'FileName': ['a.mp4', 'a.mp4', 'b.mp4', 'c.avi', 'a.mp4'],
+        'TimeStart': ['00:00:00', '00:00:20', '00:00:00', '0:1', '00:00:00'],
+        'TimeEnd': ['00:00:10', '00:00:15', '00:00:05', '00:00:05',
+                    '00:02:00'],
+    })
+    df_problems = v.validate_clips(df)
+    # it should report every problem at once
+    problems = df_problems.groupby('Id')['Problem'].apply(list).to_dict()
+    assert problems == {
+        2: ["Ending time is before start time"],
+        3: ["Input file does not exist"],
+        4: ["Incorrect time format in TimeStart (valid time format: "
+            "HH:MM:SS)", "Unknown extension (valid extensions: [mp4])"],
+        5: ["Ending time is longer then video length"],
+    }
+    # it should return empty table if clips are valid
+    assert v.validate_clips(df.iloc[[0]], check_sources=False).empty
+    # it should raise error if columns are missing
+    with pytest.raises(ValueError) as context_info:
+        v.validate_clips(pd.DataFrame(columns=['Id']))
+    assert "Column 'VideoId' not found" in str(context_info.value)
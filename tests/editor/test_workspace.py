@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+
+import os
+import shutil
+import threading
+import time
+
+import pytest
+
+import editor.build as b
+import editor.clips as c
+import editor.workspace as ws
+
+
+def write_file(f_path: str, n_bytes: int, age=0, built=True) -> str:
+    with open(f_path, 'wb') as f:
+        f.write(b'0' * n_bytes)
+    if built:
+        b.record_build(f_path, 'key', 'rebuilt', 'test')
+    t_used = time.time() - age
+    os.utime(f_path, (t_used, t_used))
+    return f_path
+
+
+def test_parse_size():
+    assert ws.parse_size('512') == 512
+    assert ws.parse_size('1.5K') == 1536
+    assert ws.parse_size('4gb') == 4 << 30
+    with pytest.raises(ValueError) as context_info:
+        ws.parse_size('4 apples')
+    assert "Invalid size: '4 apples'" in str(context_info.value)
+
+
+def test_get_job_bytes(tmp_path, mocker):
+    f_in = write_file(str(tmp_path / 'a.mp4'), 1000)
+    mocker.patch("editor.ffmpeg.get_video_length", return_value=100)
+    # it should scale source bytes by clip length and keep stage copies
+    assert ws.get_job_bytes([(f_in, '00:00:00', '00:00:10'),
+                             (f_in, '00:00:20', '00:01:00'),
+                             ('missing.mp4', '00:00:00', '00:00:10')]) == \
+           (100 + 400) * ws.JOB_COPIES
+
+
+def test_workspace(tmp_path):
+    # it should work in a folder of its own inside the scratch folder
+    root = ws.get_root()
+    assert root == os.path.join(os.environ[ws.SCRATCH_FOLDER_ENV],
+                                ws.OWN_FOLDER)
+    with ws.workspace([1, 2], 100) as folder:
+        # it should give the videos of the job their own folder
+        assert os.path.dirname(folder) == os.path.join(root, ws.JOBS_FOLDER)
+        assert ws.get_folder(1) == ws.get_folder(2) == folder
+        assert c.get_output_file_path('a.mp4', 'merged', video_id=1) == \
+               os.path.join(folder, 'a_merged.mp4')
+        assert c.get_input_files_path('data/final/a.mp4', 1) == \
+               os.path.join(folder, 'a.txt')
+    assert ws.get_folder(1) is None
+    # it should remove the folder when the job fails
+    with pytest.raises(ValueError):
+        with ws.workspace([1]) as folder:
+            write_file(os.path.join(folder, 'a.mp4'), 10)
+            raise ValueError('boom')
+    assert os.listdir(os.path.join(root, ws.JOBS_FOLDER)) == []
+    # it should use the shared folder outside of jobs
+    assert c.get_output_file_path('a.mp4', 'merged', video_id=1) == \
+           os.path.join(root, 'a_merged.mp4')
+
+
+def test_get_jobs(tmp_path, mocker):
+    mocker.patch("socket.gethostname", return_value='host-a')
+    root = str(tmp_path)
+    jobs_folder = os.path.join(root, ws.JOBS_FOLDER)
+    running = os.path.join(jobs_folder, f'host-a-{os.getpid()}-a')
+    crashed = os.path.join(jobs_folder, 'host-a-999999999-b')
+    remote = os.path.join(jobs_folder, 'host-b-999999999-c')
+    expired = os.path.join(jobs_folder, 'host-b-999999999-d')
+    for folder in [running, crashed, remote, expired]:
+        os.makedirs(folder)
+        write_file(os.path.join(folder, ws.RESERVED_FILE), 0, built=False)
+    write_file(os.path.join(crashed, 'a.mp4'), 10)
+    write_file(os.path.join(expired, ws.RESERVED_FILE), 0,
+               age=ws.JOB_LEASE + 1, built=False)
+    # it should remove folders of dead processes of this host only, and
+    # of other hosts once their lease expires
+    jobs = ws.get_jobs(root)
+    assert sorted(jobs) == [running, remote]
+    assert not os.path.exists(crashed) and not os.path.exists(expired)
+    assert ws.get_job_name().startswith(f'host-a-{os.getpid()}-')
+
+
+def test_admit(tmp_path, monkeypatch):
+    root = str(tmp_path)
+    monkeypatch.setenv(ws.SCRATCH_BYTES_ENV, '1000')
+    monkeypatch.setattr(ws, 'POLL_SECONDS', 0.01)
+    old = write_file(os.path.join(root, 'old.mp4'), 300, age=3600)
+    older = write_file(os.path.join(root, 'older.mp4'), 300, age=7200)
+    recent = write_file(os.path.join(root, 'recent.mp4'), 300)
+    # it should evict least recently used shared files to make room
+    with ws.workspace([1], 300, root):
+        assert not os.path.exists(older)
+        assert os.path.exists(old) and os.path.exists(recent)
+        # it should wait until running jobs leave enough room
+        admitted = []
+        thread = threading.Thread(target=lambda: admitted.append(
+            ws.admit(root, 500)))
+        thread.start()
+        time.sleep(0.1)
+        assert admitted == [] and not os.path.exists(old)
+    thread.join(timeout=5)
+    assert len(admitted) == 1
+    shutil.rmtree(admitted[0])
+    # it should admit a job larger than the budget when it runs alone
+    with ws.workspace([1], 5000, root) as folder:
+        assert os.path.isdir(folder) and os.path.exists(recent)
+
+
+def test_get_shared_files(tmp_path):
+    root = str(tmp_path)
+    built = write_file(os.path.join(root, 'a_merged.mp4'), 10, age=3600)
+    other = write_file(os.path.join(root, 'sem.mp-other'), 10, age=3600,
+                       built=False)
+    # it should only count and evict outputs of our own builds
+    assert [f_path for _, _, f_path in ws.get_shared_files(root)] == [built]
+    assert ws.evict(root, 20, 0) == 10
+    assert not os.path.exists(built) and os.path.exists(other)
+
+
+def test_pinned(tmp_path, monkeypatch):
+    root = str(tmp_path)
+    monkeypatch.setenv(ws.SCRATCH_BYTES_ENV, '500')
+    monkeypatch.setattr(ws, 'POLL_SECONDS', 0.01)
+    trim = write_file(os.path.join(root, 'trim.mp4'), 300, age=3600)
+    with ws.pinned(root):
+        # it should keep shared files while an incremental build runs
+        ws.trim_shared(root)
+        admitted = []
+        thread = threading.Thread(target=lambda: admitted.append(
+            ws.admit(root, 300)))
+        thread.start()
+        time.sleep(0.1)
+        assert admitted == [] and os.path.exists(trim)
+    # it should evict once the build is done
+    thread.join(timeout=5)
+    assert len(admitted) == 1 and not os.path.exists(trim)
+    shutil.rmtree(admitted[0])
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+
+import json
+import os
+import subprocess as s
+import sys
+import time
+
+import pytest
+
+import app
+import editor.clips as c
+
+PACKAGE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ['pandas', 'numpy', 'moviepy', 'asyncio']
+# import time the CLI may add on top of a bare interpreter start
+STARTUP_BUDGET = 0.25
+
+
+def run_python(code: str, cwd=PACKAGE) -> str:
+    process = s.run([sys.executable, '-c', code], cwd=cwd, stdout=s.PIPE,
+                    stderr=s.PIPE, env=dict(os.environ, PYTHONPATH=PACKAGE))
+    assert process.returncode == 0, process.stderr.decode('utf-8')
+    return process.stdout.decode('utf-8')
+
+
+def get_start_time(code: str, runs=5) -> float:
+    times = []
+    for _ in range(runs):
+        t_start = time.perf_counter()
+        run_python(code)
+        times.append(time.perf_counter() - t_start)
+    return min(times)
+
+
+def test_parse_args():
+    # it should render when called without subcommand
+    parsed = app.parse_args(['1', '3-5', '--mode', 'fused'])
+    assert parsed.command == 'render'
+    assert parsed.videos == ['1', '3-5'] and parsed.mode == 'fused'
+    assert app.parse_args(['--all']).all
+    parsed = app.parse_args(['1', '--graph', '--dry-run'])
+    assert parsed.graph and parsed.dry_run
+    # it should reject options the graph does not apply
+    for args in [['--mode', 'preview'], ['--trim-workers', '2']]:
+        with pytest.raises(SystemExit):
+            app.parse_args(['1', '--graph'] + args)
+    parsed = app.parse_args(['1', '--scratch', '/dev/shm/editor',
+                             '--scratch-bytes', '8G'])
+    assert (parsed.scratch, parsed.scratch_bytes) == ('/dev/shm/editor', '8G')
+    parsed = app.parse_args(['trim', 'in.mp4', 'out.mp4', '00:00:01',
+                             '00:00:02'])
+    assert (parsed.command, parsed.f_in) == ('trim', 'in.mp4')
+    parsed = app.parse_args(['proxy', '1-3', '-j', '2'])
+    assert (parsed.command, parsed.videos, parsed.workers) == \
+           ('proxy', ['1-3'], 2)
+    # it should offer the render modes of the editor
+    assert app.RENDER_MODES == c.RENDER_MODES
+
+
+def test_main(mocker, capsys):
+    mocker.patch("editor.ffmpeg.get_media_info",
+                 return_value={'duration': 1.0})
+    assert app.main(['probe', 'a.mp4']) == 0
+    assert json.loads(capsys.readouterr().out) == {'duration': 1.0,
+                                                   'file': 'a.mp4'}
+    mocker.patch("editor.ffmpeg.trim_video_cmd", return_value='cmd')
+    run_command = mocker.patch("editor.ffmpeg.run_command", return_value='')
+    assert app.main(['trim', 'in.mp4', 'out.mp4', '00:00:01',
+                     '00:00:02']) == 0
+    run_command.assert_called_once_with('cmd')
+
+
+def test_lazy_imports():
+    # it should not load heavy modules before a subcommand needs them
+    code = 'import sys, app, editor.ffmpeg; ' \
+           'app.parse_args(["probe", "a.mp4"]); ' \
+           f'print([m for m in {HEAVY_MODULES} if m in sys.modules])'
+    assert run_python(code).strip() == '[]'
+
+
+def test_functions_import(tmp_path):
+    # it should not change directory or open clips on import
+    code = 'import os, sys, functions; print(os.getcwd()); ' \
+           'print("moviepy" in sys.modules)'
+    assert run_python(code, cwd=tmp_path).split() == \
+           [str(tmp_path), 'False']
+
+
+def test_startup_time():
+    baseline = get_start_time('pass')
+    startup = get_start_time('import app; app.parse_args(["probe", "a"])')
+    assert startup - baseline < STARTUP_BUDGET
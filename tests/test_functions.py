@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+
+import os
+import shlex
+
+import pandas as pd
+import pytest
+
+import functions as f
+
+
+def test_get_sec():
+    # it should count frames at 30 fps
+    assert f.get_sec('01:02:15') == 62.5
+    assert f.get_sec('01:00:01:15') == 3601.5
+
+
+def test_trim_video_clip(mocker):
+    videos = pd.DataFrame(data={'Id': [1], 'Start': ['00:01:00\n00:05:15'],
+                                'End': ['00:02:00\n00:09:00']})
+    mocker.patch("functions.get_videos", return_value=videos)
+    mocker.patch("functions.get_video_path", return_value='in/1 - a.mp4')
+    encode = mocker.patch("editor.segments.encode")
+    f.trim_video_clip(1, 1, 'clips/a.mp4')
+    # it should encode the clip range with the encoder settings
+    encode.assert_called_once_with('in/1 - a.mp4', f.get_path('clips/a.mp4'),
+                                   '-c:v libx264', '-c:a aac', 5.5, 9)
+
+
+def test_add_intro_outro_args():
+    assert f.add_intro_outro_args(['i.mp4', 'c.mp4']) == \
+           '-i i.mp4 -i c.mp4 -filter_complex ' \
+           '"[0:v:0][0:a:0][1:v:0][1:a:0]concat=n=2:v=1:a=1[v][a]" ' \
+           '-map "[v]" -map "[a]" -c:v libx264 -c:a aac'
+
+
+def test_run_ffmpeg(tmp_path, mocker):
+    f_out = str(tmp_path / 'out.mp4')
+
+    def run_command(cmd):
+        open(shlex.split(cmd)[-1], 'w').close()
+        return ''
+
+    mocker.patch("editor.ffmpeg.run_command", side_effect=run_command)
+    # it should only create output once ffmpeg is done
+    assert f.run_ffmpeg('-i in.mp4', f_out) == f_out
+    assert os.listdir(tmp_path) == ['out.mp4']
+    # it should not leave partial output behind on failure
+    os.remove(f_out)
+    mocker.patch("editor.ffmpeg.run_command", side_effect=ValueError('boom'))
+    with pytest.raises(ValueError):
+        f.run_ffmpeg('-i in.mp4', f_out)
+    assert os.listdir(tmp_path) == []
+
+
+def test_get_secs():
+    time_strs = pd.Series(['01:02:15', '01:00:01:15', '12', '00:05:00'])
+    # it should match get_sec for every entry
+    assert f.get_secs(time_strs).tolist() == [f.get_sec(t) for t in
+                                              time_strs]
+
+
+def test_format_seconds():
+    assert f.format_seconds(pd.Series([14.0, 3725.0])).tolist() == \
+           ['0:00:14', '1:02:05']
+
+
+def test_get_clip_data():
+    videos = pd.DataFrame({
+        'Id': [1, 2], 'Name': ['First', 'Second'],
+        'Clips': ['a\nb', 'c'], 'Start': ['00:00:00\n01:00:00', '00:00:00'],
+        'End': ['00:50:00\n02:00:00', '00:10:00'],
+        'Links': ['00:10 - 2\n01:30 - 2\n00:00 - 2\nnone', '00:05 - 0'],
+        'ExerciseLink': ['e1\ne2', 'e3'], 'ShortLink': ['s1\ns2', 's3'],
+        'YoutubeLink': ['y1', 'y2'], 'Tags': ['t1', 't2']})
+    df = f.get_clip_data(videos)
+    assert df.columns.tolist() == f.CLIP_DATA_COLUMNS
+    assert df['Id'].tolist() == [0, 1, 2]
+    assert df['ClipName'].tolist() == ['a', 'b', 'c']
+    assert df['ShortLink'].tolist() == ['s1', 's2', 's3']
+    assert df['ClipPath'].tolist() == ['output/raw/video01_clip00.mp4',
+                                       'output/raw/video01_clip01.mp4',
+                                       'output/raw/video02_clip00.mp4']
+    # it should link cards inside clip intervals after the intro, skipping
+    # links at clip start and to video 0
+    assert df['CardLinks'].tolist() == ['0:00:14 - 2. Second',
+                                        '0:00:34 - 2. Second', '']
+    # it should only look up videos of links inside clips
+    videos.loc[0, 'Links'] = '00:10 - 2\n03:00 - 9\n00:00 - 9'
+    assert f.get_clip_data(videos)['CardLinks'].tolist()[0] == \
+           '0:00:14 - 2. Second'
+    videos.loc[0, 'Links'] = '00:10 - 9'
+    with pytest.raises(ValueError) as context_info:
+        f.get_clip_data(videos)
+    assert 'Video ID 9 not found!' in str(context_info.value)